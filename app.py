@@ -1,48 +1,276 @@
+import hmac
+import io
+import logging
 import os
-import random
+import re
+import time
 from datetime import datetime
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from supabase import create_client, Client
-from functools import wraps
-
-# Load environment variables from .env file
-load_dotenv()
-
-app = Flask(__name__)
-# Use a strong secret key in production
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", os.urandom(24))
-
-# Initialize Supabase client
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-
-# Ensure URL and Key are set
-supabase = None # Initialize supabase to None
-if not url or not key:
-    print("SUPABASE_URL or SUPABASE_KEY are not set in the .env file. Supabase features will be unavailable.")
-    # In a real app, you might want to stop or show a maintenance page
-    # raise ValueError("Supabase URL or Key not set")
-else:
-    try:
-        supabase: Client = create_client(url, key)
-        # Optional: Add a small test query here if needed to verify credentials/connection
-        # response = supabase.table('bible_books').select('id').limit(1).execute()
-        # if response.error:
-        #     print(f"Supabase connection test failed: {response.error}")
-        #     supabase = None # Set to None if connection fails
-        # else:
-        #     print("Supabase connection successful.")
+from flask import Flask, current_app, g, render_template, stream_template, request, redirect, url_for, session, jsonify, flash, make_response
+from functools import lru_cache, wraps
+from question_pool import PUBLIC_FIELDS, QuestionPoolCache
+from profile_cache import ProfileCache
+from question_snapshot import SnapshotStore
+from attempt_token import AttemptLedger, AttemptTokens, InvalidAttemptToken
+from auth_tokens import ExpiredToken, InvalidToken, SigningKeys, TokenVerifier
+from score_queue import ScoreQueue
+from leaderboard_cache import LeaderboardCache
+from rank_index import RankIndex
+import user_stats
+import member_import
+from query_pool import QueryPool
+from clients import SupabaseClients
+from storage import create_storage
+from session_store import MemorySessionStore, ServerSessionInterface, create_session_store
+import metrics
+import structured_logging
+
+log = logging.getLogger(__name__)
+
+# Views are collected here and registered on each app by create_app(), so
+# importing this module has no side effects.
+_routes = []
+
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+# Shared services, set up once per process by init_services()
+supabase = None
+admin_clients = None
+token_verifier = None
+storage = None
+attempt_tokens = None
+attempt_ledger = None
+leaderboards = None
+rank_index = None
+query_pool = None
+question_pool = None
+profiles = None
+question_snapshot = None
+score_queue = None
+session_interface = None
+
+# Page sizes for /my-scores
+MY_SCORES_PAGE_SIZE = 50
+MY_SCORES_MAX_PAGE_SIZE = 500
+# achieved_at values as the databases return them: PostgREST trims trailing zeros
+# from the fraction, so it may have 1 to 6 digits
+ISO_TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?(Z|[+-]\d{2}(:?\d{2})?)?', re.ASCII)
+
+# Number of questions served per quiz attempt
+MAX_QUESTIONS = 20
+
+# Access tokens with less than this many seconds left are refreshed, so a quiz in
+# progress doesn't run into an expired token
+TOKEN_REFRESH_MARGIN = 60
+
+# Used when FLASK_SECRET_KEY is unset; shared by every app in this process so
+# sessions and attempt tokens agree. run_waitress.py sets FLASK_SECRET_KEY before
+# forking its workers, so they never fall back to different keys.
+_fallback_secret_key = os.urandom(24)
+
+
+def init_services(secret_key):
+    global supabase, admin_clients, token_verifier, storage, attempt_tokens, leaderboards, rank_index
+    global query_pool, question_pool, profiles, question_snapshot, score_queue, session_interface, attempt_ledger
+    global MY_SCORES_PAGE_SIZE
+    if attempt_tokens is not None:
+        return
+
+    # Supabase clients (auth, and tables by default); created on first use, not here
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        log.warning("SUPABASE_URL or SUPABASE_KEY are not set in the .env file. Supabase features will be unavailable.")
+    else:
+        # Table reads and writes use the service role key (see clients.py)
+        service_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+        if not service_key and os.environ.get("STORAGE_BACKEND", "supabase").lower() == 'supabase':
+            log.warning("SUPABASE_SERVICE_ROLE_KEY is not set: database writes are made with SUPABASE_KEY and "
+                        "row level security will reject signups and score saves.")
+        supabase = SupabaseClients(url, key, service_key=service_key,
+                                   repository_timeout=float(os.environ.get("REPOSITORY_TIMEOUT_SECONDS", 10)))
+        # Access tokens are verified in-process (see auth_tokens.py): HS256 tokens with
+        # SUPABASE_JWT_SECRET, others with the project's published signing keys
+        token_verifier = TokenVerifier(
+            secret=os.environ.get("SUPABASE_JWT_SECRET") or None,
+            signing_keys=SigningKeys(supabase.fetch_jwks, ttl=float(os.environ.get("JWKS_TTL_SECONDS", 600))),
+            remote_check=supabase.accepts_token,
+            leeway=int(os.environ.get("JWT_LEEWAY_SECONDS", 10)),
+        )
+        # Auth admin API access for bulk member onboarding (see member_import.py)
+        if service_key:
+            admin_clients = SupabaseClients(url, service_key)
+
+    # Where the quiz tables live: Supabase, or an embedded SQLite database with
+    # STORAGE_BACKEND=sqlite (see storage.py)
+    storage = create_storage(supabase)
+
+    # Signed attempt tokens let the grading endpoints work without any database reads.
+    # All worker processes must share FLASK_SECRET_KEY (see run_waitress.py).
+    attempt_tokens = AttemptTokens(
+        secret_key,
+        max_age=int(os.environ.get("ATTEMPT_TOKEN_MAX_AGE_SECONDS", 7200)),
+    )
+
+    # Top-K leaderboard snapshots, updated in place when scores are stored
+    leaderboards = LeaderboardCache(
+        book_k=10,
+        global_k=20,
+        resync_interval=int(os.environ.get("LEADERBOARD_RESYNC_SECONDS", 30)),
+    )
+
+    # Per-book score histograms for "your rank" lookups on results and leaderboard
+    # pages, sized for the highest score a quiz can give
+    rank_index = RankIndex(
+        max_score=MAX_QUESTIONS,
+        resync_interval=int(os.environ.get("RANK_INDEX_RESYNC_SECONDS", 300)),
+    )
+
+    MY_SCORES_PAGE_SIZE = int(os.environ.get("MY_SCORES_PAGE_SIZE", MY_SCORES_PAGE_SIZE))
+
+    # Shared pool for running a request's independent Supabase reads concurrently
+    query_pool = QueryPool(
+        max_workers=int(os.environ.get("QUERY_POOL_WORKERS", 16)),
+        timeout=float(os.environ.get("QUERY_TIMEOUT_SECONDS", 5)),
+    )
+
+    # Per-book question pools for quiz(), so a quiz start doesn't refetch the whole
+    # book; checked for edits every QUESTION_POOL_TTL_SECONDS (see question_pool.py)
+    question_pool = QuestionPoolCache(ttl=int(os.environ.get("QUESTION_POOL_TTL_SECONDS", 60)))
+
+    # Profiles by email for login and signup (see profile_cache.py)
+    profiles = ProfileCache(ttl=int(os.environ.get("PROFILE_CACHE_TTL_SECONDS", 300)))
+
+    # Compiled question bank mapped from disk (see question_snapshot.py); books it
+    # covers are served without the database. Optional.
+    question_snapshot = SnapshotStore(
+        os.environ.get("QUESTION_SNAPSHOT_PATH", "question_bank.snap"),
+        check_interval=float(os.environ.get("QUESTION_SNAPSHOT_CHECK_SECONDS", 5)),
+    )
+    question_snapshot.current()  # Map it now if present; no I/O beyond the header
+
+    # Optional write-behind mode: finished attempts are queued and flushed in bulk by a
+    # background thread instead of blocking the request on Supabase writes.
+    if os.environ.get("SCORE_WRITE_BEHIND", "").lower() in ("1", "true", "yes") and storage is not None:
+        score_queue = ScoreQueue(
+            save_scores_bulk,
+            maxsize=int(os.environ.get("SCORE_QUEUE_SIZE", 1000)),
+            batch_size=int(os.environ.get("SCORE_FLUSH_BATCH", 200)),
+            flush_interval=float(os.environ.get("SCORE_FLUSH_INTERVAL_SECONDS", 1.0)),
+            spill_path=os.environ.get("SCORE_SPILL_PATH", "score_spill.jsonl"),
+        ).start()
+
+    # Server-side sessions: the cookie carries only an opaque session id (see
+    # session_store.py). SESSION_BACKEND=cookie keeps Flask's signed cookie sessions.
+    store = create_session_store()
+    if store is not None:
+        session_interface = ServerSessionInterface(
+            store,
+            ttl=int(os.environ.get("SESSION_TTL_SECONDS", 7 * 86400)),
+            sweep_interval=float(os.environ.get("SESSION_SWEEP_INTERVAL_SECONDS", 300)),
+        ).start_sweeper()
+    # Submitted attempts and locked-in answers, in the session store so every worker
+    # sees them (see attempt_token.AttemptLedger). With cookie sessions they are
+    # only known to this process.
+    attempt_ledger = AttemptLedger(store if store is not None else MemorySessionStore())
+
+    register_service_metrics()
+
+
+# Sizes and counters the in-process caches keep themselves, read on each /metrics
+# scrape (see metrics.ServiceMetric). Every worker maps the same snapshot file, so
+# its sizes are not summed across workers; neither are cache ages.
+def register_service_metrics():
+    gauge = metrics.ServiceMetric
+
+    def counter(name, help, source, key):
+        return metrics.ServiceMetric(name, help, source, key, type='counter')
+
+    pool = question_pool.stats
+    gauge('quiz_question_pool_books', 'Books held in the question pool cache.', pool, 'books')
+    gauge('quiz_question_pool_questions', 'Questions held in the question pool cache.', pool, 'questions')
+    gauge('quiz_question_pool_bytes', 'Approximate memory used by the question pool cache.', pool, 'total_bytes')
+    counter('quiz_question_pool_hits_total', 'Question pool lookups served from the cache.', pool, 'hits')
+    counter('quiz_question_pool_misses_total', 'Question pool lookups that loaded or revalidated a book.',
+            pool, 'misses')
+    counter('quiz_question_pool_loads_total', 'Books loaded into the question pool cache.', pool, 'loads')
+
+    boards = leaderboards.stats
+    gauge('quiz_leaderboard_cache_books', 'Book leaderboards held in the leaderboard cache.', boards, 'books')
+    counter('quiz_leaderboard_cache_resyncs_total', 'Leaderboard cache resyncs.', boards, 'resyncs')
+    gauge('quiz_leaderboard_cache_global_age_seconds', 'Seconds since the global leaderboard was loaded.',
+          boards, 'global_age', merge=max)
+    gauge('quiz_leaderboard_cache_oldest_book_age_seconds', 'Seconds since the stalest book leaderboard was loaded.',
+          boards, 'oldest_book_age', merge=max)
+
+    ranks = rank_index.stats
+    gauge('quiz_rank_index_books', 'Books held in the rank index.', ranks, 'books')
+    gauge('quiz_rank_index_players', 'Best scores held in the rank index.', ranks, 'players')
+
+    snapshot = question_snapshot.stats
+    gauge('quiz_question_snapshot_books', 'Books in the mapped question snapshot.', snapshot, 'books', merge=max)
+    gauge('quiz_question_snapshot_questions', 'Questions in the mapped question snapshot.', snapshot, 'questions',
+          merge=max)
+    gauge('quiz_question_snapshot_bytes', 'Size of the mapped question snapshot.', snapshot, 'bytes', merge=max)
+    counter('quiz_question_snapshot_reloads_total', 'Question snapshot reloads.', snapshot, 'reloads')
+
+    if score_queue is not None:
+        queue = score_queue.stats
+        gauge('quiz_score_queue_queued', 'Scores waiting in the write-behind queue.', queue, 'queued')
+        counter('quiz_score_queue_accepted_total', 'Scores accepted by the write-behind queue.', queue, 'accepted')
+        counter('quiz_score_queue_rejected_total', 'Scores saved synchronously because the queue was full.',
+                queue, 'rejected')
+        counter('quiz_score_queue_flushed_total', 'Scores flushed from the write-behind queue.', queue, 'flushed')
+        counter('quiz_score_queue_flush_errors_total', 'Failed write-behind queue flushes.', queue, 'flush_errors')
+
+
+# Application factory: loads configuration from the environment (and .env), sets
+# up the shared services and registers the routes. Makes no network calls.
+def create_app():
+    load_dotenv()
+    # Log records are written by a background thread (see structured_logging.py)
+    structured_logging.setup()
+    app = Flask(__name__)
+    # Use a strong secret key in production
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY", _fallback_secret_key)
+    init_services(app.secret_key)
+    if session_interface is not None:
+        app.session_interface = session_interface
+    # Per-route latency and Supabase call metrics, served on /metrics
+    metrics.instrument(app)
+    if os.environ.get("METRICS_DIR"):
+        metrics.start_exporter(os.environ["METRICS_DIR"],
+                               interval=float(os.environ.get("METRICS_EXPORT_INTERVAL_SECONDS", 5)))
+    app.add_template_filter(format_datetime_filter, 'format_datetime')
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
+
+
+_app = None
+
+
+# `from app import app` (run_waitress.py, `flask run`) gets one app built on demand
+def __getattr__(name):
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        _app = create_app()
+    return _app
 
-    except Exception as e:
-        print(f"Failed to create Supabase client: {e}")
-        supabase = None # Set to None if client creation fails
 
 # Decorator to ensure Supabase client is available for a route
 def supabase_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if supabase is None:
+        if supabase is None or storage is None:
             flash("Aplikasi tidak dapat berhubung dengan pangkalan data (Supabase tidak tersedia). Sila cuba sebentar lagi atau hubungi pentadbir.", "error")
             # Redirect to a page that doesn't require Supabase, like home or a static error page
             return redirect(url_for('home'))
@@ -50,6 +278,31 @@ def supabase_required(f):
     return decorated_function
 
 
+# Decorator for routes that only need the quiz tables, which may be local (STORAGE_BACKEND=sqlite)
+def storage_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if storage is None:
+            flash("Aplikasi tidak dapat berhubung dengan pangkalan data. Sila cuba sebentar lagi atau hubungi pentadbir.", "error")
+            return redirect(url_for('home'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# Parsing and formatting of ISO timestamp strings is memoized: the same
+# achieved_at values are rendered on every visit to the scores pages.
+@lru_cache(maxsize=4096)
+def _format_iso_string(value, format):
+    try:
+        # Handle potential Z suffix and parse
+        dt_object = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        # Fallback for potentially non-standard formats
+        log.warning("Could not parse '%s' as ISO 8601. Returning original.", value)
+        return value # Return original value if parsing fails
+    return dt_object.strftime(format)
+
+
 # Jinja2 filter to format datetime objects
 def format_datetime_filter(value, format='%Y-%m-%d %H:%M'):
     if value is None:
@@ -57,14 +310,7 @@ def format_datetime_filter(value, format='%Y-%m-%d %H:%M'):
     try:
         # Convert string to datetime object
         if isinstance(value, str):
-            # Attempt to parse ISO 8601, including with Z and various offsets
-            try:
-                 # Handle potential Z suffix and parse
-                 dt_object = datetime.fromisoformat(value.replace('Z', '+00:00'))
-            except ValueError:
-                 # Fallback for potentially non-standard formats
-                 print(f"Could not parse '{value}' as ISO 8601. Returning original.")
-                 return value # Return original value if parsing fails
+            return _format_iso_string(value, format)
 
         elif isinstance(value, datetime):
             dt_object = value
@@ -76,18 +322,16 @@ def format_datetime_filter(value, format='%Y-%m-%d %H:%M'):
         return dt_object.strftime(format)
     except (ValueError, TypeError, AttributeError) as e:
         # Catch errors during formatting (e.g., if dt_object is invalid)
-        print(f"Error formatting datetime '{value}': {e}")
+        log.warning("Error formatting datetime '%s': %s", value, e)
         return value # Return original value if formatting fails
 
 
-app.jinja_env.filters['format_datetime'] = format_datetime_filter
-
 # Decorator to require login
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Check if 'user' is in the Flask session
-        if 'user' not in session:
+        # Check that the session holds a valid (or refreshable) access token
+        if current_user_id() is None:
             # Flash a warning message and redirect to login page
             flash("Sila log masuk untuk mengakses halaman ini.", "warning")
             # Store current URL in 'next' param for redirect after login
@@ -96,17 +340,78 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Store a GoTrue session after login or signup. The user id is not stored: it
+# comes from the verified access token (see current_user_id()).
+def start_session(auth_session, username, church_code):
+    session.clear()
+    session['access_token'] = auth_session.access_token
+    session['refresh_token'] = auth_session.refresh_token
+    session['username'] = username
+    session['church_code'] = church_code
+
+
+# The logged-in user's id from the session's access token, or None. Verified
+# tokens are memoized, so this is a dict lookup except when a token is new or due
+# for refresh.
+def current_user_id():
+    if 'user_id' not in g:
+        g.user_id = _authenticate()
+    return g.user_id
+
+
+def _authenticate():
+    token = session.get('access_token')
+    if not token or token_verifier is None:
+        return None
+    try:
+        claims = token_verifier.verify(token)
+    except ExpiredToken:
+        claims = None
+    except InvalidToken as e:
+        log.info("Rejected access token: %s", e)
+        return None
+    if claims is None or claims['exp'] - time.time() < TOKEN_REFRESH_MARGIN:
+        claims = _refresh_session() or claims
+    return claims['sub'] if claims else None
+
+
+# Exchange the session's refresh token for a new access token; returns its claims
+def _refresh_session():
+    refresh_token = session.get('refresh_token')
+    if not refresh_token:
+        return None
+    try:
+        res = supabase.auth.refresh_session(refresh_token)
+        claims = token_verifier.verify(res.session.access_token)
+    except Exception as e:
+        log.warning("Could not refresh access token: %s", e)
+        return None
+    token_verifier.forget(session['access_token'])
+    session['access_token'] = res.session.access_token
+    session['refresh_token'] = res.session.refresh_token
+    return claims
+
+
+# Name of a book, or None if it doesn't exist.
+def fetch_book_name(book_id):
+    return storage.book_name(book_id)
+
+
+# The user's best score for a book from the leaderboard table, or None.
+def fetch_leaderboard_score(book_id, user_id):
+    return storage.leaderboard_score(book_id, user_id)
+
 # --- Routes ---
 
 # Home Page
-@app.route('/')
+@route('/')
 def home():
-    user = session.get('user')
+    user = current_user_id()
     username = session.get('username')
     return render_template('home.html', user=user, username=username)
 
 # New User Signup
-@app.route('/signup', methods=['GET', 'POST'])
+@route('/signup', methods=['GET', 'POST'])
 @supabase_required # Ensure Supabase is available
 def signup():
     if request.method == 'POST':
@@ -114,7 +419,7 @@ def signup():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        print(f"Signup attempt - church_code: {church_code}, username: {username}")
+        log.info("Signup attempt - church_code: %s, username: %s", church_code, username)
 
         if not church_code or not username or not password:
             flash("Sila masukkan Kod Gereja, Nama Pengguna dan Kata Laluan.", "error")
@@ -125,36 +430,27 @@ def signup():
             return redirect(url_for('signup'))
 
         email = f"{username}-{church_code}@quizapp.local"
-        print(f"Generated email: {email}")
+        log.debug("Generated email: %s", email)
 
         try:
-            # 1. Check if a profile with this church code and username already exists
-            existing_profile = supabase.table('profiles') \
-                .select('id', count='exact') \
-                .eq('church_code', church_code) \
-                .eq('username', username) \
-                .execute()
-
-            print(f"Existing profile check: {existing_profile}")
-
-            if existing_profile.count > 0:
-                flash("Nama pengguna ini sudah wujud untuk kod gereja ini.", "error")
-                return redirect(url_for('signup'))
-
-            # 2. Register the new user in Supabase Auth system
+            # 1. Register the new user in Supabase Auth. The email is derived from the
+            # church code and username, so an existing account is rejected here without
+            # a separate profile check. The names go into the user metadata so login
+            # doesn't need to read the profile.
             res = supabase.auth.sign_up({
                 "email": email,
                 "password": password,
+                "options": {"data": {"username": username, "church_code": church_code}},
             })
 
             if not res.user or not res.user.id:
                  flash("Pendaftaran gagal (Supabase Auth). Sila cuba lagi.", "error")
-                 print(f"Supabase Auth signup failed: {res.error}")
+                 log.warning("Supabase Auth signup returned no user: %s", res)
                  return redirect(url_for('signup'))
 
             user_id = res.user.id
 
-            # 3. Insert user profile data into the 'profiles' table
+            # 2. Insert user profile data into the 'profiles' table
             profile_data = {
                 'id': str(user_id),
                 'church_code': church_code,
@@ -162,33 +458,34 @@ def signup():
                 'email': email,
                 'phone': None
             }
-            print(f"Inserting profile: {profile_data}")
-            supabase.table('profiles').insert(profile_data).execute()
-
-            # 4. Automatically log in the user after successful signup
-            # Note: Supabase sign_up now often automatically signs in. This step might be redundant but safe.
-            login_res = supabase.auth.sign_in_with_password({
-                "email": email,
-                "password": password
-            })
-
-            if login_res.user and login_res.session:
-                session.clear()
-                session['user'] = login_res.user.model_dump()
-                session['access_token'] = login_res.session.access_token
-                session['username'] = username
-                session['church_code'] = church_code
+            log.debug("Inserting profile: %s", profile_data)
+            storage.insert_profiles([profile_data])
+            profiles.put(email, profile_data)
+
+            # 3. sign_up() already signs the user in when email confirmation is off, as
+            # it must be for these synthesized addresses; otherwise sign in separately
+            auth_session = res.session
+            if auth_session is None:
+                auth_session = supabase.auth.sign_in_with_password({
+                    "email": email,
+                    "password": password
+                }).session
+
+            if auth_session:
+                start_session(auth_session, username, church_code)
                 flash("Pendaftaran dan log masuk berjaya!", "success")
                 return redirect(url_for('home'))
             else:
                 flash("Pendaftaran berjaya! Sila log masuk secara manual.", "success")
-                print(f"Automatic login failed after signup: {login_res.error}")
+                log.warning("Automatic login failed after signup for %s", email)
                 return redirect(url_for('login'))
 
         except Exception as e:
             error_message = str(e)
-            print(f"Signup error: {error_message}")
-            if "duplicate key value violates unique constraint" in error_message or "23505" in error_message:
+            log.warning("Signup error: %s", error_message)
+            if "duplicate key value violates unique constraint" in error_message or "23505" in error_message \
+                    or "UNIQUE constraint failed" in error_message or "User already registered" in error_message \
+                    or getattr(e, 'code', None) == 'user_already_exists':
                 flash("Nama pengguna ini sudah wujud untuk kod gereja ini.", "error")
             else:
                  flash(f"Pendaftaran gagal: {error_message}", "error")
@@ -199,7 +496,7 @@ def signup():
 
 
 # User Login
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 @supabase_required # Ensure Supabase is available
 def login():
     if request.method == 'POST':
@@ -207,162 +504,167 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        print(f"Login attempt - church_code: {church_code}, username: {username}")
+        log.info("Login attempt - church_code: %s, username: %s", church_code, username)
 
         if not church_code or not username or not password:
             flash("Sila masukkan Kod Gereja, Nama Pengguna dan Kata Laluan.", "error")
             return redirect(url_for('login'))
 
-        try:
-            # 1. Find profile in 'profiles' table using username and church_code to construct email
-            email = f"{username}-{church_code}@quizapp.local"
-            print(f"Generated email for login: {email}")
-
-            profile_response = supabase.table('profiles') \
-                .select('id, email, church_code, username') \
-                .eq('email', email) \
-                .execute()
-
-            print(f"Profile query response: {profile_response}")
-
-            if not profile_response.data or len(profile_response.data) == 0:
-                flash("Kod Gereja atau Nama Pengguna tidak dijumpai.", "error")
-                return redirect(url_for('login'))
-
-            profile = profile_response.data[0]
-            print(f"Found profile: {profile}")
+        email = f"{username}-{church_code}@quizapp.local"
+        log.debug("Generated email for login: %s", email)
 
-            # 2. Attempt to log in using Supabase Auth with the email and password
+        try:
+            # A single round trip: Supabase Auth checks the password, and the user
+            # metadata carries the names for the session. The profile is only read (and
+            # cached) for accounts created before signup stored the names there, and
+            # to word the message when sign-in fails.
             res = supabase.auth.sign_in_with_password({
                 "email": email,
                 "password": password
             })
 
-            print(f"Auth response: {res}")
-
-            if res.user and res.session:
-                session.clear()
-                session['user'] = res.user.model_dump()
-                session['access_token'] = res.session.access_token
-                session['username'] = profile['username']
-                session['church_code'] = profile['church_code']
+            log.debug("Auth response: %s", res)
 
-                flash("Log masuk berjaya!", "success")
+            if not res.user or not res.session:
+                return login_failed(email, "no session returned")
 
-                next_url = request.args.get('next')
-                return redirect(next_url or url_for('home'))
+            metadata = res.user.user_metadata or {}
+            if metadata.get('username') and metadata.get('church_code'):
+                username, church_code = metadata['username'], metadata['church_code']
             else:
-                # Menterjemahkan teks Korea: "비밀번호를 잊으셨다면 관리자에게 문의하세요."
-                flash("Kata laluan salah. Jika anda terlupa kata laluan, sila hubungi pentadbir.", "error")
-                print(f"Supabase Auth signin failed: {res.error}")
-                return redirect(url_for('login'))
+                profile = profiles.get(storage, email)
+                if profile is None:
+                    flash("Kod Gereja atau Nama Pengguna tidak dijumpai.", "error")
+                    return redirect(url_for('login'))
+                log.debug("Found profile: %s", profile)
+                username, church_code = profile['username'], profile['church_code']
+
+            start_session(res.session, username, church_code)
+
+            flash("Log masuk berjaya!", "success")
+
+            next_url = request.args.get('next')
+            return redirect(next_url or url_for('home'))
 
         except Exception as e:
+            if getattr(e, 'code', None) == 'invalid_credentials' or "Invalid login credentials" in str(e):
+                return login_failed(email, e)
             error_message = str(e)
-            print(f"Login error: {error_message}")
+            log.warning("Login error: %s", error_message)
             flash(f"Log masuk gagal: {error_message}", "error")
             return redirect(url_for('login'))
 
     return render_template('login.html')
 
 
+# Rejected sign-in: tell an unknown account from a wrong password using the
+# (cached) profile
+def login_failed(email, reason):
+    log.info("Supabase Auth signin failed: %s", reason)
+    try:
+        known = profiles.get(storage, email) is not None
+    except Exception as e:
+        log.warning("Profile lookup failed: %s", e)
+        known = True
+    if known:
+        # Menterjemahkan teks Korea: "비밀번호를 잊으셨다면 관리자에게 문의하세요."
+        flash("Kata laluan salah. Jika anda terlupa kata laluan, sila hubungi pentadbir.", "error")
+    else:
+        flash("Kod Gereja atau Nama Pengguna tidak dijumpai.", "error")
+    return redirect(url_for('login'))
+
+
 # User Logout
-@app.route('/logout')
+@route('/logout')
 @login_required # Ensure user is logged in to logout
 def logout():
     try:
         # Only attempt Supabase sign out if the client was successfully created
-        if supabase:
-            supabase.auth.sign_out()
-            print("Supabase user signed out.")
+        # Revoke this session's refresh token and stop accepting the access token.
+        # scope="local" leaves the user's sessions on other devices signed in.
+        token = session.get('access_token')
+        if supabase and token:
+            token_verifier.forget(token)
+            supabase.auth.admin.sign_out(token, scope="local")
+            log.debug("Supabase user signed out.")
         else:
-             print("Supabase client not available, skipping Supabase sign out.")
+             log.debug("Supabase client not available, skipping Supabase sign out.")
 
     except Exception as e:
-        print(f"Error during Supabase sign out: {e}")
+        log.warning("Error during Supabase sign out: %s", e)
         pass
 
     # Clear the Flask session
     session.clear()
-    print("Flask session cleared.")
+    log.debug("Flask session cleared.")
     flash("Anda telah berjaya log keluar.", "success")
     return redirect(url_for('home'))
 
 # Select Book
-@app.route('/select-book')
+@route('/select-book')
 @login_required
-@supabase_required
+@storage_required
 def select_book():
     try:
-        response = supabase.table('bible_books') \
-            .select('id, name') \
-            .order('id', desc=False) \
-            .execute()
-        books = response.data if response and hasattr(response, 'data') else []
+        books = storage.list_books()
         return render_template('select_book.html', books=books)
     except Exception as e:
         flash(f"Gagal memuatkan senarai kitab: {e}", "error")
-        print(f"Error fetching book list: {e}")
+        log.error("Error fetching book list: %s", e)
         return redirect(url_for('home'))
 
 # Quiz Page
-@app.route('/quiz/<int:book_id>')
+@route('/quiz/<int:book_id>')
 @login_required
-@supabase_required
+@storage_required
 def quiz(book_id):
     try:
-        book_response = supabase.table('bible_books') \
-            .select('name') \
-            .eq('id', book_id) \
-            .single() \
-            .execute()
-        if not book_response or not book_response.data:
-            flash("Kitab tidak dijumpai.", "error")
-            return redirect(url_for('select_book'))
-        book_name = book_response.data['name']
-
-        questions_response = supabase.table('questions') \
-            .select('id, question_text, option_a, option_b, option_c, option_d, correct_answer') \
-            .eq('book_id', book_id) \
-            .execute()
-        questions = questions_response.data if questions_response and hasattr(questions_response, 'data') else []
-
-        if not questions:
-            flash("Tiada soalan untuk kitab ini.", "error")
-            return redirect(url_for('select_book'))
-
-        MAX_QUESTIONS = 20
-        total_questions = min(len(questions), MAX_QUESTIONS)
-
-        if len(questions) > MAX_QUESTIONS:
-            questions = random.sample(questions, MAX_QUESTIONS)
-        random.shuffle(questions)
+        snapshot = question_snapshot.current()
+        if snapshot is not None and snapshot.count(book_id):
+            # Served from the mapped snapshot; only sampled questions are decoded
+            sample = snapshot.sample(book_id, MAX_QUESTIONS)
+            book_name = snapshot.book_name(book_id) or fetch_book_name(book_id)
+        else:
+            # Book name and the cached per-book question pool are independent; fetch them together.
+            # Only the sample drawn from the pool is materialized.
+            book_name, pool = query_pool.gather(
+                lambda: fetch_book_name(book_id),
+                lambda: question_pool.get(storage, book_id),
+            )
+            if book_name is None:
+                flash("Kitab tidak dijumpai.", "error")
+                return redirect(url_for('select_book'))
 
-        # Security Note: Sending correct_answer to the client is not ideal for security.
-        # A more secure approach is to remove 'correct_answer' here and only check on the server in submit_answer.
-        # Your submit_answer *does* check on the server, which is good.
-        # For consistency with your original code structure, I'll keep it, but be aware.
-        # If you want to remove it:
-        # for q in questions:
-        #    q.pop('correct_answer', None) # Remove correct_answer key
+            if not len(pool):
+                flash("Tiada soalan untuk kitab ini.", "error")
+                return redirect(url_for('select_book'))
 
+            sample = pool.sample(MAX_QUESTIONS)
+        # The answers travel only inside the signed attempt token, never in the page
+        questions = [record.to_dict(PUBLIC_FIELDS) for record in sample]
+        total_questions = len(questions)
+        attempt_token = attempt_tokens.issue(book_id, [(record.id, record.correct_answer) for record in sample])
 
         return render_template('quiz.html',
                                questions=questions,
                                book_id=book_id,
                                total_questions=total_questions,
-                               book_name=book_name)
+                               book_name=book_name,
+                               attempt_token=attempt_token)
     except Exception as e:
         flash(f"Gagal memuatkan kuiz: {e}", "error")
-        print(f"Error loading quiz: {e}")
+        log.error("Error loading quiz: %s", e)
         return redirect(url_for('select_book'))
 
 # Submit Question Answer
-@app.route('/submit-answer', methods=['POST'])
+# Per-question feedback, graded from the attempt token. The first answer sent for a
+# question is locked in and counts in the final score, so the correct answer this
+# reveals can't be used to change it.
+@route('/submit-answer', methods=['POST'])
 @login_required
-@supabase_required
+@storage_required
 def submit_answer():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     question_id = data.get('question_id')
     user_answer = data.get('answer')
 
@@ -370,135 +672,238 @@ def submit_answer():
         return jsonify({'error': 'Question ID is missing'}), 400
 
     try:
-        # Fetch the correct answer for the question
-        # Ensure this fetch happens *every time* an answer is submitted for security
-        question_response = supabase.table('questions') \
-            .select('correct_answer') \
-            .eq('id', question_id) \
-            .single() \
-            .execute()
-        if not question_response or not question_response.data:
-            return jsonify({'error': 'Question not found'}), 404
+        attempt = load_attempt(data)
+    except InvalidAttemptToken as e:
+        return jsonify({'error': f'Invalid attempt token: {e}'}), 400
+    if attempt is None:
+        return jsonify({'error': 'Attempt token is missing'}), 400
 
-        correct_answer = question_response.data['correct_answer']
-        is_correct = (user_answer == correct_answer)
-
-        return jsonify({'correct': is_correct, 'correct_answer': correct_answer})
+    # Graded from the signed token alone, no database involved
+    try:
+        question_id = int(question_id)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Question ID is invalid'}), 400
+    if not attempt.served(question_id):
+        return jsonify({'error': 'Question was not served in this attempt'}), 400
 
+    try:
+        answer = attempt_ledger.answer(attempt, question_id, user_answer)
+        if attempt_ledger.submitted(attempt):
+            return jsonify({'error': 'Attempt was already submitted'}), 409
     except Exception as e:
-        print(f"Error checking answer: {e}")
-        error_message = str(e)
-        return jsonify({'error': f'An error occurred: {error_message}'}), 500
-
+        log.error("Error recording answer: %s", e)
+        return jsonify({'error': f'An error occurred: {e}'}), 500
+    correct_answer = attempt.correct_answer(question_id)
+    return jsonify({'correct': answer == correct_answer, 'correct_answer': correct_answer, 'answer': answer})
+
+
+# Verify the attempt token sent with a grading request. Returns None when there is
+# none and raises InvalidAttemptToken for a bad or expired token.
+def load_attempt(data):
+    token = data.get('attempt_token')
+    if not token:
+        return None
+    return attempt_tokens.load(token)
+
+
+# Turn [{'question_id': ..., 'answer': ...}, ...] into {question_id: answer}.
+# The last answer wins if a question appears twice; unanswered questions carry None.
+def parse_answers(answers):
+    submitted = {}
+    for item in answers:
+        submitted[int(item['question_id'])] = item.get('answer')
+    return submitted
+
+
+# Grade submitted answers against a verified attempt. Raises ValueError for
+# questions that were never served in the attempt.
+def grade_attempt(attempt, submitted):
+    check_served(attempt, submitted)
+    return {question_id: attempt.is_correct(question_id, answer) for question_id, answer in submitted.items()}
+
+
+def check_served(attempt, submitted):
+    not_served = [question_id for question_id in submitted if not attempt.served(question_id)]
+    if not_served:
+        raise ValueError(f"Soalan tidak dihidangkan dalam percubaan ini: {not_served}")
+
+
+# Grade an attempt and save its score, once per attempt. Answers locked in through
+# /submit-answer replace the submitted ones. Returns {question_id: correct}, or None
+# if the attempt was already submitted; the attempt is released again if the score
+# couldn't be saved.
+def finish_attempt(attempt, submitted, user_id, username):
+    if not attempt_ledger.submit(attempt):
+        return None
+    try:
+        submitted.update(attempt_ledger.answers(attempt))
+        results = grade_attempt(attempt, submitted)
+        store_score(user_id, username, attempt.book_id, sum(results.values()))
+    except Exception:
+        attempt_ledger.reopen(attempt)
+        raise
+    return results
+
+
+# Persist a finished attempt: append to 'scores' and keep the user's best score
+# on the book's leaderboard. Raises on database errors.
+def save_score(user_id, username, book_id, final_score):
+    best_score = storage.record_score(user_id, username, book_id, final_score)
+    log.debug("Recorded score %s; best for book %s is now %s", final_score, book_id, best_score)
+
+
+# Bulk form of save_score() used by the write-behind queue
+def save_scores_bulk(entries):
+    storage.record_scores(entries)
+
+
+# Used by the routes: queue the attempt in write-behind mode, otherwise (or when the
+# queue is full) save it synchronously. The in-memory leaderboards are updated either way.
+def store_score(user_id, username, book_id, final_score):
+    queued = score_queue is not None and score_queue.submit({
+        'user_id': user_id,
+        'username': username,
+        'book_id': book_id,
+        'score': final_score,
+        'achieved_at': datetime.utcnow().isoformat()
+    })
+    if not queued:
+        save_score(user_id, username, book_id, final_score)
+    leaderboards.record(book_id, user_id, username, final_score)
+    rank_index.record(book_id, user_id, final_score)
 
 # Complete Quiz
-@app.route('/complete-quiz', methods=['POST'])
+@route('/complete-quiz', methods=['POST'])
 @login_required
-@supabase_required
+@storage_required
 def complete_quiz():
-    data = request.get_json()
-    print(f"Received data: {data}")
-
-    required_fields = ['book_id', 'score', 'total_questions']
-    if not all(field in data and data[field] is not None for field in required_fields):
-        missing_fields = [field for field in required_fields if field not in data or data[field] is None]
-        print(f"Missing or null fields: {missing_fields}")
-        return jsonify({'success': False, 'message': f'Data tidak lengkap. Medan hilang: {", ".join(missing_fields)}'}), 400
-
-    book_id = data['book_id']
-    final_score = data['score']
-    total_questions = data['total_questions']
+    data = request.get_json(silent=True) or {}
+    log.debug("Received data: %s", data)
 
-    print(f"book_id: {book_id}, score: {final_score}, total_questions: {total_questions}")
+    try:
+        attempt = load_attempt(data)
+    except InvalidAttemptToken as e:
+        return jsonify({'success': False, 'message': f'Token percubaan tidak sah: {e}'}), 400
+    if attempt is None:
+        return jsonify({'success': False, 'message': 'Token percubaan diperlukan.'}), 400
 
-    user_info = session.get('user')
-    if not user_info or 'id' not in user_info:
+    # The score is graded from the signed attempt; any client-sent score is ignored
+    try:
+        submitted = parse_answers(data.get('answers') or [])
+        check_served(attempt, submitted)
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'success': False, 'message': f'Jawapan tidak sah: {str(e)}'}), 400
+    book_id = attempt.book_id
+    total_questions = len(attempt.question_ids)
+
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'success': False, 'message': 'Sesi pengguna tidak sah.', 'redirect': url_for('login')}), 401
 
-    user_id = user_info['id']
     username = session.get('username')
 
     try:
-        book_id = int(book_id)
-        final_score = int(final_score)
-        total_questions = int(total_questions)
-        if final_score < 0 or final_score > total_questions:
-             return jsonify({'success': False, 'message': 'Skor tidak sah. Skor mestilah antara 0 dan Jumlah Soalan.'}), 400
+        results = finish_attempt(attempt, submitted, user_id, username)
+        if results is None:
+            return jsonify({'success': False, 'message': 'Percubaan ini sudah dihantar.'}), 409
+        final_score = sum(results.values())
+        log.debug("book_id: %s, score: %s, total_questions: %s", book_id, final_score, total_questions)
+
+        return jsonify({
+            'success': True,
+            'message': 'Skor berjaya disimpan.',
+            'score': final_score,
+            'total_questions': total_questions,
+            'redirect': url_for('results', score=final_score, book_id=book_id, total_questions=total_questions)
+        })
+
+    except Exception as e:
+        error_message = str(e)
+        log.error("Error saving score: %s", error_message)
+        if "42501" in error_message:
+             display_message = "Gagal menyimpan skor tertinggi (isu kebenaran RLS). Sila hubungi pentadbir."
+             log.error("RLS Policy error detected on leaderboard update. Check Supabase RLS settings.")
+        else:
+             display_message = f'Gagal menyimpan skor: {error_message}'
+
+        return jsonify({'success': False, 'message': display_message}), 500
+
 
-    except (ValueError, TypeError) as e:
-        print(f"Data type conversion error: {e}")
-        return jsonify({'success': False, 'message': f'Jenis data tidak sah untuk book_id, score, atau total_questions: {str(e)}'}), 400
+# Submit Whole Quiz
+# Grades every (question_id, answer) pair of an attempt in one pass and stores the
+# server-computed score. /submit-answer stays in place for per-question feedback.
+@route('/submit-quiz', methods=['POST'])
+@login_required
+@storage_required
+def submit_quiz():
+    data = request.get_json(silent=True) or {}
+    answers = data.get('answers')
 
     try:
-        # Save score to 'scores' table
-        score_response = supabase.table('scores').insert({
-            'user_id': user_id,
-            'book_id': book_id,
-            'score': final_score,
-            'achieved_at': datetime.utcnow().isoformat()
-        }).execute()
-        print(f"Score insert response: {score_response}")
+        attempt = load_attempt(data)
+    except InvalidAttemptToken as e:
+        return jsonify({'success': False, 'message': f'Token percubaan tidak sah: {e}'}), 400
+    if attempt is None:
+        return jsonify({'success': False, 'message': 'Token percubaan diperlukan.'}), 400
 
+    # The book and its questions come from the signed attempt, not the request
+    book_id = attempt.book_id
 
-        # Update leaderboard
-        existing_leaderboard = supabase.table('leaderboard') \
-            .select('score') \
-            .eq('book_id', book_id) \
-            .eq('user_id', user_id) \
-            .execute()
+    if not isinstance(answers, list) or not answers:
+        return jsonify({'success': False, 'message': 'Data tidak lengkap. Medan hilang: answers'}), 400
 
-        print(f"Existing leaderboard check: {existing_leaderboard}")
+    if len(answers) > MAX_QUESTIONS:
+        return jsonify({'success': False, 'message': f'Terlalu banyak jawapan. Maksimum {MAX_QUESTIONS} soalan.'}), 400
 
-        current_leaderboard_score = 0
-        if existing_leaderboard and existing_leaderboard.data and len(existing_leaderboard.data) > 0:
-             current_leaderboard_score = existing_leaderboard.data[0].get('score', 0)
-             print(f"Found existing leaderboard score: {current_leaderboard_score}")
-        else:
-            print("No existing leaderboard entry found for this user and book.")
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'success': False, 'message': 'Sesi pengguna tidak sah.', 'redirect': url_for('login')}), 401
 
+    username = session.get('username')
 
-        # Only upsert if the new score is strictly higher
-        if final_score > current_leaderboard_score:
-            print(f"New score ({final_score}) is higher than current leaderboard score ({current_leaderboard_score}). Upserting leaderboard...")
-            # Ensure you have RLS policies in Supabase that allow a user
-            # to INSERT/UPDATE rows in the 'leaderboard' table where user_id = auth.uid()
-            leaderboard_response = supabase.table('leaderboard').upsert({
-                'book_id': book_id,
-                'user_id': user_id,
-                'username': username,
-                'score': final_score
-            }).execute()
-            print(f"Leaderboard upsert response: {leaderboard_response}")
-            # NOTE: Remember to check RLS policies in Supabase to allow this.
+    try:
+        submitted = parse_answers(answers)
+    except (ValueError, TypeError, KeyError) as e:
+        log.warning("Data type conversion error: %s", e)
+        return jsonify({'success': False, 'message': f'Jenis data tidak sah untuk answers: {str(e)}'}), 400
 
-        else:
-             print(f"New score ({final_score}) is not higher than current leaderboard score ({current_leaderboard_score}). No leaderboard update needed.")
+    # Graded from the signed token, so only the attempt's own questions count, each
+    # once; unanswered questions still count towards the total
+    try:
+        check_served(attempt, submitted)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    total_questions = len(attempt.question_ids)
 
+    try:
+        results = finish_attempt(attempt, submitted, user_id, username)
+        if results is None:
+            return jsonify({'success': False, 'message': 'Percubaan ini sudah dihantar.'}), 409
+        final_score = sum(results.values())
 
         return jsonify({
             'success': True,
             'message': 'Skor berjaya disimpan.',
             'score': final_score,
             'total_questions': total_questions,
+            'results': {str(question_id): correct for question_id, correct in results.items()},
             'redirect': url_for('results', score=final_score, book_id=book_id, total_questions=total_questions)
         })
 
     except Exception as e:
         error_message = str(e)
-        print(f"Error saving score: {error_message}")
+        log.error("Error grading quiz: %s", error_message)
         if "42501" in error_message:
              display_message = "Gagal menyimpan skor tertinggi (isu kebenaran RLS). Sila hubungi pentadbir."
-             print("RLS Policy error detected on leaderboard update. Check Supabase RLS settings.")
         else:
              display_message = f'Gagal menyimpan skor: {error_message}'
 
         return jsonify({'success': False, 'message': display_message}), 500
 
-
 # Quiz Results Page
-@app.route('/results')
+@route('/results')
 @login_required
-@supabase_required
+@storage_required
 def results():
     score = request.args.get('score', type=int)
     book_id = request.args.get('book_id', type=int)
@@ -506,34 +911,34 @@ def results():
 
     book_name = "Kitab Tidak Diketahui"
     current_highest_score = 0
+    user_rank = None
 
-    user_info = session.get('user')
-    user_id = user_info['id']
+    user_id = current_user_id()
 
     if book_id is not None:
-        try:
-            book_response = supabase.table('bible_books') \
-                .select('name') \
-                .eq('id', book_id) \
-                .single() \
-                .execute()
-            if not book_response or not book_response.data:
+        # Book name, personal best and rank don't depend on each other; fetch them together
+        book_name_result, best_result, rank_result = query_pool.gather(
+            lambda: fetch_book_name(book_id),
+            lambda: fetch_leaderboard_score(book_id, user_id),
+            lambda: rank_index.rank(storage, book_id, user_id),
+            return_exceptions=True,
+        )
+
+        if isinstance(book_name_result, Exception) or isinstance(best_result, Exception):
+            error = book_name_result if isinstance(book_name_result, Exception) else best_result
+            log.error("Error fetching book name or user's leaderboard score for results page: %s", error)
+        if not isinstance(book_name_result, Exception):
+            if book_name_result is None:
                 flash("Kitab tidak dijumpai.", "error")
                 return redirect(url_for('select_book'))
-            book_name = book_response.data['name']
-
-            leaderboard_response = supabase.table('leaderboard') \
-                .select('score') \
-                .eq('book_id', book_id) \
-                .eq('user_id', user_id) \
-                .execute()
-
-            if leaderboard_response.data and len(leaderboard_response.data) > 0:
-                current_highest_score = leaderboard_response.data[0].get('score', 0)
+            book_name = book_name_result
+        if not isinstance(best_result, Exception) and best_result is not None:
+            current_highest_score = best_result
 
-
-        except Exception as e:
-            print(f"Error fetching book name or user's leaderboard score for results page: {e}")
+        if isinstance(rank_result, Exception):
+            log.error("Error fetching user's rank for results page: %s", rank_result)
+        else:
+            user_rank = rank_result
 
 
     if score is None or book_id is None or total_questions is None:
@@ -550,102 +955,182 @@ def results():
                            book_id=book_id,
                            book_name=book_name,
                            total_questions=total_questions,
-                           current_highest_score=current_highest_score)
+                           current_highest_score=current_highest_score,
+                           user_rank=user_rank)
 
 # My Personal Scores Page
-@app.route('/my-scores')
+@route('/my-scores')
 @login_required
-@supabase_required
+@storage_required
 def my_scores():
-    user_info = session.get('user')
-    user_id = user_info['id']
+    user_id = current_user_id()
+
+    page_size = request.args.get('page_size', MY_SCORES_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, MY_SCORES_MAX_PAGE_SIZE))
 
+    # Per-book summary comes from the precomputed rollup, not from the history
     try:
-        response = supabase.table('scores') \
-            .select('score, achieved_at, bible_books(name)') \
-            .eq('user_id', user_id) \
-            .order('achieved_at', desc=True) \
-            .execute()
-        print(f"My scores response: {response}")
-        scores_data = response.data if response and hasattr(response, 'data') else []
-
-        return render_template('my_scores.html', scores=scores_data)
+        book_stats = user_stats.summary(storage, user_id)
+    except Exception as e:
+        log.error("Error fetching user stats summary: %s", e)
+        book_stats = []
+
+    # Full history: streamed, so the first rows go out while later pages are still being fetched
+    if request.args.get('view') == 'all':
+        return current_app.response_class(stream_template('my_scores.html',
+                                                  scores=iter_user_scores(user_id, MY_SCORES_MAX_PAGE_SIZE),
+                                                  book_stats=book_stats,
+                                                  streamed=True))
+
+    # The cursor ends up in a PostgREST filter string, so only a well-formed
+    # timestamp and integer id are accepted. The timestamp is passed on as given,
+    # so it compares equal to the stored value it came from.
+    cursor = None
+    before_at = request.args.get('before_at')
+    before_id = request.args.get('before_id')
+    if before_at is not None or before_id is not None:
+        if not (before_at and ISO_TIMESTAMP.fullmatch(before_at)
+                and before_id and before_id.isascii() and before_id.isdigit()):
+            return "Kursor halaman tidak sah.", 400
+        cursor = (before_at, int(before_id))
+
+    try:
+        scores_data, next_cursor = fetch_user_scores_page(user_id, page_size, cursor)
+
+        next_url = None
+        if next_cursor:
+            next_url = url_for('my_scores', before_at=next_cursor[0], before_id=next_cursor[1],
+                               page_size=request.args.get('page_size', type=int))
+
+        return render_template('my_scores.html',
+                               scores=scores_data,
+                               book_stats=book_stats,
+                               next_url=next_url,
+                               is_first_page=cursor is None)
     except Exception as e:
         flash(f"Gagal memuatkan skor peribadi: {e}", "error")
-        print(f"Error fetching personal scores: {e}")
+        log.error("Error fetching personal scores: %s", e)
         return redirect(url_for('select_book'))
 
+
+# One page of a user's score history, newest first, using keyset pagination on
+# (achieved_at, id). Returns (rows, next_cursor); next_cursor is None on the last page.
+def fetch_user_scores_page(user_id, page_size, cursor=None):
+    return storage.user_scores_page(user_id, page_size, cursor)
+
+
+# Whole score history as a generator, fetched one page at a time as it is consumed.
+def iter_user_scores(user_id, page_size):
+    cursor = None
+    while True:
+        rows, cursor = fetch_user_scores_page(user_id, page_size, cursor)
+        yield from rows
+        if cursor is None:
+            return
+
 # Book Leaderboard
-@app.route('/leaderboard/<int:book_id>')
+@route('/leaderboard/<int:book_id>')
 @login_required
-@supabase_required
+@storage_required
 def leaderboard(book_id):
     try:
-        book_response = supabase.table('bible_books') \
-            .select('name') \
-            .eq('id', book_id) \
-            .single() \
-            .execute()
-        if not book_response or not book_response.data:
+        user_id = current_user_id()
+        # Book name, the in-memory top-10 snapshot and the user's rank are independent reads
+        book_name, leaderboard_data, user_rank = query_pool.gather(
+            lambda: fetch_book_name(book_id),
+            lambda: leaderboards.book(storage, book_id),
+            lambda: rank_index.rank(storage, book_id, user_id),
+            return_exceptions=True,
+        )
+        for result in (book_name, leaderboard_data):
+            if isinstance(result, Exception):
+                raise result
+        if book_name is None:
             flash("Kitab tidak dijumpai.", "error")
             return redirect(url_for('select_book'))
-        book_name = book_response.data['name']
-
-        leaderboard_response = supabase.table('leaderboard') \
-            .select('username, score') \
-            .eq('book_id', book_id) \
-            .order('score', desc=True) \
-            .limit(10) \
-            .execute()
-        leaderboard_data = leaderboard_response.data if leaderboard_response and hasattr(leaderboard_response, 'data') else []
-
-        return render_template('leaderboard.html',
-                               leaderboard=leaderboard_data,
-                               book_name=book_name,
-                               book_id=book_id)
+        if isinstance(user_rank, Exception):
+            log.error("Error fetching user's rank for book leaderboard: %s", user_rank)
+            user_rank = None
+
+        response = make_response(render_template('leaderboard.html',
+                                                 leaderboard=leaderboard_data,
+                                                 book_name=book_name,
+                                                 book_id=book_id,
+                                                 user_rank=user_rank))
+        response.headers['X-Leaderboard-Age'] = f"{leaderboards.age(book_id) or 0:.1f}"
+        return response
 
     except Exception as e:
         flash(f"Gagal memuatkan papan pendahulu kitab: {e}", "error")
-        print(f"Error fetching book leaderboard: {e}")
+        log.error("Error fetching book leaderboard: %s", e)
         return redirect(url_for('select_book'))
 
 # --- NEW GLOBAL LEADERBOARD ROUTE ---
 # Global Leaderboard
-@app.route('/global-leaderboard')
+@route('/global-leaderboard')
 @login_required
-@supabase_required
+@storage_required
 def global_leaderboard():
     try:
-        # Fetch top 20 highest scores across all books
-        global_leaderboard_response = (
-            supabase.table('leaderboard')
-            .select('username, score, book_id, bible_books(name)') # Include book name via join
-            .order('score', desc=True)
-            .limit(20)
-            .execute()
-        )
-
-        global_leaderboard_data = global_leaderboard_response.data if global_leaderboard_response and hasattr(global_leaderboard_response, 'data') else []
-
-        # Data is formatted by Supabase with 'bible_books(name)', accessible in template
+        # Top 20 across all books, served from the in-memory snapshot. Entries carry
+        # 'bible_books(name)' from the join, accessible in the template.
+        global_leaderboard_data = leaderboards.global_board(storage)
 
-        # Render the global_leaderboard.html template
-        return render_template('global_leaderboard.html', leaderboard=global_leaderboard_data)
+        response = make_response(render_template('global_leaderboard.html', leaderboard=global_leaderboard_data))
+        response.headers['X-Leaderboard-Age'] = f"{leaderboards.age() or 0:.1f}"
+        return response
 
     except Exception as e:
         flash(f"Gagal memuatkan papan pendahulu global: {e}", "error")
-        print(f"Error fetching global leaderboard: {e}")
+        log.error("Error fetching global leaderboard: %s", e)
         return redirect(url_for('home'))
 
 
-# --- 진단 코드 시작 ---
-# Flask 앱 인스턴스가 생성된 후 라우트 맵을 출력하여 등록된 라우트를 확인합니다.
-# 이 코드는 app.py 파일이 실행될 때 __name__ == '__main__' 블록 전에 실행됩니다.
-print("\n--- Flask URL Map (Registered Routes) ---")
-for rule in app.url_map.iter_rules():
-    print(f"Endpoint: {rule.endpoint}, Methods: {rule.methods}, Rule: {rule.rule}")
-print("--- End of URL Map ---\n")
-# --- 진단 코드 끝 ---
+# Bulk member onboarding (see member_import.py): POST the CSV as the 'file' field
+# of a multipart form with "Authorization: Bearer <ADMIN_TOKEN>". Returns the
+# import report; posting the same CSV again resumes an interrupted import.
+# Disabled unless ADMIN_TOKEN is set.
+@route('/admin/members/import', methods=['POST'])
+def admin_import_members():
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if not admin_token:
+        return jsonify({'success': False, 'message': 'Not found'}), 404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode(), admin_token.encode()):
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    if supabase is None or storage is None:
+        return jsonify({'success': False, 'message': 'Database connection error.'}), 503
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'success': False, 'message': "Send the CSV as the 'file' field."}), 400
+    data = upload.read()
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'message': 'The CSV must be UTF-8.'}), 400
+
+    importer = member_import.MemberImporter(
+        storage,
+        member_import.AuthUsers((admin_clients or supabase).auth, admin=admin_clients is not None),
+        workers=int(os.environ.get("MEMBER_IMPORT_WORKERS", member_import.WORKERS)),
+    )
+    checkpoint = member_import.Checkpoint(member_import.checkpoint_path(
+        data, os.environ.get("MEMBER_IMPORT_DIR", member_import.CHECKPOINT_DIR)))
+    try:
+        report = importer.run(io.StringIO(text, newline=''), checkpoint)
+    except member_import.InvalidRow as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    log.info("Member import: %d rows, %d created, %d failed in %.2fs",
+             report.read, report.created, len(report.failed), report.seconds)
+    return jsonify({'success': True, **report.to_dict()})
+
+
+# Prometheus scrape endpoint (see metrics.py)
+@route('/metrics')
+def metrics_endpoint():
+    response = current_app.response_class(metrics.render(), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
 
 
 # --- Run Application ---
@@ -653,4 +1138,4 @@ if __name__ == '__main__':
     # Use 0.0.0.0 for accessibility in container/VM, debug=True for development
     # In production, debug must be False and use a production WSGI server
     # Waitress를 사용할 때는 이 app.run() 라인이 실행되지 않습니다.
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
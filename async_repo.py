@@ -0,0 +1,185 @@
+import asyncio
+import threading
+
+from gotrue import AsyncGoTrueClient
+from gotrue.http_clients import AsyncClient as GoTrueAsyncClient
+from postgrest import AsyncPostgrestClient
+from postgrest.utils import AsyncClient as PostgrestAsyncClient
+
+import metrics
+
+PAGE_SIZE = 1000
+
+
+# AsyncPostgrestClient whose session runs on a shared http_pool.SharedPool
+class PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    def __init__(self, base_url, pool, **kwargs):
+        self._pool = pool
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return self._pool.async_client(PostgrestAsyncClient, base_url=base_url, headers=headers, follow_redirects=True)
+
+
+# Async data access for books, questions, scores, leaderboard and profiles, built on
+# the async PostgREST and GoTrue clients that ship with the supabase package.
+#
+# PostgREST requests are made with `rest_key` (the service role key, see
+# clients.py) and GoTrue requests with the project key; the auth client does not
+# persist sessions, so one repository can serve all users. With a `pool`
+# (http_pool.SharedPool) both clients use its tuned limits and timeouts.
+class AsyncRepository:
+    def __init__(self, url, key, timeout=10.0, pool=None, rest_key=None):
+        headers = {'apikey': key, 'Authorization': f'Bearer {key}'}
+        rest_key = rest_key or key
+        rest_headers = {'apikey': rest_key, 'Authorization': f'Bearer {rest_key}'}
+        if pool is None:
+            self.rest = AsyncPostgrestClient(f"{url}/rest/v1", headers=rest_headers, timeout=timeout)
+            http_client = None
+        else:
+            self.rest = PooledAsyncPostgrestClient(f"{url}/rest/v1", pool, headers=rest_headers)
+            http_client = pool.async_client(GoTrueAsyncClient, follow_redirects=True)
+        self.auth = AsyncGoTrueClient(
+            url=f"{url}/auth/v1",
+            headers=headers,
+            auto_refresh_token=False,
+            persist_session=False,
+            http_client=http_client,
+        )
+
+    async def aclose(self):
+        await self.rest.aclose()
+
+    # --- Books ---
+
+    async def list_books(self):
+        response = await self.rest.table('bible_books') \
+            .select('id, name') \
+            .order('id', desc=False) \
+            .execute()
+        return response.data or []
+
+    async def book_name(self, book_id):
+        response = await self.rest.table('bible_books') \
+            .select('name') \
+            .eq('id', book_id) \
+            .execute()
+        return response.data[0]['name'] if response.data else None
+
+    # --- Questions ---
+
+    async def questions_for_book(self, book_id, columns='id, question_text, option_a, option_b, option_c, option_d, correct_answer'):
+        rows = []
+        last_id = None
+        while True:
+            query = self.rest.table('questions').select(columns).eq('book_id', book_id)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            response = await query.order('id', desc=False).limit(PAGE_SIZE).execute()
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            last_id = page[-1]['id']
+
+    # --- Scores ---
+
+    # Keyset page of a user's history, newest first; see fetch_user_scores_page() in app.py
+    async def user_scores_page(self, user_id, page_size, cursor=None):
+        query = self.rest.table('scores') \
+            .select('id, score, achieved_at, bible_books(name)') \
+            .eq('user_id', user_id)
+        if cursor:
+            achieved_at, score_id = cursor
+            query = query.or_(f'achieved_at.lt."{achieved_at}",and(achieved_at.eq."{achieved_at}",id.lt.{score_id})')
+        response = await query \
+            .order('achieved_at', desc=True) \
+            .order('id', desc=True) \
+            .limit(page_size + 1) \
+            .execute()
+        rows = response.data or []
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1]['achieved_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    # --- Leaderboard ---
+
+    async def top_for_book(self, book_id, limit=10):
+        response = await self.rest.table('leaderboard') \
+            .select('book_id, user_id, username, score') \
+            .eq('book_id', book_id) \
+            .order('score', desc=True) \
+            .limit(limit) \
+            .execute()
+        return response.data or []
+
+    async def top_global(self, limit=20):
+        response = await self.rest.table('leaderboard') \
+            .select('book_id, user_id, username, score, bible_books(name)') \
+            .order('score', desc=True) \
+            .limit(limit) \
+            .execute()
+        return response.data or []
+
+    async def leaderboard_score(self, book_id, user_id):
+        response = await self.rest.table('leaderboard') \
+            .select('score') \
+            .eq('book_id', book_id) \
+            .eq('user_id', user_id) \
+            .execute()
+        return response.data[0].get('score', 0) if response.data else None
+
+    # --- Profiles ---
+
+    async def profile_by_email(self, email):
+        response = await self.rest.table('profiles') \
+            .select('id, email, church_code, username') \
+            .eq('email', email) \
+            .execute()
+        return response.data[0] if response.data else None
+
+    async def insert_profiles(self, profiles):
+        response = await self.rest.table('profiles').insert(profiles).execute()
+        return response.data or []
+
+
+# Blocking facade over an AsyncRepository for the existing (synchronous) Flask views.
+#
+# The async clients live on one event loop running in a background thread; each
+# call is scheduled onto it and waited for, so many requests' I/O is multiplexed
+# over that loop instead of each pinning its own connection.
+class SyncRepository:
+    def __init__(self, factory, timeout=10.0):
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='repository-loop', daemon=True)
+        self._thread.start()
+        # Build the async clients on the loop that will use them
+        self.repo = self._run(self._build(factory))
+
+    @staticmethod
+    async def _build(factory):
+        return factory()
+
+    def _run(self, coro):
+        # Keep the caller's request scope so the calls are counted against its route
+        future = asyncio.run_coroutine_threadsafe(metrics.bind(coro), self._loop)
+        return future.result(self.timeout)
+
+    def __getattr__(self, name):
+        if name == 'repo':
+            raise AttributeError(name)
+        method = getattr(self.repo, name)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+
+        def call(*args, **kwargs):
+            return self._run(method(*args, **kwargs))
+        call.__name__ = name
+        return call
+
+    def close(self):
+        self._run(self.repo.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,143 @@
+import base64
+import hashlib
+import hmac
+import secrets
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+ANSWER_CHOICES = ('A', 'B', 'C', 'D')
+
+# Bytes of HMAC kept per question. The client never sees the key, so even a short
+# digest can't be brute-forced against the four possible answers.
+DIGEST_BYTES = 6
+DIGEST_CHARS = len(base64.urlsafe_b64encode(b'\0' * DIGEST_BYTES))
+
+
+class InvalidAttemptToken(Exception):
+    pass
+
+
+# A verified attempt: the questions that were served and a keyed digest of each
+# correct answer. Grading only needs the token and the key.
+class Attempt:
+    __slots__ = ('attempt_id', 'book_id', 'question_ids', 'expires_at', '_digests', '_key')
+
+    def __init__(self, attempt_id, book_id, question_ids, digests, key, expires_at=None):
+        self.attempt_id = attempt_id
+        self.book_id = book_id
+        self.question_ids = question_ids
+        self.expires_at = expires_at  # time.time() value after which the token is rejected
+        self._digests = dict(zip(question_ids, digests))
+        self._key = key
+
+    def served(self, question_id):
+        return question_id in self._digests
+
+    def is_correct(self, question_id, answer):
+        expected = self._digests.get(question_id)
+        if expected is None or answer not in ANSWER_CHOICES:
+            return False
+        return hmac.compare_digest(expected, _digest(self._key, self.attempt_id, question_id, answer))
+
+    def correct_answer(self, question_id):
+        for choice in ANSWER_CHOICES:
+            if self.is_correct(question_id, choice):
+                return choice
+        return None
+
+
+def _digest(key, attempt_id, question_id, answer):
+    message = f"{attempt_id}:{question_id}:{answer}".encode()
+    mac = hmac.new(key, message, hashlib.sha256).digest()[:DIGEST_BYTES]
+    return base64.urlsafe_b64encode(mac).decode()
+
+
+# Issues and verifies signed, stateless quiz-attempt tokens.
+#
+# All workers must share the same secret key (FLASK_SECRET_KEY), otherwise a token
+# issued by one process won't verify in another.
+class AttemptTokens:
+    def __init__(self, secret_key, max_age=7200):
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode()
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='quiz-attempt')
+        # Separate key for answer digests so the signing key is never used for both
+        self._answer_key = hmac.new(secret_key, b'quiz-attempt-answers', hashlib.sha256).digest()
+
+    # questions: iterable of (question_id, correct_answer) in the order served
+    def issue(self, book_id, questions):
+        attempt_id = secrets.token_urlsafe(8)
+        question_ids = []
+        digests = []
+        for question_id, correct_answer in questions:
+            question_ids.append(question_id)
+            digests.append(_digest(self._answer_key, attempt_id, question_id, correct_answer))
+        return self._serializer.dumps({
+            'a': attempt_id,
+            'b': book_id,
+            'q': question_ids,
+            'd': ''.join(digests),
+        })
+
+    def load(self, token):
+        try:
+            payload, issued_at = self._serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+            attempt_id = payload['a']
+            question_ids = payload['q']
+            packed = payload['d']
+            digests = [packed[i:i + DIGEST_CHARS] for i in range(0, len(packed), DIGEST_CHARS)]
+            if len(digests) != len(question_ids):
+                raise InvalidAttemptToken("Malformed attempt token")
+            return Attempt(attempt_id, payload['b'], question_ids, digests, self._answer_key,
+                           expires_at=issued_at.timestamp() + self.max_age)
+        except BadSignature as e:
+            # Also covers SignatureExpired
+            raise InvalidAttemptToken(str(e)) from e
+        except (KeyError, TypeError) as e:
+            raise InvalidAttemptToken("Malformed attempt token") from e
+
+
+# Server-side record of what happened to each attempt, since a token alone can be
+# replayed until it expires. An attempt is submitted (and its score saved) once,
+# and the first answer sent for a question through /submit-answer is the one that
+# counts: the correct answer it reveals can't be used to change it, and nothing is
+# revealed once the attempt is submitted.
+#
+# Entries are claims in a session store (session_store.py), so every worker sharing
+# that store agrees, and they expire with the token.
+class AttemptLedger:
+    def __init__(self, store):
+        self.store = store
+
+    # Record `answer` for the question unless one was recorded already; returns the
+    # answer that counts
+    def answer(self, attempt, question_id, answer):
+        answer = answer if answer in ANSWER_CHOICES else ''
+        return self.store.claim(self._key(attempt, question_id), answer, attempt.expires_at) or None
+
+    # {question_id: answer} of the answers recorded for the attempt
+    def answers(self, attempt):
+        recorded = {}
+        for question_id in attempt.question_ids:
+            entry = self.store.load(self._key(attempt, question_id))
+            if entry is not None:
+                recorded[question_id] = entry[0] or None
+        return recorded
+
+    # Mark the attempt submitted; False if it already was
+    def submit(self, attempt):
+        marker = secrets.token_urlsafe(8)
+        return self.store.claim(self._key(attempt), marker, attempt.expires_at) == marker
+
+    def submitted(self, attempt):
+        return self.store.load(self._key(attempt)) is not None
+
+    # Undo submit(), e.g. when the score couldn't be saved
+    def reopen(self, attempt):
+        self.store.delete(self._key(attempt))
+
+    @staticmethod
+    def _key(attempt, question_id=None):
+        key = f"attempt.{attempt.attempt_id}"
+        return key if question_id is None else f"{key}.{question_id}"
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+
+# Local verification of Supabase (GoTrue) access tokens.
+#
+# Access tokens are JWTs. HS256 tokens are checked with the project's JWT secret
+# (SUPABASE_JWT_SECRET); RS256/ES256 tokens with the project's public signing keys,
+# fetched from GoTrue's JWKS endpoint and cached by key id. A token is only
+# decoded once: the verified claims are kept until the token expires, so later
+# checks are a dict lookup.
+#
+# Without a usable key (an HS256 token but no secret, a JWKS that couldn't be
+# fetched or has no key for the token's kid, or no `cryptography` to load it)
+# tokens are checked with GoTrue instead, and that result is memoized the same way.
+#
+# PyJWT is imported on first use so importing the app stays cheap.
+
+log = logging.getLogger(__name__)
+
+ALGORITHMS = ('HS256', 'RS256', 'ES256')
+AUDIENCE = 'authenticated'
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+# Public keys by key id, reloaded every `ttl` seconds, or sooner when a token names a key
+# we don't have (at most once per `min_refetch_interval`, so bad tokens can't make
+# every request fetch the key set). `fetch` returns the JWKS document. get() returns
+# None when there is no usable key for the kid.
+class SigningKeys:
+    def __init__(self, fetch, ttl=600.0, min_refetch_interval=30.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def get(self, kid):
+        key = self._keys.get(kid)
+        if key is not None and time.monotonic() - self._fetched_at < self.ttl:
+            return key
+        with self._lock:
+            key = self._keys.get(kid)
+            age = time.monotonic() - self._fetched_at if self._fetched_at is not None else None
+            if age is None or age >= self.ttl or (key is None and age >= self.min_refetch_interval):
+                self._load()
+                key = self._keys.get(kid)
+        return key
+
+    def _load(self):
+        import jwt
+
+        try:
+            document = self.fetch()
+        except Exception as e:
+            log.warning("Could not fetch signing keys: %s", e)
+            # Keep serving the keys we have (if any); retry after min_refetch_interval
+            self._fetched_at = time.monotonic() - self.ttl + self.min_refetch_interval
+            return
+        keys = {}
+        for data in document.get('keys', []):
+            try:
+                keys[data.get('kid')] = jwt.PyJWK(data)
+            except (jwt.PyJWKError, jwt.InvalidKeyError) as e:
+                # Unsupported key type, or `cryptography` isn't installed
+                log.warning("Skipping signing key %r: %s", data.get('kid'), e)
+                continue
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+
+class TokenVerifier:
+    def __init__(self, secret=None, signing_keys=None, remote_check=None, leeway=0, max_entries=10000):
+        self.secret = secret
+        self.signing_keys = signing_keys
+        self.remote_check = remote_check
+        self.leeway = leeway
+        self.max_entries = max_entries
+        self._verified = {}  # token -> claims
+        self._lock = threading.Lock()
+
+    # The token's claims; raises ExpiredToken or InvalidToken
+    def verify(self, token):
+        claims = self._verified.get(token)
+        if claims is not None:
+            if claims['exp'] + self.leeway > time.time():
+                return claims
+            self.forget(token)
+            raise ExpiredToken("Signature has expired")
+        claims = self._decode(token)
+        with self._lock:
+            if len(self._verified) >= self.max_entries:
+                self._evict()
+            self._verified[token] = claims
+        return claims
+
+    # Stop accepting a token before it expires, e.g. on logout
+    def forget(self, token):
+        with self._lock:
+            self._verified.pop(token, None)
+
+    # Drop expired tokens, then the oldest if that wasn't enough
+    def _evict(self):
+        now = time.time()
+        for token in [token for token, claims in self._verified.items() if claims['exp'] <= now]:
+            del self._verified[token]
+        while len(self._verified) >= self.max_entries:
+            del self._verified[next(iter(self._verified))]
+
+    def _decode(self, token):
+        import jwt
+
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm = header.get('alg')
+            if algorithm not in ALGORITHMS:
+                raise InvalidToken(f"Unsupported algorithm {algorithm!r}")
+            if algorithm == 'HS256':
+                key = self.secret
+            elif self.signing_keys is not None:
+                key = self.signing_keys.get(header.get('kid'))
+            else:
+                key = None
+            if key is None:
+                return self._check_remotely(token)
+            return jwt.decode(token, key, algorithms=[algorithm], audience=AUDIENCE, leeway=self.leeway,
+                              options={'require': ['exp', 'sub']})
+        except jwt.ExpiredSignatureError as e:
+            raise ExpiredToken(str(e)) from e
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(str(e)) from e
+
+    def _check_remotely(self, token):
+        import jwt
+
+        if self.remote_check is None:
+            raise InvalidToken("No key to verify the token with")
+        # The signature is checked by the auth server; the claims only supply the expiry
+        claims = jwt.decode(token, options={'verify_signature': False, 'require': ['exp', 'sub']})
+        if claims['exp'] + self.leeway <= time.time():
+            raise ExpiredToken("Signature has expired")
+        if not self.remote_check(token):
+            raise InvalidToken("Rejected by the auth server")
+        return claims
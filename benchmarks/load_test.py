@@ -0,0 +1,405 @@
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+# End-to-end load test of the quiz flow. Each virtual user signs up once, then
+# repeatedly plays a full session:
+#
+#   login -> /select-book -> /quiz/<id> -> 20 x /submit-answer -> /complete-quiz
+#         -> /results -> /leaderboard/<id> -> /global-leaderboard
+#
+# By default the app is started with run_waitress.py against an in-process stub of
+# the Supabase REST and Auth APIs (stub_supabase.py) with injected latency, so the
+# numbers reflect the app and the configured database latency, not the network:
+#
+#   python benchmarks/load_test.py --users 50 --duration 60 --latency-ms 20
+#   python benchmarks/load_test.py --storage sqlite --workers 4
+#   python benchmarks/load_test.py --url http://staging:5000 --users 10
+#   python benchmarks/load_test.py --compare load_test_results.json
+#
+# Prints throughput and p50/p95/p99 per route and writes them to --output as JSON
+# for comparing runs release to release.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROUTES = ('/signup', '/login', '/select-book', '/quiz/<id>', '/submit-answer', '/complete-quiz',
+          '/results', '/leaderboard/<id>', '/global-leaderboard')
+
+QUIZ_DATA = re.compile(r'const quizData = (.*?);\s*$', re.MULTILINE)
+ATTEMPT_TOKEN = re.compile(r'const attemptToken = (.*?);\s*$', re.MULTILINE)
+
+# Signs the stub's access tokens; the app gets it as SUPABASE_JWT_SECRET
+STUB_JWT_SECRET = 'load-test-jwt-secret'
+
+
+class FlowError(Exception):
+    pass
+
+
+# --- Measurements ---
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # route -> [seconds]
+        self.errors = {}  # route -> count
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    # A response that came back with the expected status but the wrong outcome
+    def fail(self, route):
+        with self._lock:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def session_done(self):
+        with self._lock:
+            self.sessions += 1
+
+    def summary(self, elapsed):
+        routes = {}
+        for route in sorted(self.samples, key=lambda r: ROUTES.index(r) if r in ROUTES else len(ROUTES)):
+            times = sorted(self.samples[route])
+            routes[route] = {
+                'requests': len(times),
+                'errors': self.errors.get(route, 0),
+                'rps': round(len(times) / elapsed, 2),
+                'mean_ms': round(sum(times) / len(times) * 1000, 2),
+                'p50_ms': percentile(times, 50),
+                'p95_ms': percentile(times, 95),
+                'p99_ms': percentile(times, 99),
+                'max_ms': round(times[-1] * 1000, 2),
+            }
+        requests = sum(route['requests'] for route in routes.values())
+        return {
+            'duration_seconds': round(elapsed, 2),
+            'sessions': self.sessions,
+            'sessions_per_second': round(self.sessions / elapsed, 2),
+            'requests': requests,
+            'errors': sum(route['errors'] for route in routes.values()),
+            'throughput_rps': round(requests / elapsed, 2),
+            'routes': routes,
+        }
+
+
+# Nearest-rank percentile of sorted seconds, in milliseconds
+def percentile(times, p):
+    if not times:
+        return None
+    index = max(0, min(len(times) - 1, -(-len(times) * p // 100) - 1))
+    return round(times[int(index)] * 1000, 2)
+
+
+# --- Virtual users ---
+
+class VirtualUser:
+    def __init__(self, base_url, recorder, book_ids, number, run_id, think_time=0.0, timeout=30.0):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.book_ids = book_ids
+        self.username = f"load{run_id}u{number}"
+        self.church_code = 'LOADTEST'
+        self.password = 'load-test-password'
+        self.think_time = think_time
+        self.timeout = timeout
+        self.client = None
+
+    def request(self, route, method, path, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.client.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.add(route, time.perf_counter() - started, ok=False)
+            raise FlowError(f"{route}: {e!r}")
+        ok = response.status_code in expect
+        self.recorder.add(route, time.perf_counter() - started, ok=ok)
+        if not ok:
+            raise FlowError(f"{route}: HTTP {response.status_code}")
+        if self.think_time:
+            time.sleep(random.uniform(0, 2 * self.think_time))
+        return response
+
+    def form(self):
+        return {'church_code': self.church_code, 'username': self.username, 'password': self.password}
+
+    def sign_up(self):
+        with httpx.Client(base_url=self.base_url, timeout=self.timeout) as self.client:
+            response = self.request('/signup', 'POST', '/signup', expect=(302,), data=self.form())
+            if '/signup' in response.headers.get('location', ''):
+                self.recorder.fail('/signup')
+                raise FlowError('/signup: rejected')
+
+    def session(self):
+        # A fresh cookie jar per session, like a returning visitor
+        with httpx.Client(base_url=self.base_url, timeout=self.timeout) as self.client:
+            response = self.request('/login', 'POST', '/login', expect=(302,), data=self.form())
+            if '/login' in response.headers.get('location', ''):
+                self.recorder.fail('/login')
+                raise FlowError('/login: rejected')
+
+            self.request('/select-book', 'GET', '/select-book')
+
+            book_id = random.choice(self.book_ids)
+            page = self.request('/quiz/<id>', 'GET', f'/quiz/{book_id}').text
+            data, token = QUIZ_DATA.search(page), ATTEMPT_TOKEN.search(page)
+            if not data or not token:
+                raise FlowError('/quiz/<id>: no questions in page')
+            questions, attempt_token = json.loads(data.group(1)), json.loads(token.group(1))
+
+            answers = []
+            for question in questions:
+                answer = random.choice('ABCD')
+                self.request('/submit-answer', 'POST', '/submit-answer', json={
+                    'attempt_token': attempt_token, 'question_id': question['id'], 'answer': answer})
+                answers.append({'question_id': question['id'], 'answer': answer})
+
+            result = self.request('/complete-quiz', 'POST', '/complete-quiz', json={
+                'attempt_token': attempt_token, 'answers': answers}).json()
+            self.request('/results', 'GET', result['redirect'])
+            self.request('/leaderboard/<id>', 'GET', f'/leaderboard/{book_id}')
+            self.request('/global-leaderboard', 'GET', '/global-leaderboard')
+        self.recorder.session_done()
+
+    def run(self, deadline, sessions, stop):
+        try:
+            self.sign_up()
+        except FlowError as e:
+            print(f"{self.username}: {e}", file=sys.stderr)
+            return
+        played = 0
+        while not stop.is_set() and time.monotonic() < deadline and (not sessions or played < sessions):
+            try:
+                self.session()
+            except (FlowError, KeyError, ValueError) as e:
+                print(f"{self.username}: {e}", file=sys.stderr)
+            played += 1
+
+
+# --- Environment under test ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def question_rows():
+    import question_import
+
+    rows = []
+    seen = set()
+    for path in question_import.expand_sources(question_import.DEFAULT_SOURCES):
+        for _, raw in question_import.read_source(path):
+            try:
+                row = question_import.validate(raw)
+            except question_import.InvalidRow:
+                continue
+            if row['content_hash'] not in seen:
+                seen.add(row['content_hash'])
+                rows.append(row)
+    return rows
+
+
+def start_stub(args, rows):
+    from sqlite_storage import BOOKS
+    from stub_supabase import StubSupabase
+
+    stub = StubSupabase(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, auth_latency_ms=args.auth_latency_ms,
+                        jwt_secret=STUB_JWT_SECRET, token_ttl=args.token_ttl)
+    stub.load_books(BOOKS)
+    if args.storage == 'supabase':
+        stub.load_questions(rows)
+        stub.seed_leaderboard(args.seed_players)
+    return stub, stub.start()
+
+
+def prepare_sqlite(path, rows, players):
+    from sqlite_storage import SqliteStorage
+
+    storage = SqliteStorage(path)
+    storage.upsert_questions(rows)
+    now = datetime.now(timezone.utc).isoformat()
+    storage.record_scores([{
+        'user_id': str(uuid.uuid4()), 'username': f'player{i}', 'book_id': book_id,
+        'score': random.randint(0, 20), 'achieved_at': now,
+    } for book_id in sorted({row['book_id'] for row in rows}) for i in range(players)])
+    storage.close()
+
+
+def start_app(args, supabase_url, workdir):
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'SUPABASE_URL': supabase_url,
+        'SUPABASE_KEY': 'load-test-key',
+        'SUPABASE_SERVICE_ROLE_KEY': 'load-test-service-key',
+        'SUPABASE_JWT_SECRET': STUB_JWT_SECRET,
+        'FLASK_SECRET_KEY': 'load-test-secret',
+        'QUESTION_SNAPSHOT_PATH': args.snapshot or os.path.join(workdir, 'missing.snap'),
+        'STORAGE_BACKEND': args.storage,
+        'SQLITE_PATH': os.path.join(workdir, 'quiz.db'),
+        'SESSION_SQLITE_PATH': os.path.join(workdir, 'sessions.db'),
+        'PYTHONUNBUFFERED': '1',
+    })
+    log = open(args.app_log, 'w') if args.app_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, 'run_waitress.py', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(args.workers), '--threads', str(args.threads)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"app exited with status {process.returncode}; see --app-log")
+        try:
+            if httpx.get(url + '/', timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("app did not become ready within 30s")
+
+
+def stop_app(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Reporting ---
+
+def print_summary(summary, previous=None):
+    print(f"{summary['sessions']} sessions, {summary['requests']} requests, {summary['errors']} errors "
+          f"in {summary['duration_seconds']}s: {summary['throughput_rps']} req/s, "
+          f"{summary['sessions_per_second']} sessions/s")
+    print(f"{'route':<22}{'reqs':>8}{'errs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for route, stats in summary['routes'].items():
+        line = (f"{route:<22}{stats['requests']:>8}{stats['errors']:>6}{stats['rps']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['max_ms']:>9}")
+        before = (previous or {}).get('routes', {}).get(route)
+        if before and before.get('p95_ms'):
+            change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            line += f"   p95 {change:+.0f}% vs {before['p95_ms']}"
+        print(line)
+    if previous:
+        change = (summary['throughput_rps'] - previous['throughput_rps']) / previous['throughput_rps'] * 100
+        print(f"throughput {change:+.0f}% vs {previous['throughput_rps']} req/s ({previous.get('git_commit')})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the full quiz flow.")
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run after ramp-up starts')
+    parser.add_argument('--sessions', type=int, default=0, help='stop each user after this many sessions')
+    parser.add_argument('--ramp-up', type=float, default=5, help='seconds over which users are started')
+    parser.add_argument('--think-ms', type=float, default=0, help='mean pause between a user\'s requests')
+    parser.add_argument('--url', help='test a running app instead of starting one (no stub is started)')
+    parser.add_argument('--book', type=int, action='append', help='book ids to play (default: every book with questions)')
+    parser.add_argument('--latency-ms', type=float, default=20, help='stub REST latency per call')
+    parser.add_argument('--jitter-ms', type=float, default=5, help='standard deviation of the stub latency')
+    parser.add_argument('--auth-latency-ms', type=float, help='stub Auth latency per call (default: --latency-ms)')
+    parser.add_argument('--token-ttl', type=int, default=3600,
+                        help='lifetime of stub access tokens in seconds (short values exercise token refresh)')
+    parser.add_argument('--seed-players', type=int, default=1000, help='existing leaderboard entries per book')
+    parser.add_argument('--storage', choices=('supabase', 'sqlite'), default='supabase',
+                        help='STORAGE_BACKEND for the app (sqlite keeps only Auth on the stub)')
+    parser.add_argument('--snapshot', help='QUESTION_SNAPSHOT_PATH for the app (default: none)')
+    parser.add_argument('--workers', type=int, default=1, help='run_waitress.py worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='run_waitress.py threads per worker')
+    parser.add_argument('--app-log', help='write the app\'s output to this file')
+    parser.add_argument('--output', default='load_test_results.json', help='results file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    stub = process = None
+    workdir = tempfile.mkdtemp(prefix='quiz-load-')
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            book_ids = args.book or [1]
+        else:
+            rows = question_rows()
+            book_ids = args.book or sorted({row['book_id'] for row in rows})
+            if args.storage == 'sqlite':
+                prepare_sqlite(os.path.join(workdir, 'quiz.db'), rows, args.seed_players)
+            stub, stub_url = start_stub(args, rows)
+            process, url = start_app(args, stub_url, workdir)
+
+        recorder = Recorder()
+        started_at = datetime.now(timezone.utc).isoformat()
+        stop = threading.Event()
+        run_id = uuid.uuid4().hex[:6]
+        started = time.monotonic()
+        deadline = started + args.duration
+        users = []
+        for number in range(args.users):
+            user = VirtualUser(url, recorder, book_ids, number, run_id, think_time=args.think_ms / 1000)
+            thread = threading.Thread(target=user.run, args=(deadline, args.sessions, stop), daemon=True)
+            users.append(thread)
+        print(f"Running {args.users} users against {url} for up to {args.duration:.0f}s...")
+        for thread in users:
+            thread.start()
+            time.sleep(args.ramp_up / max(1, args.users))
+        try:
+            for thread in users:
+                thread.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in users:
+                thread.join()
+        summary = recorder.summary(time.monotonic() - started)
+    finally:
+        if process is not None:
+            stop_app(process)
+        if stub is not None:
+            stub.stop()
+
+    summary = dict({
+        'started_at': started_at,
+        'git_commit': git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'app_log')},
+        'stub_calls': {f"{method} {name}": count for (method, name), count in sorted(stub.requests.items())}
+        if stub is not None else None,
+    }, **summary)
+    print_summary(summary, previous)
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Wrote {args.output}")
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
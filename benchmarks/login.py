@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+# Login and signup benchmark: runs the app in-process against the Supabase stub
+# (stub_supabase.py) and measures the latency of signup, login and a failed login,
+# and how many Supabase calls each one makes. Exits non-zero when login goes over
+# its latency budget or makes more backend calls than allowed:
+#
+#   python benchmarks/login.py --users 50 --auth-latency-ms 20 --budget-ms 40
+#
+# The stub's latency dominates, so keep the budget in step with --auth-latency-ms.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STUB_JWT_SECRET = 'login-benchmark-jwt-secret'
+
+
+def start(args, workdir):
+    from sqlite_storage import BOOKS
+    from stub_supabase import StubSupabase
+
+    stub = StubSupabase(latency_ms=args.latency_ms, jitter_ms=0, auth_latency_ms=args.auth_latency_ms,
+                        jwt_secret=STUB_JWT_SECRET)
+    stub.load_books(BOOKS)
+    url = stub.start()
+    os.environ.update({
+        'SUPABASE_URL': url,
+        'SUPABASE_KEY': 'login-benchmark-key',
+        'SUPABASE_SERVICE_ROLE_KEY': 'login-benchmark-service-key',
+        'SUPABASE_JWT_SECRET': STUB_JWT_SECRET,
+        'FLASK_SECRET_KEY': 'login-benchmark-secret',
+        'STORAGE_BACKEND': 'supabase',
+        'SESSION_BACKEND': 'memory',
+        'QUESTION_SNAPSHOT_PATH': os.path.join(workdir, 'missing.snap'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    import app
+
+    return stub, app.create_app()
+
+
+# Time one POST in a fresh client; returns (seconds, backend calls, response)
+def timed_post(app, stub, path, form):
+    client = app.test_client()
+    before = sum(stub.requests.values())
+    started = time.perf_counter()
+    response = client.post(path, data=form)
+    return time.perf_counter() - started, sum(stub.requests.values()) - before, response
+
+
+def summarize(name, samples):
+    from load_test import percentile
+
+    times = sorted(seconds for seconds, _ in samples)
+    calls = [n for _, n in samples]
+    return {
+        'flow': name,
+        'count': len(samples),
+        'p50_ms': percentile(times, 50),
+        'p95_ms': percentile(times, 95),
+        'max_ms': round(times[-1] * 1000, 2),
+        'calls_per_request': round(sum(calls) / len(calls), 2),
+        'max_calls': max(calls),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and guard login and signup latency.")
+    parser.add_argument('--users', type=int, default=30, help='accounts to create')
+    parser.add_argument('--logins', type=int, default=3, help='logins per account')
+    parser.add_argument('--latency-ms', type=float, default=20, help='stub REST latency per call')
+    parser.add_argument('--auth-latency-ms', type=float, default=20, help='stub Auth latency per call')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('LOGIN_BUDGET_MS', 40)),
+                        help='fail when the median login time exceeds this')
+    parser.add_argument('--max-login-calls', type=int, default=1, help='fail when a login makes more backend calls')
+    parser.add_argument('--max-signup-calls', type=int, default=2, help='fail when a signup makes more backend calls')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        stub, app = start(args, workdir)
+        run = uuid.uuid4().hex[:6]
+        accounts = [{'church_code': 'BENCH', 'username': f'login{run}u{i}', 'password': 'benchmark'}
+                    for i in range(args.users)]
+        signups, logins, failures = [], [], []
+        for form in accounts:
+            seconds, calls, response = timed_post(app, stub, '/signup', form)
+            if response.status_code != 302 or response.location != '/':
+                raise SystemExit(f"signup failed for {form['username']}: {response.status_code} {response.location}")
+            signups.append((seconds, calls))
+        for _ in range(args.logins):
+            for form in accounts:
+                seconds, calls, response = timed_post(app, stub, '/login', form)
+                if response.status_code != 302 or response.location != '/':
+                    raise SystemExit(f"login failed for {form['username']}: {response.status_code} {response.location}")
+                logins.append((seconds, calls))
+        for form in accounts:
+            seconds, calls, _ = timed_post(app, stub, '/login', dict(form, password='wrong-password'))
+            failures.append((seconds, calls))
+        stub.stop()
+
+    results = [summarize('signup', signups), summarize('login', logins), summarize('failed login', failures)]
+    print(f"{'flow':<14}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'calls':>7}")
+    for result in results:
+        print(f"{result['flow']:<14}{result['count']:>7}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+              f"{result['max_ms']:>9}{result['calls_per_request']:>7}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'budget_ms': args.budget_ms, 'results': results}, f, indent=2)
+
+    signup, login = results[0], results[1]
+    failures = []
+    if login['p50_ms'] > args.budget_ms:
+        failures.append(f"median login {login['p50_ms']} ms is over the {args.budget_ms:.0f} ms budget")
+    if login['max_calls'] > args.max_login_calls:
+        failures.append(f"a login made {login['max_calls']} backend calls (allowed {args.max_login_calls})")
+    if signup['max_calls'] > args.max_signup_calls:
+        failures.append(f"a signup made {signup['max_calls']} backend calls (allowed {args.max_signup_calls})")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Startup-time benchmark: times `import app; app.create_app()` in fresh
+# interpreters and exits non-zero when startup regresses. Run from the repository
+# root (e.g. in CI):
+#
+#   python benchmarks/startup.py --runs 10 --budget-ms 400
+#
+# Besides the time budget it checks that startup stays side-effect free: no heavy
+# client packages imported and nothing printed.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported until a request needs them
+FORBIDDEN_MODULES = ('supabase', 'realtime', 'storage3', 'supafunc', 'websockets', 'postgrest', 'gotrue', 'httpx')
+
+CHILD = r'''
+import contextlib, io, json, sys, time
+captured = io.StringIO()
+started = time.perf_counter()
+with contextlib.redirect_stdout(captured):
+    import app
+    app.create_app()
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'seconds': elapsed,
+    'modules': sorted(m for m in %r if m in sys.modules),
+    'output': captured.getvalue(),
+}))
+''' % (FORBIDDEN_MODULES,)
+
+
+def measure_once():
+    env = dict(os.environ)
+    # Configured, so the "not set" warning isn't mistaken for startup output
+    env.setdefault('SUPABASE_URL', 'http://127.0.0.1:54321')
+    env.setdefault('SUPABASE_KEY', 'benchmark.startup.key')
+    env.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark.startup.service-key')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and guard app startup time.")
+    parser.add_argument('--runs', type=int, default=int(os.environ.get('STARTUP_BENCH_RUNS', 10)))
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 400)),
+                        help='fail when the median startup time exceeds this')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    measure_once()  # warm the bytecode and filesystem caches
+    runs = [measure_once() for _ in range(args.runs)]
+    times_ms = sorted(run['seconds'] * 1000 for run in runs)
+    summary = {
+        'runs': args.runs,
+        'median_ms': round(statistics.median(times_ms), 1),
+        'min_ms': round(times_ms[0], 1),
+        'max_ms': round(times_ms[-1], 1),
+        'budget_ms': args.budget_ms,
+        'forbidden_modules': runs[-1]['modules'],
+        'output': runs[-1]['output'],
+    }
+    print(f"startup: median {summary['median_ms']} ms, min {summary['min_ms']} ms, "
+          f"max {summary['max_ms']} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    failures = []
+    if summary['median_ms'] > args.budget_ms:
+        failures.append(f"median startup {summary['median_ms']} ms is over the {args.budget_ms:.0f} ms budget")
+    if summary['forbidden_modules']:
+        failures.append(f"startup imported {', '.join(summary['forbidden_modules'])}")
+    if summary['output']:
+        failures.append(f"startup printed output: {summary['output']!r}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,492 @@
+import json
+import random
+import re
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import jwt
+
+# Stand-in for the Supabase REST (PostgREST) and Auth (GoTrue) APIs, for load
+# tests that should measure the app rather than the network. Tables live in
+# memory; every response is delayed by a configurable latency so runs can model
+# a nearby or a distant database.
+#
+#   stub = StubSupabase(latency_ms=20, jitter_ms=5)
+#   stub.load_questions(...); stub.seed_leaderboard(1000)
+#   url = stub.start()        # http://127.0.0.1:<port>
+#
+# Only the PostgREST features the app uses are implemented: column lists with
+# bible_books(name) embeds, eq/neq/gt/gte/lt/lte/in/is filters, or=(...) with
+# nested and(...), order, limit/offset, count=exact, insert/upsert and the
+# record_quiz_score()/record_quiz_scores() functions from sql/record_quiz_score.sql.
+#
+# Access tokens are HS256 JWTs signed with `jwt_secret` (pass it to the app as
+# SUPABASE_JWT_SECRET) that expire after `token_ttl` seconds; refresh tokens are
+# single use.
+
+# Upsert keys when the request gives no on_conflict
+PRIMARY_KEYS = {
+    'bible_books': ('id',),
+    'questions': ('id',),
+    'scores': ('id',),
+    'leaderboard': ('book_id', 'user_id'),
+    'user_book_stats': ('user_id', 'book_id'),
+    'profiles': ('id',),
+}
+
+UNIQUE = {
+    'questions': (('content_hash',),),
+    'profiles': (('id',), ('email',), ('church_code', 'username')),
+}
+
+# Embedded resources: table -> foreign key column on the referencing row
+EMBEDS = {'bible_books': 'book_id'}
+
+RESERVED_PARAMS = {'select', 'order', 'limit', 'offset', 'on_conflict', 'columns'}
+
+
+class StubError(Exception):
+    def __init__(self, status, message, code='PGRST000'):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+class StubSupabase:
+    def __init__(self, latency_ms=20.0, jitter_ms=0.0, auth_latency_ms=None, host='127.0.0.1', port=0,
+                 jwt_secret='stub-jwt-secret', token_ttl=3600):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.auth_latency_ms = latency_ms if auth_latency_ms is None else auth_latency_ms
+        self.host = host
+        self.port = port
+        self.jwt_secret = jwt_secret
+        self.token_ttl = token_ttl
+        self.tables = {name: [] for name in PRIMARY_KEYS}
+        self.users = {}  # email -> {'id', 'password', 'metadata'}
+        self.tokens = {}  # access token -> user id
+        self.refresh_tokens = {}  # refresh token -> email
+        self.requests = {}  # (method, table or endpoint) -> count
+        self._next_id = {name: 1 for name in PRIMARY_KEYS}
+        self._lock = threading.Lock()
+        self._server = None
+
+    # --- Seeding ---
+
+    def load_books(self, names):
+        for book_id, name in enumerate(names, start=1):
+            self._insert('bible_books', {'id': book_id, 'name': name})
+
+    def load_questions(self, rows):
+        for row in rows:
+            self._insert('questions', dict(row))
+
+    # `players` random leaderboard entries per book that has questions, so
+    # leaderboards and ranks are computed over realistic table sizes
+    def seed_leaderboard(self, players, max_score=20):
+        book_ids = sorted({row['book_id'] for row in self.tables['questions']})
+        now = datetime.now(timezone.utc).isoformat()
+        entries = [{
+            'user_id': str(uuid.uuid4()),
+            'username': f'player{i}',
+            'book_id': book_id,
+            'score': random.randint(0, max_score),
+            'achieved_at': now,
+        } for book_id in book_ids for i in range(players)]
+        self.record_quiz_scores({'p_rows': entries})
+
+    # --- Server ---
+
+    def start(self):
+        stub = self
+
+        class Handler(StubHandler):
+            pass
+        Handler.stub = stub
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='stub-supabase', daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def delay(self, auth=False):
+        mean = self.auth_latency_ms if auth else self.latency_ms
+        seconds = max(0.0, random.gauss(mean, self.jitter_ms) if self.jitter_ms else mean) / 1000
+        if seconds:
+            time.sleep(seconds)
+
+    def count(self, method, name):
+        key = (method, name)
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    # --- PostgREST ---
+
+    def select(self, table, params, count=False):
+        rows = self._table(table)
+        filters = [(key, value) for key, value in params if key not in RESERVED_PARAMS]
+        with self._lock:
+            matched = [row for row in rows if all(_match(row, key, value) for key, value in filters)]
+        for key, value in params:
+            if key == 'order':
+                for term in reversed(value.split(',')):
+                    column, _, direction = term.partition('.')
+                    matched.sort(key=lambda row: _sort_key(row.get(column)), reverse=direction.startswith('desc'))
+        total = len(matched)
+        params = dict(params)
+        offset = int(params.get('offset', 0))
+        limit = params.get('limit')
+        matched = matched[offset:offset + int(limit) if limit is not None else None]
+        columns = _split(params.get('select', '*'))
+        result = [self._project(row, columns) for row in matched]
+        return result, (offset, total if count else None)
+
+    def insert(self, table, body, upsert=False, on_conflict=None):
+        self._table(table)
+        rows = body if isinstance(body, list) else [body]
+        key_columns = tuple(on_conflict.split(',')) if on_conflict else PRIMARY_KEYS[table]
+        written = []
+        with self._lock:
+            for row in rows:
+                existing = None
+                if upsert and all(column in row for column in key_columns):
+                    existing = next((r for r in self.tables[table]
+                                     if all(str(r.get(c)) == str(row[c]) for c in key_columns)), None)
+                if existing is not None:
+                    existing.update(row)
+                    written.append(dict(existing))
+                    continue
+                for columns in UNIQUE.get(table, ()):
+                    if any(all(r.get(c) == row.get(c) for c in columns) for r in self.tables[table]):
+                        raise StubError(409, f'duplicate key value violates unique constraint '
+                                             f'"{table}_{"_".join(columns)}_key"', code='23505')
+                written.append(dict(self._insert(table, dict(row), locked=True)))
+        return written
+
+    def rpc(self, function, params):
+        handler = getattr(self, function, None)
+        if function not in ('record_quiz_score', 'record_quiz_scores') or handler is None:
+            raise StubError(404, f"Could not find the function public.{function}", code='PGRST202')
+        return handler(params)
+
+    def record_quiz_score(self, params):
+        self.record_quiz_scores({'p_rows': [{
+            'user_id': params['p_user_id'],
+            'book_id': params['p_book_id'],
+            'username': params['p_username'],
+            'score': params['p_score'],
+            'achieved_at': datetime.now(timezone.utc).isoformat(),
+        }]})
+        with self._lock:
+            return next(row['score'] for row in self.tables['leaderboard']
+                        if row['book_id'] == params['p_book_id'] and row['user_id'] == params['p_user_id'])
+
+    def record_quiz_scores(self, params):
+        with self._lock:
+            leaderboard = {(row['book_id'], row['user_id']): row for row in self.tables['leaderboard']}
+            stats = {(row['user_id'], row['book_id']): row for row in self.tables['user_book_stats']}
+            for entry in params['p_rows']:
+                book_id, user_id, score = int(entry['book_id']), entry['user_id'], int(entry['score'])
+                achieved_at = entry.get('achieved_at') or datetime.now(timezone.utc).isoformat()
+                self._insert('scores', {'user_id': user_id, 'book_id': book_id, 'score': score,
+                                        'achieved_at': achieved_at}, locked=True)
+                row = stats.get((user_id, book_id))
+                if row is None:
+                    row = stats[(user_id, book_id)] = self._insert('user_book_stats', {
+                        'user_id': user_id, 'book_id': book_id, 'best_score': score, 'total_score': 0,
+                        'attempts': 0, 'last_played_at': achieved_at}, locked=True)
+                row['best_score'] = max(row['best_score'], score)
+                row['total_score'] += score
+                row['attempts'] += 1
+                row['last_played_at'] = max(row['last_played_at'], achieved_at)
+                best = leaderboard.get((book_id, user_id))
+                if best is None:
+                    leaderboard[(book_id, user_id)] = self._insert('leaderboard', {
+                        'book_id': book_id, 'user_id': user_id, 'username': entry.get('username'),
+                        'score': score}, locked=True)
+                elif score > best['score']:
+                    best.update(score=score, username=entry.get('username'))
+        return None
+
+    # --- GoTrue ---
+
+    def sign_up(self, body):
+        email, password = body.get('email'), body.get('password')
+        with self._lock:
+            if email in self.users:
+                raise StubError(422, 'User already registered', code='user_already_exists')
+            self.users[email] = {'id': str(uuid.uuid4()), 'password': password, 'metadata': body.get('data') or {}}
+        return self._session(email)
+
+    # POST /auth/v1/admin/users
+    def admin_create_user(self, body):
+        email = body.get('email')
+        with self._lock:
+            if email in self.users:
+                raise StubError(422, 'A user with this email address has already been registered', code='email_exists')
+            self.users[email] = {'id': str(uuid.uuid4()), 'password': body.get('password'),
+                                 'metadata': body.get('user_metadata') or {}}
+        return self._user(email)
+
+    def sign_in(self, body):
+        user = self.users.get(body.get('email'))
+        if user is None or user['password'] != body.get('password'):
+            raise StubError(400, 'Invalid login credentials', code='invalid_credentials')
+        return self._session(body['email'])
+
+    def refresh(self, body):
+        with self._lock:
+            email = self.refresh_tokens.pop(body.get('refresh_token'), None)
+        if email is None:
+            raise StubError(400, 'Invalid Refresh Token: Refresh Token Not Found', code='refresh_token_not_found')
+        return self._session(email)
+
+    def user(self, token):
+        with self._lock:
+            user_id = self.tokens.get(token)
+        email = next((email for email, user in self.users.items() if user['id'] == user_id), None)
+        if email is None:
+            raise StubError(403, 'invalid JWT', code='bad_jwt')
+        return self._user(email)
+
+    def sign_out(self, token):
+        with self._lock:
+            self.tokens.pop(token, None)
+
+    def _session(self, email):
+        user_id = self.users[email]['id']
+        expires_at = int(time.time()) + self.token_ttl
+        token = jwt.encode({'sub': user_id, 'aud': 'authenticated', 'role': 'authenticated', 'email': email,
+                            'exp': expires_at, 'iat': int(time.time()), 'session_id': str(uuid.uuid4())},
+                           self.jwt_secret, algorithm='HS256')
+        refresh_token = secrets.token_hex(16)
+        with self._lock:
+            self.tokens[token] = user_id
+            self.refresh_tokens[refresh_token] = email
+        return {
+            'access_token': token,
+            'refresh_token': refresh_token,
+            'token_type': 'bearer',
+            'expires_in': self.token_ttl,
+            'expires_at': expires_at,
+            'user': self._user(email),
+        }
+
+    def _user(self, email):
+        return {
+            'id': self.users[email]['id'],
+            'aud': 'authenticated',
+            'role': 'authenticated',
+            'email': email,
+            'app_metadata': {'provider': 'email'},
+            'user_metadata': self.users[email]['metadata'],
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        }
+
+    # --- Helpers ---
+
+    def _table(self, table):
+        if table not in self.tables:
+            raise StubError(404, f'relation "public.{table}" does not exist', code='42P01')
+        return self.tables[table]
+
+    def _insert(self, table, row, locked=False):
+        if not locked:
+            with self._lock:
+                return self._insert(table, row, locked=True)
+        if 'id' in PRIMARY_KEYS[table] and row.get('id') is None and table != 'profiles':
+            row['id'] = self._next_id[table]
+        if isinstance(row.get('id'), int):
+            self._next_id[table] = max(self._next_id[table], row['id'] + 1)
+        self.tables[table].append(row)
+        return row
+
+    def _project(self, row, columns):
+        if columns == ['*']:
+            return dict(row)
+        result = {}
+        for column in columns:
+            embed = re.match(r'(\w+)\((.*)\)$', column)
+            if embed:
+                table, inner = embed.groups()
+                key = row.get(EMBEDS.get(table))
+                target = next((r for r in self.tables[table] if r['id'] == key), None)
+                result[table] = self._project(target, _split(inner)) if target else None
+            else:
+                result[column] = row.get(column)
+        return result
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without TCP_NODELAY the body waits
+    # for the client's delayed ACK and every call gains ~40 ms
+    disable_nagle_algorithm = True
+    stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_HEAD(self):
+        self._handle('HEAD')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        stub = self.stub
+        parts = urlsplit(self.path)
+        params = parse_qsl(parts.query, keep_blank_values=True)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        prefer = self.headers.get('Prefer', '')
+        path = parts.path.rstrip('/')
+        try:
+            if path.startswith('/auth/v1/'):
+                endpoint = path[len('/auth/v1/'):]
+                stub.count(method, f'auth/{endpoint}')
+                stub.delay(auth=True)
+                if endpoint == 'signup':
+                    return self._send(200, stub.sign_up(body or {}))
+                bearer = (self.headers.get('Authorization') or '').removeprefix('Bearer ')
+                if endpoint == 'token':
+                    if dict(params).get('grant_type') == 'refresh_token':
+                        return self._send(200, stub.refresh(body or {}))
+                    return self._send(200, stub.sign_in(body or {}))
+                if endpoint == 'admin/users':
+                    return self._send(200, stub.admin_create_user(body or {}))
+                if endpoint == 'user':
+                    return self._send(200, stub.user(bearer))
+                if endpoint == '.well-known/jwks.json':
+                    return self._send(200, {'keys': []})  # HS256 keys are never published
+                if endpoint == 'logout':
+                    stub.sign_out(bearer)
+                    return self._send(204, None)
+                raise StubError(404, f'unknown auth endpoint {endpoint}')
+
+            if not path.startswith('/rest/v1/'):
+                raise StubError(404, f'unknown path {path}')
+            name = path[len('/rest/v1/'):]
+            stub.count(method, name)
+            stub.delay()
+            if name.startswith('rpc/'):
+                return self._send(200, stub.rpc(name[4:], body or {}))
+            if method in ('GET', 'HEAD'):
+                rows, (offset, total) = stub.select(name, params, count='count=' in prefer)
+                end = offset + len(rows) - 1 if rows else offset
+                content_range = f"{offset}-{end}/{total if total is not None else '*'}"
+                return self._send(200, rows, {'Content-Range': content_range}, head=method == 'HEAD')
+            upsert = 'resolution=merge-duplicates' in prefer
+            written = stub.insert(name, body, upsert=upsert, on_conflict=dict(params).get('on_conflict'))
+            return self._send(201, written if 'return=representation' in prefer else None)
+        except StubError as e:
+            if path.startswith('/auth/v1/'):
+                # GoTrue's error shape
+                return self._send(e.status, {'code': e.status, 'error_code': e.code, 'msg': str(e)})
+            self._send(e.status, {'code': e.code, 'message': str(e), 'details': None, 'hint': None})
+        except Exception as e:
+            self._send(500, {'code': 'XX000', 'message': repr(e), 'details': None, 'hint': None})
+
+    def _send(self, status, payload, headers=None, head=False):
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if data and not head:
+            self.wfile.write(data)
+
+
+# --- PostgREST query language ---
+
+# Split on commas outside parentheses and double quotes
+def _split(text):
+    parts, depth, quoted, current = [], 0, False, []
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == '(':
+            depth += 1
+        elif not quoted and ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0 and not quoted:
+            parts.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    if current:
+        parts.append(''.join(current).strip())
+    return parts
+
+
+def _match(row, key, value):
+    if key in ('or', 'and'):
+        terms = _split(value[1:-1])
+        results = (_match_term(row, term) for term in terms)
+        return any(results) if key == 'or' else all(results)
+    return _compare(row.get(key), value)
+
+
+def _match_term(row, term):
+    nested = re.match(r'(and|or)(\(.*\))$', term)
+    if nested:
+        return _match(row, nested.group(1), nested.group(2))
+    column, _, condition = term.partition('.')
+    return _compare(row.get(column), condition)
+
+
+def _compare(actual, condition):
+    op, _, raw = condition.partition('.')
+    if op == 'is':
+        return actual is None if raw == 'null' else str(actual).lower() == raw
+    if op == 'in':
+        return any(_equal(actual, item) for item in _split(raw.strip('()')))
+    if actual is None:
+        return False
+    expected = _coerce(actual, raw)
+    return {
+        'eq': lambda: actual == expected,
+        'neq': lambda: actual != expected,
+        'gt': lambda: actual > expected,
+        'gte': lambda: actual >= expected,
+        'lt': lambda: actual < expected,
+        'lte': lambda: actual <= expected,
+    }[op]()
+
+
+def _equal(actual, raw):
+    return actual is not None and actual == _coerce(actual, raw)
+
+
+def _coerce(actual, raw):
+    raw = raw.strip('"')
+    if isinstance(actual, bool):
+        return raw == 'true'
+    if isinstance(actual, int):
+        return int(raw)
+    if isinstance(actual, float):
+        return float(raw)
+    return raw
+
+
+def _sort_key(value):
+    return (value is None, value if value is not None else 0)
@@ -0,0 +1,124 @@
+import threading
+
+# Supabase access for the app without the `supabase` package: only the PostgREST
+# and GoTrue clients are used, and they (and their imports) are created on first
+# use so importing the app and spawning workers stays cheap.
+#
+# SupabaseClients duck-types the parts of supabase.Client the app uses: table(),
+# rpc() and auth.
+#
+# The server reads and writes the tables on behalf of the users it has
+# authenticated, so PostgREST requests are made with the service role key when one
+# is given: row level security would reject the app's writes (profiles on signup,
+# scores and the leaderboard) under the public anon key, where auth.uid() is null.
+# GoTrue is always called with the project key.
+
+
+class SupabaseClients:
+    def __init__(self, url, key, service_key=None, repository_timeout=10.0):
+        self.url = url
+        self.key = key
+        self.service_key = service_key
+        self.rest_key = service_key or key
+        self.repository_timeout = repository_timeout
+        self.headers = {'apikey': key, 'Authorization': f'Bearer {key}'}
+        self.rest_headers = {'apikey': self.rest_key, 'Authorization': f'Bearer {self.rest_key}'}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._rest = None
+        self._auth = None
+        self._repo = None
+
+    # One tuned HTTP connection pool for all PostgREST/GoTrue traffic; sized and
+    # timed out via HTTP_* environment variables (see http_pool.PoolConfig)
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    from http_pool import SharedPool
+                    self._pool = SharedPool()
+        return self._pool
+
+    @property
+    def rest(self):
+        if self._rest is None:
+            pool = self.pool
+            with self._lock:
+                if self._rest is None:
+                    from postgrest import SyncPostgrestClient
+                    from postgrest.utils import SyncClient
+
+                    class PooledPostgrestClient(SyncPostgrestClient):
+                        def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+                            return pool.client(SyncClient, base_url=base_url, headers=headers, follow_redirects=True)
+
+                    self._rest = PooledPostgrestClient(f"{self.url}/rest/v1", headers=self.rest_headers)
+        return self._rest
+
+    # The server signs users in on their behalf, so sessions are never refreshed
+    # in the background or shared through storage.
+    @property
+    def auth(self):
+        if self._auth is None:
+            pool = self.pool
+            with self._lock:
+                if self._auth is None:
+                    from gotrue import SyncGoTrueClient
+                    from gotrue.http_clients import SyncClient
+
+                    self._auth = SyncGoTrueClient(
+                        url=f"{self.url}/auth/v1",
+                        headers=self.headers,
+                        auto_refresh_token=False,
+                        persist_session=False,
+                        http_client=pool.client(SyncClient, follow_redirects=True),
+                    )
+        return self._auth
+
+    # Blocking facade over async_repo.AsyncRepository; its event loop thread is
+    # started on first use.
+    @property
+    def repo(self):
+        if self._repo is None:
+            pool = self.pool
+            with self._lock:
+                if self._repo is None:
+                    from async_repo import AsyncRepository, SyncRepository
+                    self._repo = SyncRepository(lambda: AsyncRepository(self.url, self.key, pool=pool,
+                                                                        rest_key=self.rest_key),
+                                                timeout=self.repository_timeout)
+        return self._repo
+
+    def table(self, table_name):
+        return self.rest.from_(table_name)
+
+    def rpc(self, fn, params=None):
+        return self.rest.rpc(fn, params or {})
+
+    # GoTrue's public signing keys (JWKS), for verifying access tokens locally. The
+    # client is not closed: it runs on the shared pool's transport.
+    def fetch_jwks(self):
+        client = self.pool.client(headers={'apikey': self.key})
+        response = client.get(f"{self.url}/auth/v1/.well-known/jwks.json")
+        response.raise_for_status()
+        return response.json()
+
+    # Whether GoTrue accepts an access token; for tokens that can't be verified locally
+    def accepts_token(self, token):
+        from gotrue.errors import AuthApiError
+
+        try:
+            response = self.auth.get_user(token)
+        except AuthApiError:
+            return False
+        return response is not None and response.user is not None
+
+
+# Stands in for the SyncRepository until a view first calls into it.
+class LazyRepository:
+    def __init__(self, clients):
+        self._clients = clients
+
+    def __getattr__(self, name):
+        return getattr(self._clients.repo, name)
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+
+import httpx
+
+import metrics
+
+# Tuned, shared HTTP connection pool for PostgREST and GoTrue traffic.
+#
+# Every PostgREST/GoTrue client (see clients.py and async_repo.py) is built on one
+# shared transport, so all waitress threads reuse the same keep-alive connections,
+# with limits and timeouts taken from the environment.
+
+# Upper bounds (seconds) of the pool-wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float('inf'))
+
+
+class PoolConfig:
+    def __init__(self, max_connections, max_keepalive_connections, keepalive_expiry,
+                 http2, connect_timeout, read_timeout, write_timeout, pool_timeout):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+
+    # Defaults are sized from the waitress thread count plus the query pool workers,
+    # the most requests this process can have in flight at once.
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        threads = int(environ.get("WAITRESS_THREADS", 4))
+        query_workers = int(environ.get("QUERY_POOL_WORKERS", 16))
+        max_connections = int(environ.get("HTTP_MAX_CONNECTIONS", threads + query_workers))
+        return cls(
+            max_connections=max_connections,
+            max_keepalive_connections=int(environ.get("HTTP_MAX_KEEPALIVE", max_connections)),
+            keepalive_expiry=float(environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", 30)),
+            http2=environ.get("HTTP2", "1").lower() in ("1", "true", "yes"),
+            connect_timeout=float(environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", 3)),
+            read_timeout=float(environ.get("HTTP_READ_TIMEOUT_SECONDS", 10)),
+            write_timeout=float(environ.get("HTTP_WRITE_TIMEOUT_SECONDS", 10)),
+            pool_timeout=float(environ.get("HTTP_POOL_TIMEOUT_SECONDS", 5)),
+        )
+
+    def limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self):
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+# Time requests spend waiting for a pooled connection: from handing the request to
+# the transport until a connection starts connecting or sending headers.
+class PoolWaitStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.buckets = [0] * len(WAIT_BUCKETS)
+
+    def observe(self, wait):
+        with self._lock:
+            self.requests += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if wait <= bound:
+                    self.buckets[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'total_wait_seconds': self.total_wait,
+                'mean_wait_seconds': self.total_wait / self.requests if self.requests else 0.0,
+                'max_wait_seconds': self.max_wait,
+                'buckets': dict(zip(WAIT_BUCKETS, self.buckets)),
+            }
+
+
+# httpcore trace events that mean the request now owns a connection
+_ACQUIRED_EVENTS = (
+    'connection.connect_tcp.started',
+    'http11.send_request_headers.started',
+    'http2.send_request_headers.started',
+)
+
+
+class _WaitTimer:
+    def __init__(self, stats):
+        self.stats = stats
+        self.started = time.perf_counter()
+        self.done = False
+
+    def event(self, event_name):
+        if not self.done and event_name in _ACQUIRED_EVENTS:
+            self.done = True
+            wait = time.perf_counter() - self.started
+            self.stats.observe(wait)
+            metrics.pool_wait.observe(wait)
+
+
+# Per-call metrics (see metrics.py), timed until the response headers arrive
+def _observe(request, status, started):
+    metrics.observe_backend_call(request.method, request.url.path, request.headers.get('prefer', ''),
+                                 status, time.perf_counter() - started)
+
+
+class _SharedTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request):
+        timer = _WaitTimer(self._stats)
+        inner = request.extensions.get('trace')
+
+        def trace(event_name, info):
+            timer.event(event_name)
+            if inner is not None:
+                inner(event_name, info)
+        request.extensions['trace'] = trace
+        status = 'error'
+        try:
+            response = super().handle_request(request)
+            status = response.status_code
+            return response
+        finally:
+            _observe(request, status, timer.started)
+
+    # Many clients share this transport; it is closed once via SharedPool.close(),
+    # not when one of them is closed or used as a context manager
+    def close(self):
+        pass
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        pass
+
+    def close_pool(self):
+        super().close()
+
+
+class _SharedAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request):
+        timer = _WaitTimer(self._stats)
+        inner = request.extensions.get('trace')
+
+        async def trace(event_name, info):
+            timer.event(event_name)
+            if inner is not None:
+                await inner(event_name, info)
+        request.extensions['trace'] = trace
+        status = 'error'
+        try:
+            response = await super().handle_async_request(request)
+            status = response.status_code
+            return response
+        finally:
+            _observe(request, status, timer.started)
+
+    async def aclose(self):
+        pass
+
+    async def __aexit__(self, exc_type=None, exc_value=None, traceback=None):
+        pass
+
+    async def aclose_pool(self):
+        await super().aclose()
+
+
+class SharedPool:
+    def __init__(self, config=None):
+        self.config = config or PoolConfig.from_env()
+        self.wait_stats = PoolWaitStats()
+        self.transport = _SharedTransport(
+            self.wait_stats,
+            limits=self.config.limits(),
+            http2=self.config.http2,
+        )
+        self._async_transport = None
+
+    # The async transport must be created on the event loop that will use it
+    def async_transport(self):
+        if self._async_transport is None:
+            self._async_transport = _SharedAsyncTransport(
+                self.wait_stats,
+                limits=self.config.limits(),
+                http2=self.config.http2,
+            )
+        return self._async_transport
+
+    def client(self, client_class=httpx.Client, **kwargs):
+        kwargs.setdefault('timeout', self.config.timeout())
+        return client_class(transport=self.transport, **kwargs)
+
+    def async_client(self, client_class=httpx.AsyncClient, **kwargs):
+        kwargs.setdefault('timeout', self.config.timeout())
+        return client_class(transport=self.async_transport(), **kwargs)
+
+    def stats(self):
+        stats = self.wait_stats.snapshot()
+        stats['max_connections'] = self.config.max_connections
+        stats['http2'] = self.config.http2
+        return stats
+
+    def close(self):
+        self.transport.close_pool()
@@ -0,0 +1,161 @@
+import bisect
+import itertools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+# Top-K board kept sorted by (-score, arrival order), so ties keep the order the
+# database returned them in and later finishers rank below earlier ones.
+class TopK:
+    def __init__(self, k):
+        self.k = k
+        self.loaded_at = 0.0
+        self._keys = []
+        self._entries = []
+        self._members = {}  # (book_id, user_id) -> sort key
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, entries):
+        self._keys = []
+        self._entries = []
+        self._members = {}
+        for entry in entries[:self.k]:
+            key = (-entry['score'], next(self._seq))
+            self._keys.append(key)
+            self._entries.append(entry)
+            self._members[(entry.get('book_id'), entry.get('user_id'))] = key
+        self.loaded_at = time.monotonic()
+
+    # Offer a new best score. Returns True when the board changed.
+    def offer(self, entry):
+        member = (entry.get('book_id'), entry.get('user_id'))
+        old_key = self._members.get(member)
+        if old_key is not None and -old_key[0] >= entry['score']:
+            return False
+        if old_key is None and len(self._keys) >= self.k and entry['score'] <= -self._keys[-1][0]:
+            return False
+
+        if old_key is not None:
+            index = bisect.bisect_left(self._keys, old_key)
+            del self._keys[index]
+            del self._entries[index]
+        key = (-entry['score'], next(self._seq))
+        index = bisect.bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._entries.insert(index, entry)
+        self._members[member] = key
+
+        if len(self._keys) > self.k:
+            self._keys.pop()
+            dropped = self._entries.pop()
+            self._members.pop((dropped.get('book_id'), dropped.get('user_id')), None)
+        return True
+
+    def rows(self):
+        return list(self._entries)
+
+
+# In-memory top-K snapshots of the per-book and global leaderboards.
+#
+# Boards are loaded on first view, updated in place by record() when a score is
+# stored, and resynced from the database every `resync_interval` seconds. Each
+# worker process keeps its own snapshot, so scores stored by other workers show up
+# after at most one resync interval.
+class LeaderboardCache:
+    def __init__(self, book_k=10, global_k=20, resync_interval=30):
+        self.book_k = book_k
+        self.global_k = global_k
+        self.resync_interval = resync_interval
+        self._books = {}
+        self._global = TopK(global_k)
+        self._lock = threading.Lock()
+        self._book_names = {}
+        self.resyncs = 0
+
+    def book(self, storage, book_id):
+        board = self._books.get(book_id)
+        if board is None:
+            with self._lock:
+                board = self._books.setdefault(book_id, TopK(self.book_k))
+        self._maybe_resync(board, lambda: self._fetch_book(storage, book_id))
+        return board.rows()
+
+    def global_board(self, storage):
+        self._maybe_resync(self._global, lambda: self._fetch_global(storage))
+        return self._global.rows()
+
+    # Apply a stored score to the snapshots (keep-max, like the leaderboard table).
+    def record(self, book_id, user_id, username, score):
+        entry = {'book_id': book_id, 'user_id': user_id, 'username': username, 'score': score}
+        with self._lock:
+            board = self._books.get(book_id)
+            if board is not None and board.loaded_at:
+                board.offer(entry)
+
+            book_name = self._book_names.get(book_id)
+            global_entry = dict(entry, bible_books={'name': book_name} if book_name else None)
+            if self._global.loaded_at and self._global.offer(global_entry) and book_name is None:
+                # Book name unknown here; make the next view resync the global board
+                self._global.loaded_at = time.monotonic() - self.resync_interval
+
+    def invalidate(self, book_id=None):
+        with self._lock:
+            if book_id is None:
+                self._books.clear()
+                self._global.loaded_at = 0.0
+            else:
+                self._books.pop(book_id, None)
+
+    # Seconds since the board was last resynced from the database, or None if it
+    # has never been loaded.
+    def age(self, book_id=None):
+        board = self._global if book_id is None else self._books.get(book_id)
+        if board is None or not board.loaded_at:
+            return None
+        return time.monotonic() - board.loaded_at
+
+    def stats(self):
+        return {
+            'books': len(self._books),
+            'resyncs': self.resyncs,
+            'global_age': self.age(),
+            'oldest_book_age': max((self.age(book_id) or 0.0 for book_id in list(self._books)), default=None),
+        }
+
+    def _maybe_resync(self, board, fetch):
+        loaded_at = board.loaded_at
+        if loaded_at and time.monotonic() - loaded_at < self.resync_interval:
+            return
+        with self._lock:
+            # Another thread resynced while we waited
+            if board.loaded_at != loaded_at:
+                return
+            # Serve the stale snapshot while one thread resyncs, unless there is none
+            if loaded_at:
+                board.loaded_at = time.monotonic()
+        try:
+            rows = fetch()
+        except Exception as e:
+            if not loaded_at:
+                raise
+            log.warning("Leaderboard resync failed, serving stale snapshot: %s", e)
+            return
+        with self._lock:
+            board.load(rows)
+            self.resyncs += 1
+
+    def _fetch_book(self, storage, book_id):
+        return storage.top_for_book(book_id, self.book_k)
+
+    def _fetch_global(self, storage):
+        rows = storage.top_global(self.global_k)
+        for row in rows:
+            if row.get('bible_books'):
+                self._book_names[row['book_id']] = row['bible_books'].get('name')
+        return rows
@@ -0,0 +1,427 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Bulk onboarding of a church's members from a CSV with church_code, username and
+# password columns:
+#
+#   python member_import.py members.csv
+#   python member_import.py members.csv --workers 16 --failures failed.csv
+#   python member_import.py members.csv --dry-run      # validate only
+#
+# Each row becomes a Supabase Auth user, created by a bounded pool of workers, and
+# a 'profiles' row; profiles are inserted in multi-row batches as users come back.
+# Rows that can't be created (invalid, repeated in the file, or a username that
+# already exists for the church code) are reported with their line number and the
+# rest still go in.
+#
+# Progress is journaled to a checkpoint file (one JSON line per created user and
+# per inserted profile), so running the same CSV again after an interruption picks
+# up where it stopped. An Auth user created just before the process died, too late
+# to be journaled, is picked up again if it has no profile and accepts the password
+# from the CSV. Users are created with the Auth admin API when
+# SUPABASE_SERVICE_ROLE_KEY is set (no confirmation email, no rate limit on
+# sign-ups), otherwise with the public sign-up. The same import runs behind
+# POST /admin/members/import (see app.py).
+
+CHECKPOINT_DIR = '.member_import'
+BATCH_SIZE = 100
+WORKERS = 8
+
+FIELDS = ('church_code', 'username', 'password')
+MIN_PASSWORD_LENGTH = 6
+MAX_REPORTED_ERRORS = 20
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+# The Auth email for a member; must match signup and login in app.py
+def member_email(church_code, username):
+    return f"{username}-{church_code}@quizapp.local"
+
+
+class Member:
+    def __init__(self, line, church_code, username, password):
+        self.line = line
+        self.church_code = church_code
+        self.username = username
+        self.password = password
+        self.email = member_email(church_code, username)
+
+    # Auth compares emails case-insensitively
+    @property
+    def key(self):
+        return self.email.lower()
+
+    def profile(self, user_id):
+        return {'id': user_id, 'church_code': self.church_code, 'username': self.username,
+                'email': self.email, 'phone': None}
+
+
+def validate(line, raw):
+    values = {}
+    for field in FIELDS:
+        value = raw.get(field)
+        value = '' if value is None else str(value).strip()
+        if not value:
+            raise InvalidRow(f"missing {field}")
+        values[field] = value
+    for field in ('church_code', 'username'):
+        if '@' in values[field] or any(ch.isspace() for ch in values[field]):
+            raise InvalidRow(f"{field} must not contain spaces or '@': {values[field]!r}")
+    if len(values['password']) < MIN_PASSWORD_LENGTH:
+        raise InvalidRow(f"password is shorter than {MIN_PASSWORD_LENGTH} characters")
+    return Member(line, values['church_code'], values['username'], values['password'])
+
+
+# Yields (line_number, row dict) from an open text file
+def read_csv(f):
+    reader = csv.DictReader(f)
+    if not reader.fieldnames or not set(FIELDS) <= {name.strip() for name in reader.fieldnames}:
+        raise InvalidRow(f"expected a CSV header with {', '.join(FIELDS)}, got {reader.fieldnames}")
+    reader.fieldnames = [name.strip() for name in reader.fieldnames]
+    for row in reader:
+        yield reader.line_num, row
+
+
+# An existing account: from the Auth admin API, the public sign-up, or the
+# profiles unique constraint
+def is_duplicate(error):
+    message = str(error)
+    return getattr(error, 'code', None) in ('email_exists', 'user_already_exists') \
+        or "already been registered" in message or "User already registered" in message \
+        or "duplicate key value violates unique constraint" in message or "23505" in message \
+        or "UNIQUE constraint failed" in message
+
+
+def describe(error):
+    if is_duplicate(error):
+        return "username already exists for this church code"
+    return str(error) or type(error).__name__
+
+
+# --- Checkpoint ---
+
+# Append-only journal: {"key": ..., "user_id": ...} once the Auth user exists and
+# {"key": ..., "done": true} once its profile is inserted. A torn last line (the
+# process died mid-write) is ignored.
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.users = {}
+        self.done = set()
+        self._lock = threading.Lock()
+        self._file = None
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('done'):
+                        self.done.add(entry['key'])
+                    elif entry.get('user_id'):
+                        self.users[entry['key']] = entry['user_id']
+        except FileNotFoundError:
+            pass
+
+    def user_created(self, key, user_id):
+        self.users[key] = user_id
+        self._write([{'key': key, 'user_id': user_id}])
+
+    def profiles_inserted(self, keys):
+        self.done.update(keys)
+        self._write([{'key': key, 'done': True} for key in keys])
+
+    def _write(self, entries):
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def checkpoint_path(data, directory=CHECKPOINT_DIR):
+    return os.path.join(directory, hashlib.sha256(data).hexdigest()[:32] + '.jsonl')
+
+
+# --- Importing ---
+
+# Auth users for members. `auth` is a GoTrue client; with admin=True it must carry
+# the service role key.
+class AuthUsers:
+    def __init__(self, auth, admin=False):
+        self.auth = auth
+        self.admin = admin
+
+    # Create the member's user and return its id
+    def create(self, member):
+        metadata = {'username': member.username, 'church_code': member.church_code}
+        if self.admin:
+            response = self.auth.admin.create_user({
+                'email': member.email,
+                'password': member.password,
+                'email_confirm': True,
+                'user_metadata': metadata,
+            })
+        else:
+            response = self.auth.sign_up({
+                'email': member.email,
+                'password': member.password,
+                'options': {'data': metadata},
+            })
+        if not response.user or not response.user.id:
+            raise RuntimeError("Auth returned no user")
+        return str(response.user.id)
+
+    # The id of an existing user, if it takes the member's password
+    def sign_in(self, member):
+        response = self.auth.sign_in_with_password({'email': member.email, 'password': member.password})
+        return str(response.user.id) if response.user else None
+
+
+class ImportReport:
+    def __init__(self):
+        self.read = 0
+        self.created = 0
+        self.resumed = 0
+        self.skipped = 0
+        self.failed = []  # (line, church_code, username, reason)
+        self.seconds = 0.0
+
+    def fail(self, line, church_code, username, reason):
+        self.failed.append((line, church_code, username, reason))
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'read': self.read,
+            'created': self.created,
+            'resumed': self.resumed,
+            'skipped': self.skipped,
+            'failed': len(self.failed),
+            'failures': [{'line': line, 'church_code': church_code, 'username': username, 'reason': reason}
+                         for line, church_code, username, reason in self.failed],
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class MemberImporter:
+    def __init__(self, storage, users, workers=WORKERS, batch_size=BATCH_SIZE, dry_run=False):
+        self.storage = storage
+        self.users = users
+        self.workers = workers
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    # Import the rows of an open CSV file. Rows already done according to the
+    # checkpoint are skipped; rows whose Auth user exists but whose profile doesn't
+    # only get the profile.
+    def run(self, f, checkpoint=None):
+        report = ImportReport()
+        started = time.perf_counter()
+        checkpoint = checkpoint or Checkpoint(os.devnull)
+        try:
+            members = self._read(f, report)
+            if not self.dry_run:
+                self._load(members, report, checkpoint)
+        finally:
+            checkpoint.close()
+            report.seconds = time.perf_counter() - started
+        report.failed.sort()
+        return report
+
+    def _read(self, f, report):
+        members = []
+        seen = {}
+        for line, raw in read_csv(f):
+            report.read += 1
+            try:
+                member = validate(line, raw)
+            except InvalidRow as e:
+                report.fail(line, (raw.get('church_code') or '').strip(), (raw.get('username') or '').strip(), str(e))
+                continue
+            if member.key in seen:
+                report.fail(line, member.church_code, member.username, f"repeats line {seen[member.key]}")
+                continue
+            seen[member.key] = line
+            members.append(member)
+        return members
+
+    def _load(self, members, report, checkpoint):
+        to_create = []
+        pending = []  # (member, user_id) waiting for their profile
+        for member in members:
+            if member.key in checkpoint.done:
+                report.skipped += 1
+            elif member.key in checkpoint.users:
+                report.resumed += 1
+                pending.append((member, checkpoint.users[member.key]))
+            else:
+                to_create.append(member)
+
+        # Profiles are inserted from this thread while the workers keep creating
+        # users. At most 2 x workers creations are queued, so an interrupted run
+        # stops quickly and journals the users that were created before it stopped.
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='member-import')
+        running = {}
+        queued = iter(to_create)
+        try:
+            while True:
+                for member in queued:
+                    running[executor.submit(self.users.create, member)] = member
+                    if len(running) >= self.workers * 2:
+                        break
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    member = running.pop(future)
+                    user_id = self._created(member, future, report)
+                    if user_id is None:
+                        continue
+                    checkpoint.user_created(member.key, user_id)
+                    pending.append((member, user_id))
+                    if len(pending) >= self.batch_size:
+                        self._insert(pending, report, checkpoint)
+                        pending = []
+        finally:
+            executor.shutdown(cancel_futures=True)
+            for future, member in running.items():
+                if not future.cancelled() and future.exception() is None:
+                    checkpoint.user_created(member.key, future.result())
+        if pending:
+            self._insert(pending, report, checkpoint)
+
+    # The new user's id, or None after reporting why it couldn't be created
+    def _created(self, member, future, report):
+        try:
+            return future.result()
+        except Exception as e:
+            if is_duplicate(e):
+                user_id = self._orphan(member)
+                if user_id is not None:
+                    report.resumed += 1
+                    return user_id
+            report.fail(member.line, member.church_code, member.username, describe(e))
+            return None
+
+    # A user created by a run that died before journaling it: no profile yet, and
+    # it accepts the password from the CSV
+    def _orphan(self, member):
+        try:
+            if self.storage.profile_by_email(member.email) is not None:
+                return None
+            return self.users.sign_in(member)
+        except Exception:
+            return None
+
+    # One multi-row insert per batch. If it fails, the batch is retried row by row
+    # so only the rows at fault are reported.
+    def _insert(self, batch, report, checkpoint):
+        try:
+            self.storage.insert_profiles([member.profile(user_id) for member, user_id in batch])
+            inserted = batch
+        except Exception:
+            inserted = [(member, user_id) for member, user_id in batch if self._insert_one(member, user_id, report)]
+        checkpoint.profiles_inserted([member.key for member, _ in inserted])
+        report.created += len(inserted)
+
+    def _insert_one(self, member, user_id, report):
+        try:
+            self.storage.insert_profiles([member.profile(user_id)])
+            return True
+        except Exception as e:
+            # Inserted by a run that stopped before recording it
+            if is_duplicate(e):
+                existing = self.storage.profile_by_email(member.email)
+                if existing is not None and str(existing['id']) == user_id:
+                    return True
+            report.fail(member.line, member.church_code, member.username,
+                        f"Auth user {user_id} created but its profile was not: {describe(e)}")
+            return False
+
+
+def write_failures(path, report):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('line', 'church_code', 'username', 'reason'))
+        writer.writerows(report.failed)
+
+
+def print_report(report):
+    print(f"Read {report.read} rows: {report.created} created ({report.resumed} finishing an interrupted run), "
+          f"{report.skipped} already done, {len(report.failed)} failed "
+          f"in {report.seconds:.2f}s ({report.rows_per_second:.0f} rows/s).")
+    for line, church_code, username, reason in report.failed[:MAX_REPORTED_ERRORS]:
+        print(f"    line {line}: {church_code}/{username}: {reason}")
+    if len(report.failed) > MAX_REPORTED_ERRORS:
+        print(f"    ... and {len(report.failed) - MAX_REPORTED_ERRORS} more")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create Auth users and profiles for church members from a CSV.")
+    parser.add_argument('source', help='CSV with church_code, username and password columns')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='concurrent Auth user creations')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='profiles per insert')
+    parser.add_argument('--checkpoint', help=f'progress file (default: under {CHECKPOINT_DIR}/, named by the CSV contents)')
+    parser.add_argument('--failures', help='also write the failed rows to this CSV')
+    parser.add_argument('--dry-run', action='store_true', help='validate without creating anything')
+    args = parser.parse_args(argv)
+
+    with open(args.source, 'rb') as f:
+        data = f.read()
+
+    storage = users = None
+    if not args.dry_run:
+        from dotenv import load_dotenv
+        from clients import SupabaseClients
+        from storage import create_storage
+
+        load_dotenv()
+        url = os.environ.get("SUPABASE_URL")
+        service_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+        key = service_key or os.environ.get("SUPABASE_KEY")
+        if not url or not key:
+            parser.error("SUPABASE_URL and SUPABASE_KEY (or SUPABASE_SERVICE_ROLE_KEY) must be set")
+        clients = SupabaseClients(url, key, service_key=service_key)
+        storage = create_storage(clients)
+        users = AuthUsers(clients.auth, admin=bool(service_key))
+
+    importer = MemberImporter(storage, users, workers=args.workers, batch_size=args.batch_size,
+                              dry_run=args.dry_run)
+    checkpoint = None if args.dry_run else Checkpoint(args.checkpoint or checkpoint_path(data))
+    try:
+        report = importer.run(io.StringIO(data.decode('utf-8-sig'), newline=''), checkpoint)
+    except InvalidRow as e:
+        parser.error(f"{args.source}: {e}")
+    print_report(report)
+    if args.failures:
+        write_failures(args.failures, report)
+    return 1 if report.failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,363 @@
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Request and backend-call metrics in the Prometheus text format, served on /metrics.
+#
+# Recording is lock-free: every thread increments its own shard (a plain dict only
+# that thread writes to), and shards are summed when /metrics is scraped.
+#
+# Supabase calls are timed where they leave the process, in the shared HTTP
+# transport (http_pool.py), and attributed to the Flask request that caused them
+# through a context variable that the query pool and the repository event loop
+# carry over to their threads.
+#
+# With several worker processes (run_waitress.py), set METRICS_DIR to a directory
+# shared by the workers: each worker writes its totals there every few seconds and
+# whichever worker answers the scrape reports the sum.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+_metrics = []
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        shard = _shard()
+        key = (self.name, label_values)
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+
+# Summed across threads (and live processes), so inc() and dec() may happen on
+# different threads
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        _metrics.append(self)
+
+    # State is [count per bucket..., count above the last bucket, sum]
+    def observe(self, value, *label_values):
+        shard = _shard()
+        key = (self.name, label_values)
+        state = shard.get(key)
+        if state is None:
+            state = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+
+# A value a service keeps itself (a cache's size, its own hit count), read from
+# `source()[key]` whenever metrics are collected instead of being recorded here.
+# Metrics sharing a source call it once per collection, and a missing or None
+# value is left out. Values from several processes are summed unless `merge`
+# (e.g. max) says otherwise.
+class ServiceMetric:
+    def __init__(self, name, help, source, key, type='gauge', merge=None):
+        self.name = name
+        self.help = help
+        self.labels = ()
+        self.type = type
+        self.source = source
+        self.key = key
+        if merge is not None:
+            self.merge = lambda total, value: value if total is None else merge(total, value)
+        _metrics.append(self)
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+
+http_requests = Counter('quiz_http_requests_total', 'HTTP requests by route, method and status.',
+                        ('route', 'method', 'status'))
+http_duration = Histogram('quiz_http_request_duration_seconds', 'HTTP request latency by route.',
+                          ('route', 'method'))
+http_in_flight = Gauge('quiz_http_requests_in_flight', 'HTTP requests being handled.')
+backend_calls = Counter('quiz_supabase_calls_total', 'Supabase calls by table (or function), operation and status.',
+                        ('table', 'operation', 'status'))
+backend_duration = Histogram('quiz_supabase_call_duration_seconds',
+                             'Supabase call latency (until response headers) by route, table and operation.',
+                             ('route', 'table', 'operation'))
+backend_calls_per_request = Histogram('quiz_supabase_calls_per_request', 'Supabase calls made per HTTP request.',
+                                      ('route',), buckets=CALL_COUNT_BUCKETS)
+backend_time_per_request = Histogram('quiz_supabase_seconds_per_request',
+                                     'Summed Supabase call time per HTTP request.', ('route',))
+pool_wait = Histogram('quiz_supabase_pool_wait_seconds', 'Time Supabase calls waited for a pooled connection.',
+                      buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+
+
+# --- Request scope ---
+
+# The route being served, and the duration of each Supabase call made for it.
+# list.append is atomic, so calls from pool threads need no lock.
+class RequestScope:
+    __slots__ = ('route', 'calls')
+
+    def __init__(self, route):
+        self.route = route
+        self.calls = []
+
+
+_scope = contextvars.ContextVar('request_metrics', default=None)
+
+
+def current_scope():
+    return _scope.get()
+
+
+# Run `coro` with the caller's request scope; for coroutines handed to an event
+# loop in another thread (see async_repo.SyncRepository).
+def bind(coro):
+    scope = _scope.get()
+    if scope is None:
+        return coro
+
+    async def bound():
+        token = _scope.set(scope)
+        try:
+            return await coro
+        finally:
+            _scope.reset(token)
+    return bound()
+
+
+# Classify a Supabase URL as (table or function, operation)
+def classify(method, path, prefer=''):
+    if '/rest/v1/' in path:
+        name = path.split('/rest/v1/', 1)[1].strip('/')
+        if name.startswith('rpc/'):
+            return name[4:], 'rpc'
+        if method in ('GET', 'HEAD'):
+            return name, 'select'
+        if method == 'POST':
+            return name, 'upsert' if 'resolution=' in prefer else 'insert'
+        return name, {'PATCH': 'update', 'DELETE': 'delete'}.get(method, method.lower())
+    if '/auth/v1/' in path:
+        return 'auth', path.split('/auth/v1/', 1)[1].strip('/') or 'auth'
+    return 'other', method.lower()
+
+
+# Called by the shared transport for every Supabase call
+def observe_backend_call(method, path, prefer, status, seconds):
+    table, operation = classify(method, path, prefer)
+    scope = _scope.get()
+    if scope is not None:
+        scope.calls.append(seconds)
+    backend_calls.inc(table, operation, str(status))
+    backend_duration.observe(seconds, scope.route if scope is not None else '', table, operation)
+
+
+# --- Flask integration ---
+
+def instrument(app):
+    from flask import g, request
+
+    @app.before_request
+    def start_request_metrics():
+        rule = request.url_rule
+        scope = RequestScope(rule.rule if rule is not None else 'unmatched')
+        _scope.set(scope)
+        g._metrics = (scope, time.perf_counter())
+        http_in_flight.inc()
+
+    @app.after_request
+    def record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        started = g.pop('_metrics', None)
+        if started is None:
+            return
+        scope, started_at = started
+        http_in_flight.dec()
+        status = g.pop('_metrics_status', 500)
+        http_requests.inc(scope.route, request.method, str(status))
+        http_duration.observe(time.perf_counter() - started_at, scope.route, request.method)
+        backend_calls_per_request.observe(len(scope.calls), scope.route)
+        backend_time_per_request.observe(sum(scope.calls), scope.route)
+        _scope.set(None)
+
+
+# --- Export ---
+
+def snapshot():
+    with _shards_lock:
+        shards = list(_shards)
+    merged = {}
+    by_name = {metric.name: metric for metric in _metrics}
+    for shard in shards:
+        for key, value in list(shard.items()):
+            merged[key] = by_name[key[0]].merge(merged.get(key), value)
+    sources = {}
+    for metric in by_name.values():
+        if not isinstance(metric, ServiceMetric):
+            continue
+        if metric.source not in sources:
+            try:
+                sources[metric.source] = metric.source()
+            except Exception as e:
+                log.warning("Failed to read %s: %s", metric.name, e)
+                sources[metric.source] = {}
+        value = sources[metric.source].get(metric.key)
+        if value is not None:
+            merged[(metric.name, ())] = value
+    return merged
+
+
+def _dump(values):
+    return [[name, list(labels), value] for (name, labels), value in values.items()]
+
+
+def _load(items):
+    return {(name, tuple(labels)): value for name, labels, value in items}
+
+
+class MultiProcessExporter:
+    def __init__(self, directory, interval=5.0):
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._run, name='metrics-export', daemon=True).start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                log.warning("Failed to write metrics to %s: %s", self.path, e)
+
+    def write(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(_dump(snapshot()), f)
+        os.replace(tmp, self.path)
+
+    # This process's live values plus every other worker's last export. Counters of
+    # workers that have exited are kept so totals never go backwards; their gauges
+    # are dropped once the file stops being refreshed.
+    def collect(self):
+        values = snapshot()
+        by_name = {metric.name: metric for metric in _metrics}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            if path == self.path:
+                continue
+            try:
+                stale = time.time() - os.path.getmtime(path) > 3 * self.interval
+                with open(path) as f:
+                    other = _load(json.load(f))
+            except (OSError, ValueError):
+                continue
+            for key, value in other.items():
+                metric = by_name.get(key[0])
+                if metric is None or (stale and metric.type == 'gauge'):
+                    continue
+                values[key] = metric.merge(values.get(key), value)
+        return values
+
+
+_exporter = None
+
+
+def start_exporter(directory, interval=5.0):
+    global _exporter
+    if _exporter is None:
+        _exporter = MultiProcessExporter(directory, interval).start()
+    return _exporter
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    values = _exporter.collect() if _exporter is not None else snapshot()
+    lines = []
+    for metric in _metrics:
+        series = sorted((labels, value) for (name, labels), value in values.items() if name == metric.name)
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        if metric.type != 'histogram':
+            if not series and not metric.labels and not isinstance(metric, ServiceMetric):
+                series = [((), 0)]
+            for labels, value in series:
+                lines.append(f'{metric.name}{_labels(metric.labels, labels)} {_number(value)}')
+            continue
+        for labels, state in series:
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                lines.append(f'{metric.name}_bucket{_labels(metric.labels, labels, [("le", _number(bound))])} '
+                             f'{cumulative}')
+            lines.append(f'{metric.name}_sum{_labels(metric.labels, labels)} {_number(state[-1])}')
+            lines.append(f'{metric.name}_count{_labels(metric.labels, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+# Profiles by email with a short TTL, for the login and signup paths. Misses are
+# cached too (for `negative_ttl`), so repeated failed logins for an unknown
+# account don't each cost a query; put() replaces a cached miss right after signup.
+class ProfileCache:
+    def __init__(self, ttl=300, negative_ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = {}  # email -> (profile or None, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, storage, email):
+        entry = self._entries.get(email)
+        if entry is not None and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        profile = storage.profile_by_email(email)
+        self.put(email, profile)
+        return profile
+
+    def put(self, email, profile):
+        ttl = self.ttl if profile is not None else self.negative_ttl
+        with self._lock:
+            if len(self._entries) >= self.max_entries and email not in self._entries:
+                self._evict()
+            self._entries[email] = (profile, time.monotonic() + ttl)
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    # Drop expired entries, then the oldest if that wasn't enough
+    def _evict(self):
+        now = time.monotonic()
+        for email in [email for email, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            del self._entries[email]
+        while len(self._entries) >= self.max_entries:
+            del self._entries[next(iter(self._entries))]
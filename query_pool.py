@@ -0,0 +1,45 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+# Shared, bounded thread pool for running a request's independent Supabase reads in
+# parallel, so the request waits for the slowest call instead of the sum of them.
+#
+# Callables run outside the Flask request context: read anything they need from
+# `request`/`session` before handing them over.
+class QueryPool:
+    def __init__(self, max_workers=16, timeout=5.0):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query')
+
+    # Run the zero-argument callables concurrently and return their results in order.
+    # Each call gets `timeout` seconds from submission (TimeoutError when exceeded).
+    # With return_exceptions=True failures are returned in place of results instead
+    # of the first one being raised.
+    def gather(self, *calls, timeout=None, return_exceptions=False):
+        timeout = self.timeout if timeout is None else timeout
+        submitted_at = time.monotonic()
+        # Each call runs in a copy of the caller's context (e.g. the metrics request scope)
+        futures = [self._executor.submit(contextvars.copy_context().run, call) for call in calls]
+
+        results = []
+        for future in futures:
+            remaining = max(0.0, submitted_at + timeout - time.monotonic())
+            try:
+                results.append(future.result(timeout=remaining))
+            except TimeoutError:
+                # The worker thread can't be interrupted; just stop waiting for it
+                future.cancel()
+                error = TimeoutError(f"Query did not finish within {timeout}s")
+                if not return_exceptions:
+                    raise error
+                results.append(error)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,372 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Bulk loader for the question bank in data/: the questions_<Book>.csv files and
+# the hand-written "INSERT INTO public.questions" VALUES dump.
+#
+#   python question_import.py                 # load new or changed files
+#   python question_import.py --dry-run       # validate only
+#   python question_import.py --force data/questions_Kejadian.csv
+#
+# Files are streamed row by row, validated, deduplicated by content hash and
+# upserted into 'questions' in batches by a pool of workers. Apply
+# sql/questions_content_hash.sql first. A state file records each loaded file's
+# digest, so re-runs skip files that haven't changed. Loads into the configured
+# storage backend; with STORAGE_BACKEND=sqlite use a separate --state file.
+
+DEFAULT_SOURCES = ('data/questions_*.csv', 'data/INSERT INTO*.txt')
+STATE_PATH = '.question_import_state.json'
+BATCH_SIZE = 500
+WORKERS = 4
+
+FIELDS = ('book_id', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer', 'reference')
+ANSWERS = ('A', 'B', 'C', 'D')
+# Trimmed from both ends of every field; the same set as the btrim() calls in
+# sql/questions_content_hash.sql, so both compute the same content hash
+WHITESPACE = ' \t\r\n'
+MAX_REPORTED_ERRORS = 10
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+# Identity of a question: its book, text and options, as trimmed by validate().
+# Must match the backfill in sql/questions_content_hash.sql.
+def content_hash(row):
+    parts = [str(row['book_id']), row['question_text'], row['option_a'], row['option_b'], row['option_c'], row['option_d']]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+# Normalize one source row into a 'questions' row, or raise InvalidRow.
+def validate(raw):
+    row = {}
+    for field in FIELDS:
+        value = raw.get(field)
+        value = '' if value is None else str(value).strip(WHITESPACE)
+        if not value:
+            raise InvalidRow(f"missing {field}")
+        row[field] = value
+    try:
+        row['book_id'] = int(row['book_id'])
+    except ValueError:
+        raise InvalidRow(f"book_id is not a number: {row['book_id']!r}")
+    if row['book_id'] <= 0:
+        raise InvalidRow(f"book_id must be positive: {row['book_id']}")
+    row['correct_answer'] = row['correct_answer'].upper()
+    if row['correct_answer'] not in ANSWERS:
+        raise InvalidRow(f"correct_answer must be one of A-D: {row['correct_answer']!r}")
+    row['content_hash'] = content_hash(row)
+    return row
+
+
+# --- Sources ---
+
+# Yields (line_number, row dict). Exports with the old id,question,answer layout
+# hold no rows and are skipped.
+def read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames and not set(FIELDS) <= set(reader.fieldnames):
+            for _ in reader:
+                raise InvalidRow(f"unexpected CSV header {reader.fieldnames}")
+            return
+        for row in reader:
+            if row.get('book_id') == 'book_id':  # header repeated where files were concatenated
+                continue
+            yield reader.line_num, row
+
+
+def _chars(f, size=65536):
+    for chunk in iter(lambda: f.read(size), ''):
+        yield from chunk
+
+
+# Streaming parser for INSERT INTO ... (columns) VALUES (...), (...); statements.
+# Understands single-quoted strings with '' escapes, bare numbers and NULL.
+# Yields (line_number, row dict) where line_number is where the tuple starts.
+def read_sql_values(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        line = 1
+        header = []
+        columns = None
+        values = None
+        token = []
+        quoted = False
+        tuple_line = 0
+        in_string = False
+        pending_quote = False
+
+        for ch in _chars(f):
+            if pending_quote:
+                pending_quote = False
+                if ch == "'":  # '' is an escaped quote
+                    token.append("'")
+                    continue
+                in_string = False
+            if ch == '\n':
+                line += 1
+
+            if in_string:
+                if ch == "'":
+                    pending_quote = True
+                else:
+                    token.append(ch)
+                continue
+
+            if columns is None:
+                header.append(ch)
+                if ch in 'Ss' and ''.join(header[-6:]).upper() == 'VALUES':
+                    match = re.search(r'\(([^)]*)\)\s*VALUES$', ''.join(header), re.IGNORECASE)
+                    if not match:
+                        raise InvalidRow(f"line {line}: INSERT without a column list")
+                    columns = [c.strip().strip('"') for c in match.group(1).split(',')]
+                    header = []
+                continue
+
+            if values is None:
+                if ch == '(':
+                    values, token, quoted, tuple_line = [], [], False, line
+                elif ch == ';':
+                    columns = None  # next statement
+                elif not (ch.isspace() or ch == ','):
+                    raise InvalidRow(f"line {line}: unexpected {ch!r} between tuples")
+                continue
+
+            if ch == "'":
+                in_string = quoted = True
+                token = []
+            elif ch in ',)':
+                values.append(_sql_value(token, quoted))
+                token, quoted = [], False
+                if ch == ')':
+                    if len(values) != len(columns):
+                        raise InvalidRow(f"line {tuple_line}: {len(values)} values for {len(columns)} columns")
+                    yield tuple_line, dict(zip(columns, values))
+                    values = None
+            elif not ch.isspace() and not quoted:
+                token.append(ch)
+
+
+def _sql_value(token, quoted):
+    text = ''.join(token)
+    if not quoted and text.upper() == 'NULL':
+        return None
+    return text
+
+
+def read_source(path):
+    with open(path, encoding='utf-8-sig') as f:
+        for first in f:
+            if first.strip():
+                break
+        else:
+            return iter(())
+    if first.lstrip().upper().startswith('INSERT INTO'):
+        return read_sql_values(path)
+    return read_csv(path)
+
+
+# --- Incremental state ---
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_state(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# --- Loading ---
+
+class FileReport:
+    def __init__(self, path):
+        self.path = path
+        self.read = 0
+        self.valid = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.upserted = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def error(self, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+
+class Importer:
+    def __init__(self, storage, batch_size=BATCH_SIZE, workers=WORKERS, dry_run=False):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.workers = workers
+        self.dry_run = dry_run
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def upsert(self, batch):
+        self.storage.upsert_questions(batch)
+        return len(batch)
+
+    # Stream one file into batches; at most 2 x workers batches are in flight, so
+    # memory stays bounded however large the file is.
+    def load_file(self, path, executor):
+        report = FileReport(path)
+        started = time.perf_counter()
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+        futures = []
+
+        def submit(batch):
+            in_flight.acquire()
+            future = executor.submit(self.upsert, batch)
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append(future)
+
+        batch = []
+        try:
+            for line, raw in read_source(path):
+                report.read += 1
+                try:
+                    row = validate(raw)
+                except InvalidRow as e:
+                    report.error(f"line {line}: {e}")
+                    continue
+                with self._lock:
+                    if row['content_hash'] in self._seen:
+                        report.duplicates += 1
+                        continue
+                    self._seen.add(row['content_hash'])
+                report.valid += 1
+                if self.dry_run:
+                    continue
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    submit(batch)
+                    batch = []
+            if batch and not self.dry_run:
+                submit(batch)
+        except InvalidRow as e:
+            report.error(str(e))
+        finally:
+            for future in futures:
+                report.upserted += future.result()
+            report.seconds = time.perf_counter() - started
+        return report
+
+    def run(self, paths, state=None, state_path=None, force=False):
+        reports = []
+        skipped = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import') as executor:
+            for path in paths:
+                stat = os.stat(path)
+                entry = (state or {}).get(path)
+                digest = None
+                if entry and not force:
+                    if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                        skipped.append(path)
+                        continue
+                    digest = file_digest(path)
+                    if entry['sha256'] == digest:
+                        skipped.append(path)
+                        continue
+                report = self.load_file(path, executor)
+                reports.append(report)
+                # A file with bad rows is retried next run
+                if state is not None and not self.dry_run and not report.invalid:
+                    state[path] = {
+                        'sha256': digest or file_digest(path),
+                        'size': stat.st_size,
+                        'mtime_ns': stat.st_mtime_ns,
+                        'rows': report.valid,
+                    }
+                    if state_path:
+                        save_state(state_path, state)
+        return reports, skipped
+
+
+def expand_sources(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or ([pattern] if os.path.exists(pattern) else [])
+        paths.extend(p for p in matches if p not in paths)
+    return paths
+
+
+def print_reports(reports, skipped, seconds):
+    for report in reports:
+        if not report.read:
+            continue
+        print(f"{report.path}: {report.read} rows, {report.valid} valid, {report.invalid} invalid, "
+              f"{report.duplicates} duplicate, {report.upserted} upserted "
+              f"({report.rows_per_second:.0f} rows/s)")
+        for error in report.errors:
+            print(f"    {error}")
+        if report.invalid > len(report.errors):
+            print(f"    ... and {report.invalid - len(report.errors)} more")
+    total = sum(report.read for report in reports)
+    upserted = sum(report.upserted for report in reports)
+    rate = total / seconds if seconds else 0.0
+    print(f"Read {total} rows from {len(reports)} files ({len(skipped)} unchanged, skipped), "
+          f"upserted {upserted} in {seconds:.2f}s ({rate:.0f} rows/s).")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the question bank into Supabase (or STORAGE_BACKEND).")
+    parser.add_argument('sources', nargs='*', default=list(DEFAULT_SOURCES),
+                        help='CSV or SQL VALUES files, or glob patterns (default: the data/ question bank)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=WORKERS, help='concurrent upsert batches')
+    parser.add_argument('--state', default=STATE_PATH, help='file recording what has been loaded')
+    parser.add_argument('--force', action='store_true', help='reload files even if unchanged')
+    parser.add_argument('--dry-run', action='store_true', help='validate and dedupe without writing')
+    args = parser.parse_args(argv)
+
+    storage = None
+    if not args.dry_run:
+        from dotenv import load_dotenv
+        from storage import create_storage
+
+        load_dotenv()
+        storage = create_storage()
+        if storage is None:
+            parser.error("SUPABASE_URL and SUPABASE_KEY must be set")
+
+    paths = expand_sources(args.sources)
+    state = load_state(args.state)
+    importer = Importer(storage, batch_size=args.batch_size, workers=args.workers, dry_run=args.dry_run)
+    started = time.perf_counter()
+    reports, skipped = importer.run(paths, state=state, state_path=args.state, force=args.force)
+    print_reports(reports, skipped, time.perf_counter() - started)
+    return 1 if any(report.invalid for report in reports) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
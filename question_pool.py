@@ -0,0 +1,156 @@
+import hashlib
+import random
+import sys
+import threading
+import time
+
+QUESTION_FIELDS = ('id', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer')
+
+# Fields safe to send to the browser; answers are graded on the server
+PUBLIC_FIELDS = QUESTION_FIELDS[:-1]
+
+
+# Compact question row. __slots__ keeps each record to a fixed-size object with no
+# per-instance dict, and the option texts are interned because the same short
+# answers ("Musa", "Harun", ...) repeat across a whole book.
+class QuestionRecord:
+    __slots__ = QUESTION_FIELDS
+
+    def __init__(self, id, question_text, option_a, option_b, option_c, option_d, correct_answer):
+        self.id = id
+        self.question_text = question_text
+        self.option_a = sys.intern(option_a or '')
+        self.option_b = sys.intern(option_b or '')
+        self.option_c = sys.intern(option_c or '')
+        self.option_d = sys.intern(option_d or '')
+        self.correct_answer = sys.intern(correct_answer or '')
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*(row.get(field) for field in QUESTION_FIELDS))
+
+    # Shape expected by quiz.html
+    def to_dict(self, fields=QUESTION_FIELDS):
+        return {field: getattr(self, field) for field in fields}
+
+
+class BookPool:
+    __slots__ = ('book_id', 'records', 'loaded_at', 'version')
+
+    def __init__(self, book_id, records, loaded_at, version=None):
+        self.book_id = book_id
+        self.records = records  # Immutable tuple, shared by all readers
+        self.loaded_at = loaded_at
+        self.version = version
+
+    def __len__(self):
+        return len(self.records)
+
+    # Pick k questions in random order. Only k indices are drawn from a range
+    # object, so the pool itself is never copied.
+    def sample(self, k):
+        records = self.records
+        k = min(k, len(records))
+        return [records[i] for i in random.sample(range(len(records)), k)]
+
+
+# Fingerprint of a book's questions from storage.question_versions(): ids, content
+# hashes (sql/questions_content_hash.sql) and answers, which the importer updates in
+# place. None while some rows have no content_hash yet.
+def book_version(versions):
+    digest = hashlib.sha256()
+    for row in versions:
+        if not row.get('content_hash'):
+            return None
+        digest.update(f"{row['id']}:{row['content_hash']}:{row.get('correct_answer')}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Per-book question pools with explicit invalidation. A pool older than `ttl` is
+# checked against the book's current version, a small id/hash query, and only
+# reloaded when the questions changed, so imports show up within `ttl` seconds
+# without refetching every book that often.
+class QuestionPoolCache:
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.revalidations = 0
+
+    def get(self, storage, book_id):
+        pool = self._pools.get(book_id)
+        if pool is not None and time.monotonic() - pool.loaded_at < self.ttl:
+            self.hits += 1
+            return pool
+
+        self.misses += 1
+        # One loader per book; concurrent quiz starts for the same book wait for it
+        with self._load_lock(book_id):
+            pool = self._pools.get(book_id)
+            if pool is not None and time.monotonic() - pool.loaded_at < self.ttl:
+                return pool
+            version = book_version(storage.question_versions(book_id))
+            if pool is not None and version is not None and version == pool.version:
+                self.revalidations += 1
+                pool = BookPool(book_id, pool.records, time.monotonic(), version)
+                self._pools[book_id] = pool
+                return pool
+            pool = self._load(storage, book_id, version)
+            self._pools[book_id] = pool
+            return pool
+
+    def sample(self, storage, book_id, k):
+        return self.get(storage, book_id).sample(k)
+
+    # Drop one book's pool, or every pool when book_id is None.
+    def invalidate(self, book_id=None):
+        with self._lock:
+            if book_id is None:
+                self._pools.clear()
+            else:
+                self._pools.pop(book_id, None)
+
+    def stats(self):
+        pools = list(self._pools.values())
+        seen = set()
+        record_bytes = 0
+        string_bytes = 0
+        for pool in pools:
+            record_bytes += sys.getsizeof(pool.records)
+            for record in pool.records:
+                record_bytes += sys.getsizeof(record)
+                for field in QUESTION_FIELDS[1:]:
+                    value = getattr(record, field)
+                    # Interned strings are shared, so count each object once
+                    if id(value) not in seen:
+                        seen.add(id(value))
+                        string_bytes += sys.getsizeof(value)
+        return {
+            'books': len(pools),
+            'questions': sum(len(pool) for pool in pools),
+            'record_bytes': record_bytes,
+            'string_bytes': string_bytes,
+            'total_bytes': record_bytes + string_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'loads': self.loads,
+            'revalidations': self.revalidations,
+        }
+
+    def _load_lock(self, book_id):
+        with self._lock:
+            lock = self._load_locks.get(book_id)
+            if lock is None:
+                lock = self._load_locks[book_id] = threading.Lock()
+            return lock
+
+    # `version` is taken before the rows are read, so an edit in between makes the
+    # next check reload rather than keep the older rows
+    def _load(self, storage, book_id, version=None):
+        records = tuple(QuestionRecord.from_row(row) for row in storage.questions_for_book(book_id))
+        self.loads += 1
+        return BookPool(book_id, records, time.monotonic(), version)
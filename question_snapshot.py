@@ -0,0 +1,309 @@
+import logging
+import mmap
+import os
+import random
+import re
+import struct
+import threading
+import time
+
+from question_pool import QuestionRecord
+
+log = logging.getLogger(__name__)
+
+# Compiled, memory-mapped question bank.
+#
+# The snapshot is a single read-only file that every worker process maps, so the
+# question text lives once in the page cache instead of once per process, and
+# quiz() / grading need no database calls for books it covers. Layout (all
+# little-endian):
+#
+#   header   magic, book count, question count, section offsets, build time
+#   books    (book_id, first, count, name offset, name length), sorted by book_id
+#   records  fixed-size question records, grouped by book and sorted by id:
+#            id, six (offset, length) string refs, correct answer
+#   ids      (question id, record position), sorted by id for binary search
+#   heap     UTF-8 strings, each distinct string stored once
+#
+# Build it with `python question_snapshot.py` (from the database) or
+# `python question_snapshot.py --from-csv` (from data/). A new file is picked up by
+# running workers without a restart; write it elsewhere and rename it into place.
+
+MAGIC = b'BQSNAP\x00\x01'
+HEADER = struct.Struct('<8sIIQQQQd')
+BOOK = struct.Struct('<qIIII')
+RECORD = struct.Struct('<q12IB3x')
+ID_ENTRY = struct.Struct('<qI4x')
+
+STRING_FIELDS = ('question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'reference')
+ANSWERS = 'ABCD'
+SNAPSHOT_PATH = 'question_bank.snap'
+PAGE_SIZE = 1000
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+# --- Building ---
+
+# Write a snapshot of `rows` (dicts with id, book_id, the STRING_FIELDS and
+# correct_answer) to `path`. `book_names` maps book_id to name. The file is
+# written next to `path` and renamed over it, so readers never see a partial file.
+def build(rows, book_names, path):
+    heap = bytearray()
+    strings = {}
+
+    def ref(value):
+        value = value or ''
+        if value not in strings:
+            data = value.encode('utf-8')
+            strings[value] = (len(heap), len(data))
+            heap.extend(data)
+        return strings[value]
+
+    rows = sorted(rows, key=lambda row: (int(row['book_id']), int(row['id'])))
+    books = []
+    records = bytearray()
+    ids = []
+    for position, row in enumerate(rows):
+        book_id = int(row['book_id'])
+        if not books or books[-1][0] != book_id:
+            books.append([book_id, position, 0])
+        books[-1][2] += 1
+        refs = []
+        for field in STRING_FIELDS:
+            refs.extend(ref(row.get(field)))
+        answer = (row.get('correct_answer') or '').strip().upper()
+        if answer not in ANSWERS or len(answer) != 1:
+            raise SnapshotError(f"question {row['id']}: invalid correct_answer {answer!r}")
+        records += RECORD.pack(int(row['id']), *refs, ord(answer))
+        ids.append((int(row['id']), position))
+
+    ids.sort()
+    for (a, _), (b, _) in zip(ids, ids[1:]):
+        if a == b:
+            raise SnapshotError(f"duplicate question id {a}")
+
+    book_table = bytearray()
+    for book_id, first, count in books:
+        name_offset, name_length = ref(book_names.get(book_id))
+        book_table += BOOK.pack(book_id, first, count, name_offset, name_length)
+    id_table = b''.join(ID_ENTRY.pack(question_id, position) for question_id, position in ids)
+
+    books_offset = HEADER.size
+    records_offset = books_offset + len(book_table)
+    ids_offset = records_offset + len(records)
+    heap_offset = ids_offset + len(id_table)
+    header = HEADER.pack(MAGIC, len(books), len(rows), records_offset, ids_offset, heap_offset,
+                         heap_offset + len(heap), time.time())
+
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        for part in (header, book_table, records, id_table, heap):
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(books), len(rows)
+
+
+# Questions and book names from a storage backend (see storage.py); keyset pages
+# so the export is bounded.
+def rows_from_storage(storage):
+    rows = []
+    last_id = None
+    while True:
+        page = storage.questions_page(last_id, PAGE_SIZE)
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        last_id = page[-1]['id']
+    return rows, {book['id']: book['name'] for book in storage.list_books()}
+
+
+# Questions from the data/ files (see question_import.py). CSV rows carry no
+# database id, so ids are derived from the content hash and stay stable across
+# builds; such a snapshot must be the only source for the books it covers.
+# Book names come from the questions_<Book>.csv file names.
+def rows_from_files(patterns):
+    import question_import
+
+    rows = {}
+    book_names = {}
+    for path in question_import.expand_sources(patterns):
+        match = re.match(r'questions_(.+)\.csv$', os.path.basename(path))
+        for _, raw in question_import.read_source(path):
+            try:
+                row = question_import.validate(raw)
+            except question_import.InvalidRow:
+                continue
+            row['id'] = int(row['content_hash'][:13], 16)  # 52 bits: safe as a JavaScript number
+            rows[row['id']] = row
+            if match:
+                book_names.setdefault(row['book_id'], match.group(1))
+    return list(rows.values()), book_names
+
+
+# --- Reading ---
+
+class QuestionSnapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size:
+            raise SnapshotError(f"{path}: too short for a snapshot")
+        (magic, book_count, self.question_count, self._records_offset, self._ids_offset,
+         self._heap_offset, end, self.built_at) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: not a question snapshot")
+        if end != len(self._mmap):
+            raise SnapshotError(f"{path}: truncated ({len(self._mmap)} of {end} bytes)")
+        self.path = path
+
+        # The book table is tiny; decode it once
+        self._books = {}
+        for i in range(book_count):
+            book_id, first, count, name_offset, name_length = BOOK.unpack_from(self._mmap, HEADER.size + i * BOOK.size)
+            self._books[book_id] = (first, count, self._string(name_offset, name_length) or None)
+
+    def __len__(self):
+        return self.question_count
+
+    def book_ids(self):
+        return list(self._books)
+
+    def count(self, book_id):
+        book = self._books.get(book_id)
+        return book[1] if book else 0
+
+    def book_name(self, book_id):
+        book = self._books.get(book_id)
+        return book[2] if book else None
+
+    # k random questions from a book; only the sampled records are decoded.
+    def sample(self, book_id, k):
+        book = self._books.get(book_id)
+        if book is None:
+            return []
+        first, count, _ = book
+        return [self.record(first + i) for i in random.sample(range(count), min(k, count))]
+
+    def record(self, position):
+        fields = RECORD.unpack_from(self._mmap, self._records_offset + position * RECORD.size)
+        strings = [self._string(fields[i], fields[i + 1]) for i in range(1, 13, 2)]
+        return QuestionRecord(fields[0], *strings[:5], chr(fields[13]))
+
+    def correct_answer(self, question_id):
+        position = self._position(question_id)
+        if position is None:
+            return None
+        return chr(self._mmap[self._records_offset + position * RECORD.size + RECORD.size - 4])
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'books': len(self._books),
+            'questions': self.question_count,
+            'bytes': len(self._mmap),
+            'built_at': self.built_at,
+        }
+
+    def _string(self, offset, length):
+        start = self._heap_offset + offset
+        return str(self._mmap[start:start + length], 'utf-8')
+
+    def _position(self, question_id):
+        try:
+            question_id = int(question_id)
+        except (TypeError, ValueError):
+            return None
+        low, high = 0, self.question_count
+        while low < high:
+            middle = (low + high) // 2
+            entry_id, position = ID_ENTRY.unpack_from(self._mmap, self._ids_offset + middle * ID_ENTRY.size)
+            if entry_id == question_id:
+                return position
+            if entry_id < question_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+
+# The current snapshot at `path`, reloaded when a new file is renamed into place.
+# The file is checked at most every `check_interval` seconds; readers holding the
+# previous snapshot keep using its mapping until they drop it.
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_PATH, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._snapshot = None
+        self._file_key = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self._check()
+        return self._snapshot
+
+    def _check(self):
+        # One thread checks; the others carry on with the current snapshot
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            file_key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if file_key == self._file_key:
+                return
+            self._file_key = file_key
+            try:
+                snapshot = QuestionSnapshot(self.path)
+            except (OSError, SnapshotError):
+                log.exception("Failed to load question snapshot %s", self.path)
+                return
+            if self._snapshot is not None:
+                self.reloads += 1
+                log.info("Reloaded question snapshot: %s questions.", snapshot.question_count)
+            self._snapshot = snapshot
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        snapshot = self._snapshot
+        stats = snapshot.stats() if snapshot is not None else {'path': self.path, 'questions': 0}
+        stats['reloads'] = self.reloads
+        return stats
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile the question bank into a snapshot file.")
+    parser.add_argument('--output', default=os.environ.get('QUESTION_SNAPSHOT_PATH', SNAPSHOT_PATH))
+    parser.add_argument('--from-csv', nargs='*', metavar='SOURCE',
+                        help='build from data/ files instead of the database (default: the data/ question bank)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.from_csv is not None:
+        import question_import
+        rows, book_names = rows_from_files(args.from_csv or question_import.DEFAULT_SOURCES)
+    else:
+        from dotenv import load_dotenv
+        from storage import create_storage
+
+        load_dotenv()
+        storage = create_storage()
+        if storage is None:
+            parser.error("SUPABASE_URL and SUPABASE_KEY must be set")
+        rows, book_names = rows_from_storage(storage)
+    books, questions = build(rows, book_names, args.output)
+    print(f"Wrote {args.output}: {books} books, {questions} questions, "
+          f"{os.path.getsize(args.output)} bytes in {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+
+
+# Binary indexed tree of player counts per score, so "how many players scored
+# above s" is O(log S) where S is the highest possible score.
+class FenwickTree:
+    def __init__(self, size):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        index += 1
+        while index <= self.size:
+            self._tree[index] += delta
+            index += index & -index
+
+    # Sum of counts for positions 0..index inclusive
+    def prefix_sum(self, index):
+        index = min(index, self.size - 1) + 1
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+
+# Best score per user for one book, with counts kept in a Fenwick tree.
+class BookRanks:
+    def __init__(self, max_score=20):
+        self.users = {}
+        self.loaded_at = 0.0
+        self._tree = FenwickTree(max_score + 1)
+
+    def __len__(self):
+        return len(self.users)
+
+    def load(self, rows):
+        self.users = {}
+        max_score = max((row['score'] for row in rows), default=0)
+        self._tree = FenwickTree(max(self._tree.size, max_score + 1))
+        for row in rows:
+            self._set(row['user_id'], row['score'])
+        self.loaded_at = time.monotonic()
+
+    # Keep-max update. Returns True when the user's best score changed.
+    def record(self, user_id, score):
+        current = self.users.get(user_id)
+        if current is not None and current >= score:
+            return False
+        self._set(user_id, score)
+        return True
+
+    def rank(self, user_id):
+        score = self.users.get(user_id)
+        if score is None:
+            return None
+        total = len(self.users)
+        below = self._tree.prefix_sum(score - 1) if score > 0 else 0
+        at_or_below = self._tree.prefix_sum(score)
+        return {
+            'score': score,
+            'rank': total - at_or_below + 1,  # Ties share the best rank
+            'total': total,
+            'percentile': round(100.0 * below / total, 1),  # Share of players with a lower score
+        }
+
+    def _set(self, user_id, score):
+        if score + 1 > self._tree.size:
+            self._grow(score + 1)
+        current = self.users.get(user_id)
+        if current is not None:
+            self._tree.add(current, -1)
+        self.users[user_id] = score
+        self._tree.add(score, 1)
+
+    def _grow(self, size):
+        tree = FenwickTree(max(size, self._tree.size * 2))
+        for score in self.users.values():
+            tree.add(score, 1)
+        self._tree = tree
+
+
+# "Rank and percentile of user X in book Y" without pulling the leaderboard table
+# per request. Each book is loaded once (paged), kept current by record() from
+# store_score(), and fully resynced every `resync_interval` seconds.
+class RankIndex:
+    def __init__(self, max_score=20, resync_interval=300):
+        self.max_score = max_score
+        self.resync_interval = resync_interval
+        self._books = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def rank(self, storage, book_id, user_id):
+        return self._book(storage, book_id).rank(user_id)
+
+    def record(self, book_id, user_id, score):
+        with self._lock:
+            book = self._books.get(book_id)
+            if book is not None:
+                book.record(user_id, score)
+
+    def invalidate(self, book_id=None):
+        with self._lock:
+            if book_id is None:
+                self._books.clear()
+            else:
+                self._books.pop(book_id, None)
+
+    def stats(self):
+        return {
+            'books': len(self._books),
+            'players': sum(len(book) for book in list(self._books.values())),
+        }
+
+    def _book(self, storage, book_id):
+        book = self._books.get(book_id)
+        if book is not None and time.monotonic() - book.loaded_at < self.resync_interval:
+            return book
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(book_id, threading.Lock())
+        # Readers keep using the current copy while one thread reloads it
+        if book is not None and not load_lock.acquire(blocking=False):
+            return book
+        if book is None:
+            load_lock.acquire()
+        try:
+            current = self._books.get(book_id)
+            if current is not None and time.monotonic() - current.loaded_at < self.resync_interval:
+                return current
+            rows = self._fetch(storage, book_id)
+            fresh = BookRanks(self.max_score)
+            with self._lock:
+                fresh.load(rows)
+                self._books[book_id] = fresh
+            return fresh
+        except Exception as e:
+            if book is None:
+                raise
+            log.warning("Rank index resync failed for book %s: %s", book_id, e)
+            return book
+        finally:
+            load_lock.release()
+
+    def _fetch(self, storage, book_id):
+        rows = []
+        offset = 0
+        while True:
+            page = storage.leaderboard_page(book_id, offset, PAGE_SIZE)
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
@@ -1,9 +1,265 @@
 # run_waitress.py 파일 내용
-from waitress import serve
-from app import app # app.py 파일에서 Flask 인스턴스 'app'을 가져옵니다.
+#
+# 프로덕션 런처: 마스터 프로세스가 리슨 소켓을 한 번 열고, 그 소켓을 공유하는
+# 워커 프로세스 여러 개를 띄웁니다 (워커마다 Waitress 스레드 풀 하나).
+#
+#   python run_waitress.py --workers 4 --threads 8
+#
+# 모든 옵션은 환경 변수(WAITRESS_*)로도 설정할 수 있고, CLI 인자가 우선합니다.
+#   SIGHUP  -> 워커를 하나씩 교체하는 롤링 재시작 (새 코드 반영)
+#   SIGTERM -> 진행 중인 요청을 마친 뒤 종료
+# os.fork가 없는 환경(Windows)에서는 같은 설정으로 단일 프로세스로 실행합니다.
+import argparse
+import atexit
+import glob
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+STARTUP_TIMEOUT_SECONDS = 60
+RESPAWN_DELAY_SECONDS = 1
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the quiz app under Waitress with multiple worker processes.")
+    parser.add_argument("--host", default=os.environ.get("WAITRESS_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=env_int("WAITRESS_PORT", 5000))
+    parser.add_argument("--workers", type=int, default=env_int("WAITRESS_WORKERS", os.cpu_count() or 1),
+                        help="worker processes sharing the listen socket (default: CPU count)")
+    parser.add_argument("--threads", type=int, default=env_int("WAITRESS_THREADS", 4),
+                        help="request threads per worker")
+    parser.add_argument("--connection-limit", type=int, default=env_int("WAITRESS_CONNECTION_LIMIT", 100),
+                        help="open connections per worker before it stops accepting")
+    parser.add_argument("--backlog", type=int, default=env_int("WAITRESS_BACKLOG", 1024),
+                        help="listen socket backlog")
+    parser.add_argument("--channel-timeout", type=int, default=env_int("WAITRESS_CHANNEL_TIMEOUT", 120),
+                        help="seconds before an idle connection is closed")
+    parser.add_argument("--graceful-timeout", type=int, default=env_int("WAITRESS_GRACEFUL_TIMEOUT", 30),
+                        help="seconds a stopping worker may spend finishing in-flight requests")
+    return parser.parse_args(argv)
+
+
+def open_listen_socket(options):
+    family = socket.AF_INET6 if ":" in options.host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((options.host, options.port))
+    sock.listen(options.backlog)
+    return sock
+
+
+# FLASK_SECRET_KEY가 없으면 app.py는 프로세스마다 임의의 키를 만들기 때문에, 워커마다
+# 키가 달라져 다른 워커가 발급한 세션과 시도 토큰을 거부하게 됩니다. 포크하기 전에
+# 마스터가 키를 한 번 만들어 환경 변수로 넘기면 모든 워커(재시작된 워커 포함)가
+# 같은 키를 씁니다. 마스터가 재시작되면 키도 바뀝니다.
+def share_fallback_secret_key():
+    from dotenv import load_dotenv
+
+    load_dotenv()  # 워커의 create_app()과 같은 .env를 봅니다 (기존 환경 변수는 덮어쓰지 않음)
+    if not os.environ.get("FLASK_SECRET_KEY"):
+        print("경고: FLASK_SECRET_KEY가 설정되지 않아 임시 키를 만들었습니다. 재시작하면 세션이 모두 무효가 됩니다.")
+        os.environ["FLASK_SECRET_KEY"] = os.urandom(24).hex()
+
+
+def create_app_server(sock, options):
+    # http_pool.PoolConfig은 스레드 수에 맞춰 커넥션 풀 크기를 정합니다
+    os.environ["WAITRESS_THREADS"] = str(options.threads)
+    from waitress.server import create_server
+    from app import create_app  # app.py의 앱 팩토리로 Flask 인스턴스를 만듭니다.
+
+    return create_server(
+        create_app(),
+        sockets=[sock],
+        threads=options.threads,
+        connection_limit=options.connection_limit,
+        backlog=options.backlog,
+        channel_timeout=options.channel_timeout,
+    )
+
+
+# --- Worker ---
+
+# 새 연결을 받지 않고, 진행 중인 요청이 끝나면(또는 graceful_timeout 후) 종료합니다.
+def drain(server, graceful_timeout):
+    server.accepting = False
+    deadline = time.monotonic() + graceful_timeout
+    while time.monotonic() < deadline:
+        busy = False
+        for channel in list(server.active_channels.values()):
+            if channel.requests:
+                busy = True
+            else:
+                channel.will_close = True  # 유휴 keep-alive 연결은 닫습니다
+        server.pull_trigger()
+        if not busy:
+            break
+        time.sleep(0.1)
+    # server.run()의 이벤트 루프를 깨워서 KeyboardInterrupt로 종료시킵니다
+    os.kill(os.getpid(), signal.SIGINT)
+
+
+def run_worker(sock, options, ready_fd):
+    server = create_app_server(sock, options)
+
+    def on_term(signum, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        threading.Thread(target=drain, args=(server, options.graceful_timeout), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_term)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    os.write(ready_fd, b"1")
+    os.close(ready_fd)
+    print(f"[worker {os.getpid()}] {options.threads}개 스레드로 요청을 처리합니다.")
+    server.run()
+
+
+# --- Master ---
+
+class Master:
+    def __init__(self, sock, options):
+        self.sock = sock
+        self.options = options
+        self.workers = {}  # pid -> 시작 시각
+        self.stopping = False
+        self.restart_requested = False
+
+    def spawn(self):
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.sock, self.options, ready_w)
+            except BaseException as e:
+                print(f"[worker {os.getpid()}] 오류로 종료합니다: {e}")
+                code = 1
+            # os._exit는 atexit을 건너뛰므로 score_queue 플러시 등을 직접 실행합니다
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            os._exit(code)
+
+        os.close(ready_w)
+        self.workers[pid] = time.monotonic()
+        ready, _, _ = select.select([ready_r], [], [], STARTUP_TIMEOUT_SECONDS)
+        started = bool(ready) and os.read(ready_r, 1) == b"1"
+        os.close(ready_r)
+        if not started:
+            print(f"워커 {pid}가 {STARTUP_TIMEOUT_SECONDS}초 안에 시작하지 못했습니다.")
+        return pid, started
+
+    def reap(self):
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if self.workers.pop(pid, None) is not None:
+                exited.append((pid, status))
+        return exited
+
+    def wait_for(self, pid, timeout):
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    return
+                time.sleep(0.1)
+            print(f"워커 {pid}가 제때 종료되지 않아 강제 종료합니다.")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+        finally:
+            self.workers.pop(pid, None)
+
+    # 새 워커가 준비된 뒤에 기존 워커를 하나씩 내려서 처리 용량이 줄지 않게 합니다
+    def rolling_restart(self):
+        print(f"롤링 재시작: 워커 {len(self.workers)}개를 교체합니다.")
+        for old_pid in list(self.workers):
+            if self.stopping:
+                return
+            new_pid, started = self.spawn()
+            if not started:
+                print("새 워커가 준비되지 않아 롤링 재시작을 중단합니다.")
+                self.stop_worker(new_pid)
+                return
+            self.stop_worker(old_pid)
+        print("롤링 재시작 완료.")
+
+    def stop_worker(self, pid):
+        if pid not in self.workers:
+            return
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        self.wait_for(pid, self.options.graceful_timeout + 5)
+
+    def handle_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self.restart_requested = True
+        else:
+            self.stopping = True
+
+    def run(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.handle_signal)
+        # 이전 실행에서 남은 워커 메트릭 파일을 지웁니다 (metrics.py, METRICS_DIR 참고)
+        metrics_dir = os.environ.get("METRICS_DIR")
+        if metrics_dir:
+            for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+                os.remove(path)
+        for _ in range(self.options.workers):
+            self.spawn()
+
+        while not self.stopping:
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+                continue
+            for pid, status in self.reap():
+                if self.stopping:
+                    break
+                print(f"워커 {pid}가 종료되었습니다 (status {status}). 새 워커를 띄웁니다.")
+                time.sleep(RESPAWN_DELAY_SECONDS)
+                self.spawn()
+            time.sleep(0.5)
+
+        print("종료 중: 진행 중인 요청을 마무리합니다...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            self.wait_for(pid, self.options.graceful_timeout + 5)
+        self.sock.close()
+
 
 if __name__ == '__main__':
     print("Waitress 서버를 시작합니다...")
-    # host와 port는 app.run()에서 사용하던 것과 동일하게 설정합니다.
+    options = parse_args()
+    # host와 port는 app.run()에서 사용하던 것과 동일하게 설정합니다 (기본값 0.0.0.0:5000).
     # Waitress는 기본적으로 디버그 모드나 자동 재시작 기능을 포함하지 않습니다.
-    serve(app, host='0.0.0.0', port=5000)
\ No newline at end of file
+    sock = open_listen_socket(options)
+    print(f"{options.host}:{options.port}에서 워커 {options.workers}개 x 스레드 {options.threads}개로 대기합니다.")
+    if options.workers <= 1 or not hasattr(os, "fork"):
+        create_app_server(sock, options).run()
+    else:
+        share_fallback_secret_key()
+        Master(sock, options).run()
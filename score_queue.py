@@ -0,0 +1,244 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process, nothing to coordinate with
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+# Bounded write-behind queue for finished quiz attempts.
+#
+# submit() only appends the entry to the spill file and the in-memory queue; a
+# background thread hands batches to `flush_fn` when `batch_size` entries are
+# waiting or `flush_interval` seconds have passed. When the queue is full submit()
+# returns False and the caller should save synchronously instead.
+#
+# The spill file is a journal: one {"seq": n, "entry": ...} line per accepted entry
+# and one {"ack": n} line after every successful flush. The file is truncated
+# whenever everything written to it has been flushed.
+#
+# Every process keeps its own journal, `spill_path` suffixed with its pid, and
+# holds an exclusive flock on it while it runs. On startup a queue claims the
+# journals whose lock is free, i.e. those left behind by processes that have
+# exited (and a plain `spill_path` from older versions), and replays the entries
+# newer than their last ack, so a crash loses nothing that was acknowledged to the
+# user. Journals of live workers are never touched.
+class ScoreQueue:
+    def __init__(self, flush_fn, maxsize=1000, batch_size=200, flush_interval=1.0,
+                 spill_path=None, put_timeout=0.0, fsync=False):
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.journal_path = f"{spill_path}.{os.getpid()}" if spill_path else None
+        self.put_timeout = put_timeout
+        self.fsync = fsync
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+        self._seq = 0
+        self._acked = 0
+        self._stopping = threading.Event()
+        self._thread = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.flush_errors = 0
+
+    def start(self):
+        if self.spill_path:
+            replayed = self._replay_spill()
+            self._spill_file = open(self.journal_path, 'a', encoding='utf-8')
+            _lock(self._spill_file, blocking=True)
+            if replayed:
+                for seq, entry in replayed:
+                    self._write_spill({'seq': seq, 'entry': entry})
+                    # Replayed entries may exceed maxsize; they must not be dropped
+                    self._queue.queue.append((seq, entry))
+        self._thread = threading.Thread(target=self._run, name='score-queue', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    # Queue an attempt. Returns False when the queue is full (or stopped) so the
+    # caller can fall back to a synchronous write.
+    def submit(self, entry):
+        if self._stopping.is_set():
+            self.rejected += 1
+            return False
+        with self._spill_lock:
+            seq = self._seq + 1
+            try:
+                if self.put_timeout:
+                    self._queue.put((seq, entry), timeout=self.put_timeout)
+                else:
+                    self._queue.put_nowait((seq, entry))
+            except queue.Full:
+                self.rejected += 1
+                return False
+            self._seq = seq
+            self._write_spill({'seq': seq, 'entry': entry})
+        self.accepted += 1
+        return True
+
+    # Flush everything still queued and stop the worker.
+    def stop(self, timeout=10.0):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._spill_lock:
+            if self._spill_file is not None:
+                # A fully flushed journal has nothing to replay
+                if self._acked == self._seq:
+                    os.remove(self.journal_path)
+                self._spill_file.close()
+                self._spill_file = None
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'flushed': self.flushed,
+            'flush_errors': self.flush_errors,
+        }
+
+    def _run(self):
+        backoff = self.flush_interval
+        pending = []
+        while True:
+            if not pending:
+                pending = self._collect()
+            if not pending:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                self.flush_fn([entry for _, entry in pending])
+            except Exception as e:
+                # Keep the batch and retry; the bounded queue pushes back on callers
+                self.flush_errors += 1
+                log.error("Score queue flush of %d entries failed: %s", len(pending), e)
+                if self._stopping.is_set():
+                    log.error("Score queue stopping with unflushed entries; they remain in the spill file.")
+                    return
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = self.flush_interval
+            self.flushed += len(pending)
+            self._ack(pending[-1][0])
+            pending = []
+
+    # Wait for the first entry, then keep taking entries until the batch is full or
+    # the flush interval has passed.
+    def _collect(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                timeout = 0.1 if self._stopping.is_set() else self.flush_interval
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                if deadline is None and not self._stopping.is_set():
+                    continue
+                break
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    def _ack(self, seq):
+        with self._spill_lock:
+            self._acked = seq
+            if self._spill_file is None:
+                return
+            if seq == self._seq:
+                # Everything written has been flushed; start the journal over
+                self._spill_file.seek(0)
+                self._spill_file.truncate()
+                self._spill_file.flush()
+            else:
+                self._write_spill({'ack': seq})
+
+    def _write_spill(self, record):
+        if self._spill_file is None:
+            return
+        self._spill_file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._spill_file.flush()
+        if self.fsync:
+            os.fsync(self._spill_file.fileno())
+
+    # Unflushed entries from the journals no running process holds, renumbered so
+    # sequence numbers keep increasing in this process's journal. Each claimed
+    # journal is removed while still locked.
+    def _replay_spill(self):
+        result = []
+        paths = glob.glob(glob.escape(self.spill_path) + '.*') + [self.spill_path]
+        for path in paths:
+            if path != self.spill_path and not path[len(self.spill_path) + 1:].isdigit():
+                continue
+            try:
+                f = open(path, encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with f:
+                if not _lock(f, blocking=False):
+                    continue  # A live worker's journal
+                try:
+                    if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                        continue  # Claimed and removed by another process meanwhile
+                except FileNotFoundError:
+                    continue
+                replayed = _unflushed(f)
+                os.remove(path)
+            if replayed:
+                log.warning("Score queue: replaying %d unflushed entries from %s", len(replayed), path)
+            for entry in replayed:
+                self._seq += 1
+                result.append((self._seq, entry))
+        return result
+
+
+# Entries of a journal newer than its last ack
+def _unflushed(f):
+    entries = {}
+    acked = 0
+    for line in f:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Torn last line from a crash mid-write
+            continue
+        if 'ack' in record:
+            acked = max(acked, record['ack'])
+        else:
+            entries[record['seq']] = record['entry']
+    return [entry for seq, entry in sorted(entries.items()) if seq > acked]
+
+
+# Exclusive flock on an open file; released when the file is closed or the
+# process exits. Returns False when another process holds it.
+def _lock(f, blocking):
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
@@ -0,0 +1,365 @@
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+log = logging.getLogger(__name__)
+
+# Server-side sessions: the cookie holds only a random session id and the session
+# data lives in a SessionStore. Stores keep the serialized session (a short JSON
+# string) with an expiry time; expired sessions are never returned and are removed
+# by a background sweep.
+#
+# SESSION_BACKEND selects the store:
+#   sqlite  (default) SESSION_SQLITE_PATH, default sessions.db; shared by every
+#           worker process on the host
+#   file    one file per session in SESSION_DIR, default .sessions
+#   memory  LRU of SESSION_MAX_ENTRIES sessions in this process; only for a single
+#           worker, since other workers can't see it
+#   cookie  Flask's signed cookie sessions, as before
+#
+# Stores also hold short-lived claims (see claim()), e.g. which quiz attempts have
+# been submitted (attempt_token.AttemptLedger), so every worker sees the same ones.
+# Claim keys contain a '.', which session ids never do.
+
+SESSION_ID_BYTES = 32
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+_CLAIM_KEY = re.compile(r'^[a-z]+(\.[A-Za-z0-9_-]+)+(?<!\.tmp)$')  # Not the temporary files
+
+_serializer = TaggedJSONSerializer()
+
+
+def new_session_id():
+    return secrets.token_urlsafe(SESSION_ID_BYTES)
+
+
+# --- Stores ---
+
+# Interface every store implements. Methods are thread-safe; `data` is the
+# serialized session and `expires_at` a time.time() value.
+class SessionStore:
+    # (data, expires_at), or None if the session doesn't exist or has expired
+    def load(self, sid):
+        raise NotImplementedError
+
+    def save(self, sid, data, expires_at):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    # Store `data` under `key` unless an unexpired entry is already there; returns
+    # the data that is stored, so the caller got the claim if it's their own.
+    # Atomic across threads and, for the shared stores, across processes.
+    def claim(self, key, data, expires_at):
+        raise NotImplementedError
+
+    # Remove sessions that expired before `now`; returns how many were removed
+    def sweep(self, now):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._entries[sid] = (data, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def claim(self, key, data, expires_at):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                entry = self._entries[key] = (data, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry[0]
+
+    def sweep(self, now):
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
+
+
+class SqliteSessionStore(SessionStore):
+    SCHEMA = """
+    create table if not exists sessions (
+        id text primary key,
+        data text not null,
+        expires_at real not null
+    );
+    create index if not exists sessions_expires_at on sessions (expires_at);
+    """
+
+    def __init__(self, path='sessions.db', timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # One autocommit connection per thread; the table is created on first use
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute("select data, expires_at from sessions where id = ? and expires_at > ?",
+                                   (sid, time.time())).fetchone()
+        return tuple(row) if row else None
+
+    def save(self, sid, data, expires_at):
+        self._conn().execute("insert into sessions (id, data, expires_at) values (?, ?, ?) "
+                             "on conflict (id) do update set data = excluded.data, expires_at = excluded.expires_at",
+                             (sid, data, expires_at))
+
+    def delete(self, sid):
+        self._conn().execute("delete from sessions where id = ?", (sid,))
+
+    # The insert only replaces an expired entry, so once it has run the row holds
+    # the winner's data until it expires
+    def claim(self, key, data, expires_at):
+        conn = self._conn()
+        conn.execute("insert into sessions (id, data, expires_at) values (?, ?, ?) "
+                     "on conflict (id) do update set data = excluded.data, expires_at = excluded.expires_at "
+                     "where sessions.expires_at <= ?", (key, data, expires_at, time.time()))
+        return conn.execute("select data from sessions where id = ?", (key,)).fetchone()[0]
+
+    def sweep(self, now):
+        return self._conn().execute("delete from sessions where expires_at <= ?", (now,)).rowcount
+
+
+# One JSON file per session, named by its id. Session ids are validated before
+# they reach a store, so they are safe to use as file names.
+class FileSessionStore(SessionStore):
+    def __init__(self, directory='.sessions'):
+        self.directory = directory
+        self._created = False
+
+    def _path(self, sid):
+        if not self._created:
+            os.makedirs(self.directory, exist_ok=True)
+            self._created = True
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires_at'] <= time.time():
+            return None
+        return entry['data'], entry['expires_at']
+
+    def save(self, sid, data, expires_at):
+        path = self._path(sid)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'data': data, 'expires_at': expires_at}, f)
+        os.replace(tmp, path)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    # Written to a temporary file and hard-linked into place: the link fails if the
+    # claim exists, and readers never see a partly written one
+    def claim(self, key, data, expires_at):
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'data': data, 'expires_at': expires_at}, f)
+        try:
+            while True:
+                try:
+                    os.link(tmp, path)
+                    return data
+                except FileExistsError:
+                    pass
+                entry = self.load(key)
+                if entry is not None:
+                    return entry[0]
+                # Expired (or removed meanwhile): take it over
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        finally:
+            os.remove(tmp)
+
+    def sweep(self, now):
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            if not (_SESSION_ID.match(name) or _CLAIM_KEY.match(name)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    expired = json.load(f)['expires_at'] <= now
+                if expired:
+                    os.remove(path)
+                    removed += 1
+            except (OSError, ValueError, KeyError):
+                continue
+        return removed
+
+
+def create_session_store():
+    backend = os.environ.get("SESSION_BACKEND", "sqlite").lower()
+    if backend == 'cookie':
+        return None
+    if backend == 'sqlite':
+        return SqliteSessionStore(os.environ.get("SESSION_SQLITE_PATH", "sessions.db"))
+    if backend == 'file':
+        return FileSessionStore(os.environ.get("SESSION_DIR", ".sessions"))
+    if backend == 'memory':
+        return MemorySessionStore(int(os.environ.get("SESSION_MAX_ENTRIES", 100000)))
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; expected 'sqlite', 'file', 'memory' or 'cookie'")
+
+
+# --- Flask integration ---
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, expires_at=0.0):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.previous_sid = None
+
+    # Clearing (as login and logout do) also retires the session id, so an id
+    # issued before login is never valid after it
+    def clear(self):
+        super().clear()
+        if self.sid is not None and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = None
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, ttl=7 * 86400, sweep_interval=300.0):
+        self.store = store
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+
+    # Remove expired sessions every sweep_interval seconds
+    def start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep, name='session-sweep', daemon=True)
+            self._sweeper.start()
+        return self
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed = self.store.sweep(time.time())
+                if removed:
+                    log.debug("Removed %d expired sessions", removed)
+            except Exception as e:
+                log.warning("Session sweep failed: %s", e)
+
+    def _lifetime(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime.total_seconds()
+        return self.ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not _SESSION_ID.match(sid):
+            return ServerSession()
+        try:
+            entry = self.store.load(sid)
+        except Exception as e:
+            log.error("Failed to load session: %s", e)
+            entry = None
+        if entry is None:
+            return ServerSession()
+        data, expires_at = entry
+        try:
+            return ServerSession(_serializer.loads(data), sid, expires_at)
+        except ValueError:
+            return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified:
+                if session.sid is not None:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        # Rewrite the session when it changed or, to keep active sessions alive,
+        # when less than half of its lifetime is left
+        lifetime = self._lifetime(app, session)
+        now = time.time()
+        if not session.modified and session.sid is not None and session.expires_at - now > lifetime / 2:
+            return
+        new_sid = session.sid is None
+        if new_sid:
+            session.sid = new_session_id()
+        session.expires_at = now + lifetime
+        self.store.save(session.sid, _serializer.dumps(dict(session)), session.expires_at)
+        if new_sid or session.permanent:
+            response.set_cookie(name, session.sid,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain,
+                                path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
@@ -0,0 +1,23 @@
+-- Content hash for questions, so the question-bank importer (question_import.py)
+-- can upsert without creating duplicates. The hash covers book_id, the question
+-- text and the four options; correct_answer and reference are updated in place.
+-- Must match question_import.content_hash(): fields are trimmed of spaces, tabs,
+-- carriage returns and newlines (question_import.WHITESPACE), not just spaces.
+
+alter table public.questions add column if not exists content_hash text;
+
+update public.questions
+set content_hash = encode(sha256(convert_to(concat_ws(chr(31),
+        book_id::text, btrim(question_text, E' \t\r\n'),
+        btrim(option_a, E' \t\r\n'), btrim(option_b, E' \t\r\n'),
+        btrim(option_c, E' \t\r\n'), btrim(option_d, E' \t\r\n')), 'UTF8')), 'hex')
+where content_hash is null;
+
+-- Rows loaded more than once before this migration: keep the oldest copy
+delete from public.questions q
+using public.questions older
+where q.content_hash = older.content_hash
+  and q.id > older.id;
+
+create unique index if not exists questions_content_hash_key
+    on public.questions (content_hash);
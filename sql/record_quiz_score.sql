@@ -0,0 +1,115 @@
+-- Records a finished quiz attempt, updates the user's per-book stats (see
+-- user_book_stats.sql) and keeps the best score on the leaderboard in a single
+-- round trip. Called from complete_quiz()/submit_quiz() via
+-- supabase.rpc('record_quiz_score', ...).
+--
+-- The leaderboard upsert relies on a unique constraint on (book_id, user_id); the
+-- row lock taken by ON CONFLICT makes concurrent finishes by the same user safe.
+-- Run this in the Supabase SQL editor.
+--
+-- The functions take the user id from the caller, so only the service role may
+-- run them: the app calls them with SUPABASE_SERVICE_ROLE_KEY for users it has
+-- authenticated, and a client holding the public anon key can't write scores.
+-- They run as their owner (security definer), so row level security on scores,
+-- leaderboard and user_book_stats doesn't depend on the caller's policies.
+
+create or replace function public.record_quiz_score(
+    p_user_id uuid,
+    p_book_id bigint,
+    p_username text,
+    p_score integer
+)
+returns integer -- best score for this user and book after the update
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    best integer;
+begin
+    insert into public.scores (user_id, book_id, score, achieved_at)
+    values (p_user_id, p_book_id, p_score, now());
+
+    insert into public.user_book_stats as st (user_id, book_id, best_score, total_score, attempts, last_played_at)
+    values (p_user_id, p_book_id, p_score, p_score, 1, now())
+    on conflict (user_id, book_id) do update
+        set best_score = greatest(st.best_score, excluded.best_score),
+            total_score = st.total_score + excluded.total_score,
+            attempts = st.attempts + excluded.attempts,
+            last_played_at = greatest(st.last_played_at, excluded.last_played_at);
+
+    insert into public.leaderboard as lb (book_id, user_id, username, score)
+    values (p_book_id, p_user_id, p_username, p_score)
+    on conflict (book_id, user_id) do update
+        set score = excluded.score,
+            username = excluded.username
+        where lb.score < excluded.score
+    returning lb.score into best;
+
+    -- No row is returned when the existing score was kept
+    if best is null then
+        select lb.score into best
+        from public.leaderboard lb
+        where lb.book_id = p_book_id and lb.user_id = p_user_id;
+    end if;
+
+    return best;
+end;
+$$;
+
+revoke execute on function public.record_quiz_score(uuid, bigint, text, integer) from public, anon, authenticated;
+grant execute on function public.record_quiz_score(uuid, bigint, text, integer) to service_role;
+
+-- Bulk form used by the write-behind score queue (SCORE_WRITE_BEHIND=1).
+-- p_rows is a JSON array of {user_id, book_id, username, score, achieved_at}.
+-- Only the best score per (book_id, user_id) in the batch is offered to the
+-- leaderboard, with the same keep-max rule as above.
+
+create or replace function public.record_quiz_scores(p_rows jsonb)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into public.scores (user_id, book_id, score, achieved_at)
+    select (r->>'user_id')::uuid,
+           (r->>'book_id')::bigint,
+           (r->>'score')::integer,
+           coalesce((r->>'achieved_at')::timestamptz, now())
+    from jsonb_array_elements(p_rows) r;
+
+    insert into public.user_book_stats as st (user_id, book_id, best_score, total_score, attempts, last_played_at)
+    select (r->>'user_id')::uuid,
+           (r->>'book_id')::bigint,
+           max((r->>'score')::integer),
+           sum((r->>'score')::integer),
+           count(*),
+           max(coalesce((r->>'achieved_at')::timestamptz, now()))
+    from jsonb_array_elements(p_rows) r
+    group by 1, 2
+    on conflict (user_id, book_id) do update
+        set best_score = greatest(st.best_score, excluded.best_score),
+            total_score = st.total_score + excluded.total_score,
+            attempts = st.attempts + excluded.attempts,
+            last_played_at = greatest(st.last_played_at, excluded.last_played_at);
+
+    insert into public.leaderboard as lb (book_id, user_id, username, score)
+    select distinct on (book_id, user_id) book_id, user_id, username, score
+    from (
+        select (r->>'book_id')::bigint as book_id,
+               (r->>'user_id')::uuid as user_id,
+               r->>'username' as username,
+               (r->>'score')::integer as score
+        from jsonb_array_elements(p_rows) r
+    ) batch
+    order by book_id, user_id, score desc
+    on conflict (book_id, user_id) do update
+        set score = excluded.score,
+            username = excluded.username
+        where lb.score < excluded.score;
+end;
+$$;
+
+revoke execute on function public.record_quiz_scores(jsonb) from public, anon, authenticated;
+grant execute on function public.record_quiz_scores(jsonb) to service_role;
@@ -0,0 +1,22 @@
+-- Per-user, per-book rollup of quiz attempts, read by /my-scores.
+-- Apply this before record_quiz_score.sql, which keeps it up to date.
+-- Rebuild from the scores table at any time with: python user_stats.py
+
+create table if not exists public.user_book_stats (
+    user_id uuid not null,
+    book_id bigint not null references public.bible_books (id),
+    best_score integer not null default 0,
+    total_score bigint not null default 0,
+    attempts integer not null default 0,
+    last_played_at timestamptz,
+    primary key (user_id, book_id)
+);
+
+-- Users may only read their own rows. Writes come from the security definer
+-- functions in record_quiz_score.sql and from the server with the service role key.
+alter table public.user_book_stats enable row level security;
+
+drop policy if exists "Users can read their own stats" on public.user_book_stats;
+create policy "Users can read their own stats"
+    on public.user_book_stats for select
+    using (auth.uid() = user_id);
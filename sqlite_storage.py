@@ -0,0 +1,295 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+from storage import PAGE_SIZE, StorageBackend
+
+# Embedded storage backend (STORAGE_BACKEND=sqlite, SQLITE_PATH=quiz.db).
+#
+# Same tables and row shapes as the Supabase schema, in one local file. It is a
+# standalone database, not a copy of Supabase: nothing is synced either way, and
+# scores saved here exist only here. Useful for a single-host deployment and for
+# tests and load runs where hosted Supabase would only add network latency. Load
+# questions into it with `STORAGE_BACKEND=sqlite python question_import.py`.
+#
+# Each thread gets its own connection. WAL lets readers run alongside the single
+# writer; writes use BEGIN IMMEDIATE so concurrent score saves queue on the write
+# lock instead of failing on upgrade.
+
+BOOKS = (
+    'Kejadian', 'Keluaran', 'Imamat', 'Bilangan', 'Ulangan', 'Yosua', 'Hakim-hakim', 'Rut',
+    '1 Samuel', '2 Samuel', '1 Raja-raja', '2 Raja-raja', '1 Tawarikh', '2 Tawarikh', 'Ezra',
+    'Nehemia', 'Ester', 'Ayub', 'Mazmur', 'Amsal', 'Pengkhotbah', 'Kidung Agung', 'Yesaya',
+    'Yeremia', 'Ratapan', 'Yehezkiel', 'Daniel', 'Hosea', 'Yoel', 'Amos', 'Obaja', 'Yunus',
+    'Mikha', 'Nahum', 'Habakuk', 'Zefanya', 'Hagai', 'Zakharia', 'Maleakhi',
+    'Matius', 'Markus', 'Lukas', 'Yohanes', 'Kisah Rasul', 'Roma', '1 Korintus', '2 Korintus',
+    'Galatia', 'Efesus', 'Filipi', 'Kolose', '1 Tesalonika', '2 Tesalonika', '1 Timotius',
+    '2 Timotius', 'Titus', 'Filemon', 'Ibrani', 'Yakobus', '1 Petrus', '2 Petrus', '1 Yohanes',
+    '2 Yohanes', '3 Yohanes', 'Yudas', 'Wahyu',
+)
+
+SCHEMA = """
+create table if not exists bible_books (
+    id integer primary key,
+    name text not null
+);
+
+create table if not exists questions (
+    id integer primary key,
+    book_id integer not null references bible_books (id),
+    question_text text not null,
+    option_a text not null,
+    option_b text not null,
+    option_c text not null,
+    option_d text not null,
+    correct_answer text not null,
+    reference text,
+    content_hash text unique
+);
+create index if not exists questions_book_id_idx on questions (book_id, id);
+
+create table if not exists scores (
+    id integer primary key,
+    user_id text not null,
+    book_id integer not null references bible_books (id),
+    score integer not null,
+    achieved_at text not null
+);
+create index if not exists scores_user_achieved_idx on scores (user_id, achieved_at desc, id desc);
+
+create table if not exists leaderboard (
+    book_id integer not null references bible_books (id),
+    user_id text not null,
+    username text,
+    score integer not null default 0,
+    primary key (book_id, user_id)
+);
+create index if not exists leaderboard_book_score_idx on leaderboard (book_id, score desc);
+create index if not exists leaderboard_score_idx on leaderboard (score desc);
+
+create table if not exists user_book_stats (
+    user_id text not null,
+    book_id integer not null references bible_books (id),
+    best_score integer not null default 0,
+    total_score integer not null default 0,
+    attempts integer not null default 0,
+    last_played_at text,
+    primary key (user_id, book_id)
+);
+create index if not exists user_book_stats_played_idx on user_book_stats (user_id, last_played_at desc);
+
+create table if not exists profiles (
+    id text primary key,
+    email text not null unique,
+    church_code text not null,
+    username text not null,
+    phone text,
+    unique (church_code, username)
+);
+"""
+
+QUESTION_COLUMNS = 'id, question_text, option_a, option_b, option_c, option_d, correct_answer'
+
+# The statements behind record_score(); the same rules as sql/record_quiz_score.sql
+INSERT_SCORE = "insert into scores (user_id, book_id, score, achieved_at) values (?, ?, ?, ?)"
+UPSERT_STATS = """
+insert into user_book_stats (user_id, book_id, best_score, total_score, attempts, last_played_at)
+values (?, ?, ?, ?, ?, ?)
+on conflict (user_id, book_id) do update
+    set best_score = max(best_score, excluded.best_score),
+        total_score = total_score + excluded.total_score,
+        attempts = attempts + excluded.attempts,
+        last_played_at = max(coalesce(last_played_at, ''), excluded.last_played_at)
+"""
+UPSERT_LEADERBOARD = """
+insert into leaderboard (book_id, user_id, username, score) values (?, ?, ?, ?)
+on conflict (book_id, user_id) do update
+    set score = excluded.score,
+        username = excluded.username
+    where excluded.score > leaderboard.score
+"""
+
+
+def _book(row):
+    row = dict(row)
+    row['bible_books'] = {'name': row.pop('book_name')}
+    return row
+
+
+class SqliteStorage(StorageBackend):
+    def __init__(self, path='quiz.db', timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        with self._write() as conn:
+            conn.executemany("insert or ignore into bible_books (id, name) values (?, ?)",
+                             enumerate(BOOKS, start=1))
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: reads take no lock, writes open transactions explicitly
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.execute("pragma foreign_keys=on")
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        return [dict(row) for row in self._conn().execute(sql, params)]
+
+    # with self._write() as conn: ... runs in one IMMEDIATE transaction
+    def _write(self):
+        return _Transaction(self._conn())
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Books ---
+
+    def list_books(self):
+        return self._query("select id, name from bible_books order by id")
+
+    def book_name(self, book_id):
+        rows = self._query("select name from bible_books where id = ?", (book_id,))
+        return rows[0]['name'] if rows else None
+
+    # --- Questions ---
+
+    def questions_for_book(self, book_id):
+        return self._query(f"select {QUESTION_COLUMNS} from questions where book_id = ? order by id", (book_id,))
+
+    def question_versions(self, book_id):
+        return self._query("select id, content_hash, correct_answer from questions where book_id = ? order by id",
+                           (book_id,))
+
+    def questions_page(self, after_id, limit=PAGE_SIZE):
+        return self._query(f"select {QUESTION_COLUMNS}, book_id, reference from questions "
+                           "where id > ? order by id limit ?",
+                           (after_id if after_id is not None else -1, limit))
+
+    def upsert_questions(self, rows):
+        with self._write() as conn:
+            conn.executemany("""
+                insert into questions (book_id, question_text, option_a, option_b, option_c, option_d,
+                                       correct_answer, reference, content_hash)
+                values (:book_id, :question_text, :option_a, :option_b, :option_c, :option_d,
+                        :correct_answer, :reference, :content_hash)
+                on conflict (content_hash) do update
+                    set correct_answer = excluded.correct_answer,
+                        reference = excluded.reference
+            """, rows)
+
+    # --- Scores ---
+
+    def record_score(self, user_id, username, book_id, score):
+        achieved_at = datetime.utcnow().isoformat()
+        with self._write() as conn:
+            conn.execute(INSERT_SCORE, (user_id, book_id, score, achieved_at))
+            conn.execute(UPSERT_STATS, (user_id, book_id, score, score, 1, achieved_at))
+            conn.execute(UPSERT_LEADERBOARD, (book_id, user_id, username, score))
+            row = conn.execute("select score from leaderboard where book_id = ? and user_id = ?",
+                               (book_id, user_id)).fetchone()
+        return row['score']
+
+    def record_scores(self, entries):
+        with self._write() as conn:
+            conn.executemany(INSERT_SCORE, [
+                (e['user_id'], e['book_id'], e['score'], e['achieved_at']) for e in entries])
+            conn.executemany(UPSERT_STATS, [
+                (e['user_id'], e['book_id'], e['score'], e['score'], 1, e['achieved_at']) for e in entries])
+            conn.executemany(UPSERT_LEADERBOARD, [
+                (e['book_id'], e['user_id'], e['username'], e['score']) for e in entries])
+
+    def user_scores_page(self, user_id, page_size, cursor=None):
+        sql = ("select s.id, s.score, s.achieved_at, b.name as book_name "
+               "from scores s left join bible_books b on b.id = s.book_id where s.user_id = ?")
+        params = [user_id]
+        if cursor:
+            achieved_at, score_id = cursor
+            sql += " and (s.achieved_at < ? or (s.achieved_at = ? and s.id < ?))"
+            params += [achieved_at, achieved_at, score_id]
+        sql += " order by s.achieved_at desc, s.id desc limit ?"
+        params.append(page_size + 1)
+        rows = [_book(row) for row in self._conn().execute(sql, params)]
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1]['achieved_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    def scores_page(self, after_id, limit=PAGE_SIZE):
+        return self._query("select id, user_id, book_id, score, achieved_at from scores "
+                           "where id > ? order by id limit ?",
+                           (after_id if after_id is not None else -1, limit))
+
+    # --- Leaderboard ---
+
+    def top_for_book(self, book_id, limit=10):
+        return self._query("select book_id, user_id, username, score from leaderboard "
+                           "where book_id = ? order by score desc limit ?", (book_id, limit))
+
+    def top_global(self, limit=20):
+        rows = self._conn().execute(
+            "select l.book_id, l.user_id, l.username, l.score, b.name as book_name "
+            "from leaderboard l left join bible_books b on b.id = l.book_id "
+            "order by l.score desc limit ?", (limit,))
+        return [_book(row) for row in rows]
+
+    def leaderboard_score(self, book_id, user_id):
+        rows = self._query("select score from leaderboard where book_id = ? and user_id = ?", (book_id, user_id))
+        return rows[0]['score'] if rows else None
+
+    def leaderboard_page(self, book_id, offset, limit=PAGE_SIZE):
+        return self._query("select user_id, score from leaderboard where book_id = ? "
+                           "order by user_id limit ? offset ?", (book_id, limit, offset))
+
+    # --- Per-user stats ---
+
+    def user_book_stats(self, user_id):
+        rows = self._conn().execute(
+            "select s.book_id, s.best_score, s.total_score, s.attempts, s.last_played_at, b.name as book_name "
+            "from user_book_stats s left join bible_books b on b.id = s.book_id "
+            "where s.user_id = ? order by s.last_played_at desc", (user_id,))
+        return [_book(row) for row in rows]
+
+    def upsert_user_book_stats(self, rows):
+        with self._write() as conn:
+            conn.executemany("""
+                insert or replace into user_book_stats
+                    (user_id, book_id, best_score, total_score, attempts, last_played_at)
+                values (:user_id, :book_id, :best_score, :total_score, :attempts, :last_played_at)
+            """, rows)
+
+    # --- Profiles ---
+
+    def profile_by_email(self, email):
+        rows = self._query("select id, email, church_code, username from profiles where email = ?", (email,))
+        return rows[0] if rows else None
+
+    def insert_profiles(self, profiles):
+        with self._write() as conn:
+            conn.executemany("insert into profiles (id, email, church_code, username, phone) "
+                             "values (:id, :email, :church_code, :username, :phone)",
+                             [dict({'phone': None}, **profile) for profile in profiles])
+        return list(profiles)
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("begin immediate")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("rollback" if exc_type else "commit")
+        return False
@@ -0,0 +1,393 @@
+import logging
+import os
+from datetime import datetime
+
+import user_stats
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+# User ids per select in _rows_for_pairs(): keeps the in.(...) filter well short of
+# URL length limits
+PAIR_CHUNK = 200
+# Rounds of compare-and-set before the fallback stats update gives up on a pair
+STATS_WRITE_ATTEMPTS = 5
+
+# Storage backends: every read and write of bible_books, questions, scores,
+# leaderboard, user_book_stats and profiles goes through one of these, so the app
+# and the tools can run against hosted Supabase or an embedded SQLite database
+# (sqlite_storage.py). Authentication stays with GoTrue.
+#
+# Methods are blocking and thread-safe. Rows are plain dicts shaped like the
+# PostgREST responses the templates already use, including embedded
+# 'bible_books': {'name': ...} where noted.
+
+
+class StorageBackend:
+    # --- Books ---
+
+    # [{'id', 'name'}] ordered by id
+    def list_books(self):
+        raise NotImplementedError
+
+    # Name of a book, or None if it doesn't exist
+    def book_name(self, book_id):
+        raise NotImplementedError
+
+    # --- Questions ---
+
+    # Every question of a book: id, question_text, option_a..d, correct_answer
+    def questions_for_book(self, book_id):
+        raise NotImplementedError
+
+    # [{'id', 'content_hash', 'correct_answer'}] of a book's questions, by id; a
+    # cheap check for whether a cached book changed (see question_pool.py)
+    def question_versions(self, book_id):
+        raise NotImplementedError
+
+    # Full question rows with id > after_id, by id; for exports
+    def questions_page(self, after_id, limit=PAGE_SIZE):
+        raise NotImplementedError
+
+    # Insert or update questions by content_hash (see sql/questions_content_hash.sql)
+    def upsert_questions(self, rows):
+        raise NotImplementedError
+
+    # --- Scores ---
+
+    # Append a finished attempt and keep the user's best score for the book on the
+    # leaderboard, atomically and in one round trip. Returns the best score.
+    def record_score(self, user_id, username, book_id, score):
+        raise NotImplementedError
+
+    # Bulk form of record_score(); entries are dicts with user_id, username,
+    # book_id, score and achieved_at
+    def record_scores(self, entries):
+        raise NotImplementedError
+
+    # Keyset page of a user's history, newest first: (rows, next_cursor) where rows
+    # have id, score, achieved_at and bible_books(name), and the cursor is
+    # (achieved_at, id) of the last row or None on the last page
+    def user_scores_page(self, user_id, page_size, cursor=None):
+        raise NotImplementedError
+
+    # [{'id', 'user_id', 'book_id', 'score', 'achieved_at'}] with id > after_id, by id
+    def scores_page(self, after_id, limit=PAGE_SIZE):
+        raise NotImplementedError
+
+    # --- Leaderboard ---
+
+    def top_for_book(self, book_id, limit=10):
+        raise NotImplementedError
+
+    # Highest scores across books, with bible_books(name)
+    def top_global(self, limit=20):
+        raise NotImplementedError
+
+    # The user's best score for a book, or None
+    def leaderboard_score(self, book_id, user_id):
+        raise NotImplementedError
+
+    # [{'user_id', 'score'}] of a book ordered by user_id, for rank_index.py
+    def leaderboard_page(self, book_id, offset, limit=PAGE_SIZE):
+        raise NotImplementedError
+
+    # --- Per-user stats (see user_stats.py) ---
+
+    # The user's rows with bible_books(name), most recently played first
+    def user_book_stats(self, user_id):
+        raise NotImplementedError
+
+    def upsert_user_book_stats(self, rows):
+        raise NotImplementedError
+
+    # --- Profiles ---
+
+    def profile_by_email(self, email):
+        raise NotImplementedError
+
+    def insert_profiles(self, profiles):
+        raise NotImplementedError
+
+
+# Hosted Supabase. Reads the app makes per request go through the async repository
+# (async_repo.py) so they can share one event loop; the rest use the sync
+# PostgREST client.
+class SupabaseStorage(StorageBackend):
+    def __init__(self, clients):
+        from clients import LazyRepository
+
+        self.client = clients
+        self.repo = LazyRepository(clients)
+        # Set to False the first time the database reports that record_quiz_score()
+        # or record_quiz_scores() is not installed (see sql/record_quiz_score.sql),
+        # so we stop paying for the failed call. One flag per function: either may
+        # be missing while the other is installed.
+        self.record_score_rpc_available = True
+        self.record_scores_rpc_available = True
+
+    # --- Books ---
+
+    def list_books(self):
+        return self.repo.list_books()
+
+    def book_name(self, book_id):
+        return self.repo.book_name(book_id)
+
+    # --- Questions ---
+
+    def questions_for_book(self, book_id):
+        return self.repo.questions_for_book(book_id)
+
+    def question_versions(self, book_id):
+        return self.repo.questions_for_book(book_id, 'id, content_hash, correct_answer')
+
+    def questions_page(self, after_id, limit=PAGE_SIZE):
+        return self._page('questions',
+                          'id, book_id, question_text, option_a, option_b, option_c, option_d, correct_answer, reference',
+                          after_id, limit)
+
+    def upsert_questions(self, rows):
+        self.client.table('questions').upsert(rows, on_conflict='content_hash').execute()
+
+    # --- Scores ---
+
+    def record_score(self, user_id, username, book_id, score):
+        if self.record_score_rpc_available:
+            try:
+                # One round trip: the database function inserts the score and applies
+                # "keep max" to the leaderboard atomically
+                response = self.client.rpc('record_quiz_score', {
+                    'p_user_id': user_id,
+                    'p_book_id': book_id,
+                    'p_username': username,
+                    'p_score': score
+                }).execute()
+                log.debug("Record score response: %s", response)
+                return response.data
+            except Exception as e:
+                if "PGRST202" not in str(e):
+                    raise
+                log.warning("record_quiz_score() is not installed, falling back to separate queries. Apply sql/record_quiz_score.sql.")
+                self.record_score_rpc_available = False
+
+        # Save score to 'scores' table
+        achieved_at = datetime.utcnow().isoformat()
+        score_response = self.client.table('scores').insert({
+            'user_id': user_id,
+            'book_id': book_id,
+            'score': score,
+            'achieved_at': achieved_at
+        }).execute()
+        log.debug("Score insert response: %s", score_response)
+
+        # Update leaderboard
+        current_leaderboard_score = self.leaderboard_score(book_id, user_id)
+        if current_leaderboard_score is not None:
+            log.debug("Found existing leaderboard score: %s", current_leaderboard_score)
+        else:
+            log.debug("No existing leaderboard entry found for this user and book.")
+            current_leaderboard_score = 0
+
+        # Only upsert if the new score is strictly higher
+        best = current_leaderboard_score
+        if score > current_leaderboard_score:
+            log.debug("New score (%s) is higher than current leaderboard score (%s). Upserting leaderboard...", score, current_leaderboard_score)
+            # Ensure you have RLS policies in Supabase that allow a user
+            # to INSERT/UPDATE rows in the 'leaderboard' table where user_id = auth.uid()
+            leaderboard_response = self.client.table('leaderboard').upsert({
+                'book_id': book_id,
+                'user_id': user_id,
+                'username': username,
+                'score': score
+            }).execute()
+            log.debug("Leaderboard upsert response: %s", leaderboard_response)
+            best = score
+        else:
+            log.debug("New score (%s) is not higher than current leaderboard score (%s). No leaderboard update needed.", score, current_leaderboard_score)
+
+        self._update_user_stats([{'user_id': user_id, 'book_id': book_id, 'score': score, 'achieved_at': achieved_at}])
+        return best
+
+    # One multi-row insert into 'scores' and one multi-row upsert of the per-user
+    # best into 'leaderboard' when record_quiz_scores() isn't installed.
+    def record_scores(self, entries):
+        if self.record_scores_rpc_available:
+            try:
+                self.client.rpc('record_quiz_scores', {'p_rows': entries}).execute()
+                return
+            except Exception as e:
+                if "PGRST202" not in str(e):
+                    raise
+                log.warning("record_quiz_scores() is not installed, falling back to separate queries. Apply sql/record_quiz_score.sql.")
+                self.record_scores_rpc_available = False
+
+        self.client.table('scores').insert([{
+            'user_id': entry['user_id'],
+            'book_id': entry['book_id'],
+            'score': entry['score'],
+            'achieved_at': entry['achieved_at']
+        } for entry in entries]).execute()
+
+        # Best score per (book, user) within the batch
+        best = {}
+        for entry in entries:
+            key = (entry['book_id'], entry['user_id'])
+            if key not in best or entry['score'] > best[key]['score']:
+                best[key] = entry
+
+        existing = self._rows_for_pairs('leaderboard', 'book_id, user_id, score',
+                                        [(user_id, book_id) for book_id, user_id in best])
+        current = {(book_id, user_id): row['score'] for (user_id, book_id), row in existing.items()}
+
+        upserts = [{
+            'book_id': entry['book_id'],
+            'user_id': entry['user_id'],
+            'username': entry['username'],
+            'score': entry['score']
+        } for key, entry in best.items() if entry['score'] > current.get(key, 0)]
+        if upserts:
+            self.client.table('leaderboard').upsert(upserts).execute()
+
+        self._update_user_stats(entries)
+
+    def user_scores_page(self, user_id, page_size, cursor=None):
+        return self.repo.user_scores_page(user_id, page_size, cursor)
+
+    def scores_page(self, after_id, limit=PAGE_SIZE):
+        return self._page('scores', 'id, user_id, book_id, score, achieved_at', after_id, limit)
+
+    # --- Leaderboard ---
+
+    def top_for_book(self, book_id, limit=10):
+        return self.repo.top_for_book(book_id, limit)
+
+    def top_global(self, limit=20):
+        return self.repo.top_global(limit)
+
+    def leaderboard_score(self, book_id, user_id):
+        return self.repo.leaderboard_score(book_id, user_id)
+
+    def leaderboard_page(self, book_id, offset, limit=PAGE_SIZE):
+        response = self.client.table('leaderboard') \
+            .select('user_id, score') \
+            .eq('book_id', book_id) \
+            .order('user_id', desc=False) \
+            .range(offset, offset + limit - 1) \
+            .execute()
+        return response.data if response and hasattr(response, 'data') else []
+
+    # --- Per-user stats ---
+
+    def user_book_stats(self, user_id):
+        response = self.client.table('user_book_stats') \
+            .select('book_id, best_score, total_score, attempts, last_played_at, bible_books(name)') \
+            .eq('user_id', user_id) \
+            .order('last_played_at', desc=True) \
+            .execute()
+        return response.data if response and hasattr(response, 'data') else []
+
+    def upsert_user_book_stats(self, rows):
+        self.client.table('user_book_stats').upsert(rows, on_conflict='user_id,book_id').execute()
+
+    # --- Profiles ---
+
+    def profile_by_email(self, email):
+        return self.repo.profile_by_email(email)
+
+    def insert_profiles(self, profiles):
+        return self.repo.insert_profiles(profiles)
+
+    # Keep the per-user stats rollup current on the fallback path (the database
+    # functions do this themselves). The score is already saved, so failures only log.
+    def _update_user_stats(self, entries):
+        try:
+            pending = user_stats.aggregate(entries)
+            for _ in range(STATS_WRITE_ATTEMPTS):
+                pending = self._merge_user_stats(pending)
+                if not pending:
+                    return
+            log.error("Gave up updating user stats for %d pairs after %d attempts (run 'python user_stats.py' "
+                      "to rebuild)", len(pending), STATS_WRITE_ATTEMPTS)
+        except Exception as e:
+            log.error("Failed to update user stats (run 'python user_stats.py' to rebuild): %s", e)
+
+    # Fold a batch of {(user_id, book_id): stats} into the stored rows. PostgREST
+    # can't express attempts = attempts + n, so this is compare-and-set: a stored row
+    # is only updated while it still has the attempts count it was read with, and
+    # new rows are inserted with ignore-duplicates. Returns the pairs another writer
+    # changed in between, to be read again and retried.
+    def _merge_user_stats(self, batch):
+        existing = self._rows_for_pairs(
+            'user_book_stats', 'user_id, book_id, best_score, total_score, attempts, last_played_at', batch)
+        conflicts = {}
+
+        new_keys = [key for key in batch if key not in existing]
+        if new_keys:
+            response = self.client.table('user_book_stats') \
+                .upsert([batch[key] for key in new_keys], on_conflict='user_id,book_id', ignore_duplicates=True) \
+                .execute()
+            inserted = {(row['user_id'], row['book_id']) for row in (response.data or [])}
+            conflicts.update({key: batch[key] for key in new_keys if key not in inserted})
+
+        for (user_id, book_id), row in existing.items():
+            stats = batch[(user_id, book_id)]
+            response = self.client.table('user_book_stats').update({
+                'best_score': max(stats['best_score'], row['best_score']),
+                'total_score': stats['total_score'] + row['total_score'],
+                'attempts': stats['attempts'] + row['attempts'],
+                'last_played_at': max(stats['last_played_at'], row['last_played_at'] or ''),
+            }).eq('user_id', user_id).eq('book_id', book_id).eq('attempts', row['attempts']).execute()
+            if not response.data:
+                conflicts[(user_id, book_id)] = stats
+        return conflicts
+
+    # A table's rows for exactly these (user_id, book_id) pairs, keyed by pair. One
+    # select per book and chunk of users: there is at most one row per pair, so a
+    # response never hits PostgREST's max-rows limit and drops rows, and pairs that
+    # weren't asked for (another book of the same user) aren't fetched.
+    def _rows_for_pairs(self, table, columns, pairs):
+        users_by_book = {}
+        for user_id, book_id in pairs:
+            users_by_book.setdefault(book_id, set()).add(user_id)
+        rows = {}
+        for book_id, user_ids in users_by_book.items():
+            user_ids = sorted(user_ids)
+            for start in range(0, len(user_ids), PAIR_CHUNK):
+                response = self.client.table(table) \
+                    .select(columns) \
+                    .eq('book_id', book_id) \
+                    .in_('user_id', user_ids[start:start + PAIR_CHUNK]) \
+                    .execute()
+                for row in response.data or []:
+                    rows[(row['user_id'], row['book_id'])] = row
+        return rows
+
+    # Keyset pagination on id so each page is an index range scan
+    def _page(self, table, columns, after_id, limit):
+        query = self.client.table(table).select(columns)
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        response = query.order('id', desc=False).limit(limit).execute()
+        return response.data if response and hasattr(response, 'data') else []
+
+
+# The backend selected by STORAGE_BACKEND ("supabase", the default, or "sqlite"
+# with SQLITE_PATH). For Supabase, `clients` is a clients.SupabaseClients; one is
+# created from SUPABASE_URL/SUPABASE_KEY/SUPABASE_SERVICE_ROLE_KEY when omitted. Returns None when Supabase
+# isn't configured.
+def create_storage(clients=None):
+    backend = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+    if backend == 'sqlite':
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage(os.environ.get("SQLITE_PATH", "quiz.db"))
+    if backend != 'supabase':
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected 'supabase' or 'sqlite'")
+    if clients is None:
+        url = os.environ.get("SUPABASE_URL")
+        key = os.environ.get("SUPABASE_KEY")
+        if not url or not key:
+            return None
+        from clients import SupabaseClients
+        clients = SupabaseClients(url, key, service_key=os.environ.get("SUPABASE_SERVICE_ROLE_KEY"))
+    return SupabaseStorage(clients)
@@ -0,0 +1,193 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+import metrics
+
+# Structured logging for the app, written by a background thread.
+#
+# Request threads only build a LogRecord and put it on a bounded queue; the
+# message (and the repr of its arguments) is formatted by the listener thread, so
+# use lazy %-style arguments, e.g. log.debug("Auth response: %r", res). Records
+# below the active level are discarded before any formatting happens.
+#
+# Per-route configuration (routes as in the Flask url rule, e.g. /submit-answer):
+#   LOG_LEVEL         default level (INFO)
+#   LOG_ROUTE_LEVELS  per-route levels, e.g. "/login=DEBUG,/submit-answer=WARNING"
+#   LOG_SAMPLE_RATES  fraction of records below WARNING kept per route,
+#                     e.g. "/complete-quiz=0.1,*=1"
+#   LOG_QUEUE_SIZE    records held before new ones are dropped (10000)
+#   LOG_FORMAT        json (one object per line) or text
+#
+# When the queue is three quarters full, records below WARNING are dropped; when it
+# is full everything is. Drops are counted on /metrics and reported in the log once
+# there is room again.
+
+DROP_BELOW_LEVEL = logging.WARNING
+
+# Libraries that log every HTTP call at INFO; kept at WARNING
+QUIET_LOGGERS = ('httpx', 'httpcore', 'hpack')
+
+log_records_dropped = metrics.Counter('quiz_log_records_dropped_total',
+                                      'Log records dropped because the log queue was full.', ('level',))
+
+# Attributes every LogRecord has; anything else was passed with extra= and is
+# written as a field of its own
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'route', 'taskName'}
+
+
+def _parse_routes(value, convert):
+    settings = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        route, setting = item.rsplit('=', 1)
+        settings[route.strip()] = convert(setting.strip())
+    return settings
+
+
+def _level(name):
+    level = logging.getLevelName(name.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+# Tags each record with the route being served and applies that route's level and
+# sampling rate. Runs in the thread that logs, before the record is queued.
+class RouteFilter(logging.Filter):
+    def __init__(self, level=logging.INFO, route_levels=None, sample_rates=None):
+        super().__init__()
+        self.level = level
+        self.route_levels = route_levels or {}
+        self.sample_rates = dict(sample_rates or {})
+        self.default_rate = self.sample_rates.pop('*', 1.0)
+
+    def filter(self, record):
+        scope = metrics.current_scope()
+        route = None
+        if scope is not None:
+            route = record.route = scope.route
+        if record.levelno < self.route_levels.get(route, self.level):
+            return False
+        if record.levelno >= DROP_BELOW_LEVEL:
+            return True
+        rate = self.sample_rates.get(route, self.default_rate)
+        return rate >= 1 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.high_water = max(1, maxsize * 3 // 4)
+        self.dropped = 0  # Since the last report; approximate under concurrency
+
+    # queue.Queue is thread-safe, so records are queued without taking the handler lock
+    def handle(self, record):
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    # Queue the record as is: formatting happens in the listener thread
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        if record.levelno < DROP_BELOW_LEVEL and self.queue.qsize() >= self.high_water:
+            return self._drop(record)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            return self._drop(record)
+        if self.dropped:
+            self._report_drops()
+
+    def _drop(self, record):
+        self.dropped += 1
+        log_records_dropped.inc(record.levelname)
+
+    def _report_drops(self):
+        dropped, self.dropped = self.dropped, 0
+        record = logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+            'msg': "Dropped %d log records because the log queue was full", 'args': (dropped,),
+        })
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += dropped
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if hasattr(record, 'route'):
+            entry['route'] = record.route
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=repr)
+
+
+# Stopping waits for the records already queued to be written
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+_listener = None
+
+
+# Route the root logger through the queue. Safe to call more than once.
+def setup(level=None, route_levels=None, sample_rates=None, queue_size=None, fmt=None, stream=None):
+    global _listener
+    if _listener is not None:
+        return _listener
+    level = _level(level or os.environ.get('LOG_LEVEL', 'INFO'))
+    if route_levels is None:
+        route_levels = _parse_routes(os.environ.get('LOG_ROUTE_LEVELS'), _level)
+    if sample_rates is None:
+        sample_rates = _parse_routes(os.environ.get('LOG_SAMPLE_RATES'), float)
+    queue_size = queue_size or int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if fmt == 'text':
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(route)s] %(name)s: %(message)s',
+                                              defaults={'route': '-'}))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(queue_size)
+    handler.addFilter(RouteFilter(level, route_levels, sample_rates))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    # The lowest configured level, so the filter sees records a route may want
+    root.setLevel(min([level, *route_levels.values()]))
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(level, logging.WARNING))
+
+    _listener = _Listener(handler.queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
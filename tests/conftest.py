@@ -0,0 +1,53 @@
+import sys
+import time
+from pathlib import Path
+
+import jwt
+import pytest
+
+# The Flask app against the SQLite backend, with locally signed access tokens; no
+# Supabase project is contacted. app.init_services() sets up process-wide
+# services once, so every test module shares this one app.
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+JWT_SECRET = 'test-jwt-secret'
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('app')
+    env = {
+        'SUPABASE_URL': 'http://127.0.0.1:9',
+        'SUPABASE_KEY': 'anon',
+        'SUPABASE_SERVICE_ROLE_KEY': 'service',
+        'SUPABASE_JWT_SECRET': JWT_SECRET,
+        'STORAGE_BACKEND': 'sqlite',
+        'SQLITE_PATH': str(tmp / 'quiz.db'),
+        'SESSION_BACKEND': 'memory',
+        'QUESTION_SNAPSHOT_PATH': str(tmp / 'question_bank.snap'),
+        'FLASK_SECRET_KEY': 'test-secret',
+    }
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in env.items():
+            mp.setenv(name, value)
+        import app
+        flask_app = app.create_app()
+        flask_app.config['TESTING'] = True
+        yield app, flask_app
+
+
+# A test client logged in as the given user
+@pytest.fixture(scope='session')
+def login(app_module):
+    _, flask_app = app_module
+
+    def login(user_id, username):
+        client = flask_app.test_client()
+        token = jwt.encode({'sub': user_id, 'aud': 'authenticated', 'exp': time.time() + 3600}, JWT_SECRET)
+        with client.session_transaction() as s:
+            s['access_token'] = token
+            s['username'] = username
+            s['church_code'] = 'C1'
+        return client
+    return login
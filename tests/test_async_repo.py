@@ -0,0 +1,110 @@
+import inspect
+import json
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# SupabaseStorage -> SyncRepository -> AsyncRepository against a local HTTP server
+# standing in for PostgREST, so the requests the repository makes can be checked.
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from async_repo import AsyncRepository  # noqa: E402
+from clients import SupabaseClients  # noqa: E402
+from storage import SupabaseStorage  # noqa: E402
+
+
+class PostgrestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def _respond(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.requests.append({
+            'method': self.command,
+            'path': url.path,
+            'query': parse_qs(url.query),
+            'authorization': self.headers.get('Authorization'),
+            'body': json.loads(body) if body else None,
+        })
+        payload = json.dumps(self.server.responses.get(url.path, [])).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PostgrestHandler)
+    server.requests = []
+    server.responses = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def storage(server):
+    clients = SupabaseClients(f'http://127.0.0.1:{server.server_address[1]}', 'anon', service_key='service')
+    yield SupabaseStorage(clients)
+    clients.repo.close()
+
+
+def test_profile_by_email_uses_the_service_key(server, storage):
+    profile = {'id': 'u1', 'email': 'anna@example.com', 'church_code': 'C1', 'username': 'anna'}
+    server.responses['/rest/v1/profiles'] = [profile]
+
+    assert storage.profile_by_email('anna@example.com') == profile
+    request, = server.requests
+    assert request['query']['email'] == ['eq.anna@example.com']
+    assert request['authorization'] == 'Bearer service'
+
+
+def test_insert_profiles(server, storage):
+    rows = [{'id': 'u1', 'email': 'anna@example.com', 'church_code': 'C1', 'username': 'anna'}]
+    server.responses['/rest/v1/profiles'] = rows
+
+    assert storage.insert_profiles(rows) == rows
+    request, = server.requests
+    assert (request['method'], request['body']) == ('POST', rows)
+
+
+def test_user_scores_page_keyset(server, storage):
+    rows = [{'id': 9 - i, 'score': i, 'achieved_at': f'2026-01-0{9 - i}T00:00:00+00:00',
+             'bible_books': {'name': 'Kejadian'}} for i in range(3)]
+    server.responses['/rest/v1/scores'] = rows
+
+    page, cursor = storage.user_scores_page('u1', 2, ('2026-01-10T00:00:00+00:00', 10))
+    assert page == rows[:2]
+    assert cursor == ('2026-01-08T00:00:00+00:00', 8)
+    query = server.requests[0]['query']
+    assert query['limit'] == ['3']
+    assert query['or'] == ['(achieved_at.lt."2026-01-10T00:00:00+00:00",'
+                           'and(achieved_at.eq."2026-01-10T00:00:00+00:00",id.lt.10))']
+
+
+# Every repository call is reachable from SupabaseStorage, and every call it
+# delegates exists on the repository
+def test_storage_and_repository_agree():
+    source = inspect.getsource(SupabaseStorage)
+    delegated = set(re.findall(r'self\.repo\.(\w+)\(', source))
+    defined = {name for name, member in inspect.getmembers(AsyncRepository, inspect.iscoroutinefunction)
+               if not name.startswith('_')} - {'aclose'}
+    assert delegated == defined
@@ -0,0 +1,122 @@
+import pytest
+
+# Grading through /submit-answer, /complete-quiz and /submit-quiz with attempt
+# tokens (app fixture in conftest.py)
+
+USER_ID = '00000000-0000-0000-0000-000000000002'
+BOOK_ID = 2
+QUESTIONS = [(101, 'A'), (102, 'B'), (103, 'C')]
+
+
+@pytest.fixture
+def app(app_module):
+    return app_module[0]
+
+
+@pytest.fixture
+def client(login):
+    return login(USER_ID, 'ben')
+
+
+@pytest.fixture
+def token(app):
+    return app.attempt_tokens.issue(BOOK_ID, QUESTIONS)
+
+
+def answer(client, token, question_id, choice):
+    return client.post('/submit-answer', json={'attempt_token': token, 'question_id': question_id, 'answer': choice})
+
+
+def answers(*choices):
+    return [{'question_id': question_id, 'answer': choice} for (question_id, _), choice in zip(QUESTIONS, choices)]
+
+
+def scores_saved(app):
+    return len(app.storage.user_scores_page(USER_ID, 100)[0])
+
+
+# --- Tokens ---
+
+def tampered(token):
+    payload, timestamp, signature = token.rsplit('.', 2)
+    return f"{payload}.{timestamp}.{'A' if signature[0] != 'A' else 'B'}{signature[1:]}"
+
+
+@pytest.mark.parametrize('path', ['/submit-answer', '/complete-quiz', '/submit-quiz'])
+def test_tampered_token_is_rejected(client, token, path):
+    response = client.post(path, json={'attempt_token': tampered(token), 'question_id': 101, 'answer': 'A',
+                                       'answers': answers('A')})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('path', ['/submit-answer', '/complete-quiz', '/submit-quiz'])
+def test_expired_token_is_rejected(app, client, token, monkeypatch, path):
+    monkeypatch.setattr(app.attempt_tokens, 'max_age', -1)
+    response = client.post(path, json={'attempt_token': token, 'question_id': 101, 'answer': 'A',
+                                       'answers': answers('A')})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('path', ['/submit-answer', '/complete-quiz', '/submit-quiz'])
+def test_missing_token_is_rejected(client, path):
+    response = client.post(path, json={'question_id': 101, 'answer': 'A', 'answers': answers('A')})
+    assert response.status_code == 400
+
+
+def test_question_from_another_attempt_is_rejected(client, token):
+    assert answer(client, token, 999, 'A').status_code == 400
+    response = client.post('/complete-quiz', json={'attempt_token': token,
+                                                   'answers': [{'question_id': 999, 'answer': 'A'}]})
+    assert response.status_code == 400
+
+
+# --- One submission per attempt ---
+
+def test_attempt_is_submitted_once(app, client, token):
+    before = scores_saved(app)
+    first = client.post('/complete-quiz', json={'attempt_token': token, 'answers': answers('A', 'B', 'C')})
+    assert first.status_code == 200
+    assert first.get_json()['score'] == 3
+
+    again = client.post('/complete-quiz', json={'attempt_token': token, 'answers': answers('A', 'B', 'C')})
+    assert again.status_code == 409
+    assert client.post('/submit-quiz', json={'attempt_token': token, 'answers': answers('A')}).status_code == 409
+    assert scores_saved(app) == before + 1
+
+
+def test_failed_save_can_be_retried(app, client, token, monkeypatch):
+    def fail(*args):
+        raise RuntimeError('database is unavailable')
+    monkeypatch.setattr(app, 'save_score', fail)
+    assert client.post('/submit-quiz', json={'attempt_token': token, 'answers': answers('A')}).status_code == 500
+
+    monkeypatch.undo()
+    response = client.post('/submit-quiz', json={'attempt_token': token, 'answers': answers('A')})
+    assert response.status_code == 200
+    assert response.get_json()['results'] == {'101': True}
+
+
+# --- Per-question feedback ---
+
+def test_first_answer_is_locked_in(client, token):
+    first = answer(client, token, 101, 'D').get_json()
+    assert first == {'correct': False, 'correct_answer': 'A', 'answer': 'D'}
+    second = answer(client, token, 101, 'A').get_json()
+    assert second == {'correct': False, 'correct_answer': 'A', 'answer': 'D'}
+
+    response = client.post('/submit-quiz', json={'attempt_token': token, 'answers': answers('A', 'B')})
+    assert response.get_json()['results'] == {'101': False, '102': True}
+    assert response.get_json()['score'] == 1
+
+
+def test_locked_answer_counts_even_if_not_resent(client, token):
+    answer(client, token, 103, 'C')
+    response = client.post('/submit-quiz', json={'attempt_token': token, 'answers': answers('A')})
+    assert response.get_json()['results'] == {'101': True, '103': True}
+
+
+def test_nothing_is_revealed_after_submission(client, token):
+    client.post('/complete-quiz', json={'attempt_token': token, 'answers': answers('A')})
+    response = answer(client, token, 102, 'B')
+    assert response.status_code == 409
+    assert 'correct_answer' not in response.get_json()
@@ -0,0 +1,197 @@
+import sys
+import time
+from pathlib import Path
+
+import jwt
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from auth_tokens import ExpiredToken, InvalidToken, SigningKeys, TokenVerifier  # noqa: E402
+
+SECRET = 'test-jwt-secret'
+
+
+def claims(**overrides):
+    return {'sub': 'u1', 'aud': 'authenticated', 'exp': time.time() + 3600, **overrides}
+
+
+def hs256(secret=SECRET, **overrides):
+    return jwt.encode(claims(**overrides), secret)
+
+
+# A token that claims an asymmetric algorithm; its signature is never checked
+# locally in these tests, so it doesn't have to be valid
+def es256(kid='k1', **overrides):
+    header = jwt.utils.base64url_encode(f'{{"alg":"ES256","typ":"JWT","kid":"{kid}"}}'.encode()).decode()
+    payload = jwt.utils.base64url_encode(jwt.api_jws.json.dumps(claims(**overrides)).encode()).decode()
+    return f'{header}.{payload}.c2lnbmF0dXJl'
+
+
+class RemoteCheck:
+    def __init__(self, accept=True):
+        self.accept = accept
+        self.calls = 0
+
+    def __call__(self, token):
+        self.calls += 1
+        return self.accept
+
+
+# --- HS256 with the project secret ---
+
+def test_hs256_token_is_verified_once():
+    remote = RemoteCheck()
+    verifier = TokenVerifier(secret=SECRET, remote_check=remote)
+    token = hs256()
+    assert verifier.verify(token)['sub'] == 'u1'
+    assert verifier.verify(token)['sub'] == 'u1'
+    assert remote.calls == 0
+
+
+def test_hs256_token_with_wrong_signature_is_rejected():
+    with pytest.raises(InvalidToken):
+        TokenVerifier(secret=SECRET).verify(hs256(secret='someone-else'))
+
+
+def test_tampered_claims_are_rejected():
+    header, _, signature = hs256().split('.')
+    payload = jwt.utils.base64url_encode(jwt.api_jws.json.dumps(claims(sub='u2')).encode()).decode()
+    with pytest.raises(InvalidToken):
+        TokenVerifier(secret=SECRET).verify(f'{header}.{payload}.{signature}')
+
+
+def test_expired_token_raises_expired():
+    with pytest.raises(ExpiredToken):
+        TokenVerifier(secret=SECRET).verify(hs256(exp=time.time() - 60))
+
+
+def test_memoized_token_expires():
+    verifier = TokenVerifier(secret=SECRET)
+    token = hs256(exp=time.time() + 1)
+    verifier.verify(token)
+    verifier._verified[token]['exp'] = time.time() - 1
+    with pytest.raises(ExpiredToken):
+        verifier.verify(token)
+
+
+def test_forgotten_token_is_decoded_again():
+    verifier = TokenVerifier(secret=SECRET)
+    token = hs256()
+    verifier.verify(token)
+    verifier.forget(token)
+    assert token not in verifier._verified
+
+
+def test_wrong_audience_is_rejected():
+    with pytest.raises(InvalidToken):
+        TokenVerifier(secret=SECRET).verify(hs256(aud='anon'))
+
+
+def test_unsupported_algorithm_is_rejected():
+    token = jwt.encode(claims(), SECRET, algorithm='HS512')
+    with pytest.raises(InvalidToken):
+        TokenVerifier(secret=SECRET, remote_check=RemoteCheck()).verify(token)
+
+
+# --- Remote check with GoTrue ---
+
+def test_hs256_without_secret_is_checked_remotely_once():
+    remote = RemoteCheck()
+    verifier = TokenVerifier(remote_check=remote)
+    token = hs256()
+    assert verifier.verify(token)['sub'] == 'u1'
+    assert verifier.verify(token)['sub'] == 'u1'
+    assert remote.calls == 1
+
+
+def test_remote_rejection():
+    with pytest.raises(InvalidToken):
+        TokenVerifier(remote_check=RemoteCheck(accept=False)).verify(hs256())
+
+
+def test_expired_token_is_not_sent_for_a_remote_check():
+    remote = RemoteCheck()
+    with pytest.raises(ExpiredToken):
+        TokenVerifier(remote_check=remote).verify(hs256(exp=time.time() - 60))
+    assert remote.calls == 0
+
+
+def test_no_key_and_no_remote_check():
+    with pytest.raises(InvalidToken):
+        TokenVerifier().verify(hs256())
+
+
+# --- Asymmetric keys from the JWKS ---
+
+@pytest.mark.parametrize('fetch', [
+    lambda: {'keys': []},
+    lambda: {'keys': [{'kty': 'unsupported', 'kid': 'k1'}]},
+], ids=['unknown kid', 'unusable key'])
+def test_asymmetric_token_without_a_usable_key_is_checked_remotely(fetch):
+    remote = RemoteCheck()
+    verifier = TokenVerifier(signing_keys=SigningKeys(fetch), remote_check=remote)
+    assert verifier.verify(es256())['sub'] == 'u1'
+    assert remote.calls == 1
+
+
+def test_asymmetric_token_when_the_jwks_cannot_be_fetched_is_checked_remotely():
+    def fetch():
+        raise OSError('connection refused')
+
+    remote = RemoteCheck()
+    verifier = TokenVerifier(signing_keys=SigningKeys(fetch), remote_check=remote)
+    assert verifier.verify(es256())['sub'] == 'u1'
+    assert remote.calls == 1
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval():
+    fetches = []
+
+    def fetch():
+        fetches.append(time.monotonic())
+        return {'keys': []}
+
+    keys = SigningKeys(fetch, ttl=600, min_refetch_interval=30)
+    assert keys.get('k1') is None
+    assert keys.get('k2') is None
+    assert len(fetches) == 1
+    keys._fetched_at -= 30
+    assert keys.get('k2') is None
+    assert len(fetches) == 2
+
+
+def test_failed_refetch_keeps_the_keys_it_has():
+    calls = []
+    document = {'keys': [{'kty': 'oct', 'kid': 'k1', 'k': jwt.utils.base64url_encode(b'secret').decode()}]}
+
+    def fetch():
+        calls.append(1)
+        if len(calls) > 1:
+            raise OSError('connection refused')
+        return document
+
+    keys = SigningKeys(fetch, ttl=600)
+    assert keys.get('k1') is not None
+    keys._fetched_at -= 600
+    assert keys.get('k1') is not None
+    assert len(calls) == 2
+
+
+def test_es256_token_is_verified_with_the_published_key():
+    pytest.importorskip('cryptography')
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    public_jwk = jwt.algorithms.ECAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    public_jwk.update(kid='k1', alg='ES256')
+    token = jwt.encode(claims(), private_key, algorithm='ES256', headers={'kid': 'k1'})
+
+    remote = RemoteCheck()
+    verifier = TokenVerifier(signing_keys=SigningKeys(lambda: {'keys': [public_jwk]}), remote_check=remote)
+    assert verifier.verify(token)['sub'] == 'u1'
+    assert remote.calls == 0
+
+    other_key = ec.generate_private_key(ec.SECP256R1())
+    with pytest.raises(InvalidToken):
+        verifier.verify(jwt.encode(claims(), other_key, algorithm='ES256', headers={'kid': 'k1'}))
@@ -0,0 +1,72 @@
+import asyncio
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from http_pool import PoolConfig, SharedPool  # noqa: E402
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool():
+    pool = SharedPool(PoolConfig.from_env({'HTTP2': '0'}))
+    yield pool
+    pool.close()
+
+
+# Closing one client, or leaving its `with` block, must not close the
+# connections other clients are using
+def test_closing_a_client_keeps_the_shared_connections(url, pool):
+    pool.client().get(url)
+    assert len(pool.transport._pool.connections) == 1
+
+    with pool.client() as client:
+        client.get(url)
+    pool.client().close()
+    assert len(pool.transport._pool.connections) == 1
+    assert pool.client().get(url).status_code == 200
+
+
+def test_closing_an_async_client_keeps_the_shared_connections(url, pool):
+    async def run():
+        await pool.async_client().get(url)
+        async with pool.async_client() as client:
+            await client.get(url)
+        await pool.async_client().aclose()
+        assert len(pool.async_transport()._pool.connections) == 1
+        await pool.async_transport().aclose_pool()
+
+    asyncio.run(run())
+
+
+def test_pool_close_closes_the_connections(url, pool):
+    pool.client().get(url)
+    pool.close()
+    assert pool.transport._pool.connections == []
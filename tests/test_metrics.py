@@ -0,0 +1,64 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import metrics  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, '_metrics', list(metrics._metrics))
+
+
+class Source:
+    def __init__(self, **stats):
+        self.stats = stats
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.stats
+
+
+def lines(name):
+    return [line for line in metrics.render().splitlines() if line.startswith(name)]
+
+
+def test_service_metrics_read_their_source_once():
+    source = Source(books=3, hits=10, age=None)
+    metrics.ServiceMetric('quiz_books', 'Books.', source, 'books')
+    metrics.ServiceMetric('quiz_hits_total', 'Hits.', source, 'hits', type='counter')
+    metrics.ServiceMetric('quiz_age_seconds', 'Age.', source, 'age')
+    metrics.ServiceMetric('quiz_missing', 'Not in the stats.', source, 'missing')
+
+    text = metrics.render()
+    assert source.calls == 1
+    assert 'quiz_books 3' in text.splitlines()
+    assert '# TYPE quiz_hits_total counter' in text
+    assert 'quiz_hits_total 10' in text.splitlines()
+    assert lines('quiz_age_seconds') == []
+    assert lines('quiz_missing') == []
+
+
+def test_failing_source_is_left_out():
+    def source():
+        raise RuntimeError('not loaded')
+    metrics.ServiceMetric('quiz_books', 'Books.', source, 'books')
+    assert lines('quiz_books') == []
+
+
+def test_workers_are_summed_unless_merged_otherwise(tmp_path):
+    metrics.ServiceMetric('quiz_books', 'Books.', Source(books=3, age=5.0), 'books')
+    metrics.ServiceMetric('quiz_age_seconds', 'Age.', Source(books=3, age=5.0), 'age', merge=max)
+    exporter = metrics.MultiProcessExporter(str(tmp_path))
+    other = tmp_path / f'metrics-{os.getpid() + 1}.json'
+    other.write_text(json.dumps([['quiz_books', [], 4], ['quiz_age_seconds', [], 2.0]]))
+
+    values = exporter.collect()
+    assert values[('quiz_books', ())] == 7
+    assert values[('quiz_age_seconds', ())] == 5.0
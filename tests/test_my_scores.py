@@ -0,0 +1,62 @@
+import html
+import re
+
+import pytest
+
+# /my-scores pagination (app fixture in conftest.py)
+
+USER_ID = '00000000-0000-0000-0000-000000000001'
+
+
+@pytest.fixture(scope='module')
+def client(app_module, login):
+    app, _ = app_module
+    for score in range(3):
+        app.storage.record_score(USER_ID, 'anna', 1, score)
+    return login(USER_ID, 'anna')
+
+
+def test_pages_follow_the_next_cursor(client):
+    first = client.get('/my-scores?page_size=2')
+    assert first.status_code == 200
+    next_url = html.unescape(re.search(r'href="([^"]*before_id=[^"]*)"', first.get_data(as_text=True)).group(1))
+
+    second = client.get(next_url)
+    assert second.status_code == 200
+    assert 'before_id=' not in second.get_data(as_text=True)
+
+
+# As returned by PostgREST (trailing zeros trimmed) and by the SQLite backend
+@pytest.mark.parametrize('before_at', [
+    '2026-01-01T10:00:12.12345+00:00',
+    '2026-01-01T10:00:12.1+00:00',
+    '2026-01-01T10:00:12+00:00',
+    '2026-01-01T10:00:12.123456',
+    '2026-01-01T10:00:12Z',
+])
+def test_cursor_is_passed_on_unchanged(app_module, client, monkeypatch, before_at):
+    app, _ = app_module
+    cursors = []
+    user_scores_page = app.storage.user_scores_page
+
+    def record_cursor(user_id, page_size, cursor=None):
+        cursors.append(cursor)
+        return user_scores_page(user_id, page_size, cursor)
+    monkeypatch.setattr(app.storage, 'user_scores_page', record_cursor)
+
+    response = client.get('/my-scores', query_string={'before_at': before_at, 'before_id': '7'})
+    assert response.status_code == 200
+    assert cursors == [(before_at, 7)]
+
+
+@pytest.mark.parametrize('args', [
+    {'before_at': '2026-01-01T00:00:00",id.gt.0,or(id.gt.0', 'before_id': '1'},
+    {'before_at': '2026-01-01T00:00:00', 'before_id': '1),id.gt.(0'},
+    {'before_at': 'yesterday', 'before_id': '1'},
+    {'before_at': '2026-01-01T00:00:00'},
+    {'before_id': '1'},
+    {'before_at': '2026-01-01T00:00:00', 'before_id': '\u00b2'},
+    {'before_at': '2026-01-01T00:00:00.1234567', 'before_id': '1'},
+])
+def test_malformed_cursor_is_rejected(client, args):
+    assert client.get('/my-scores', query_string=args).status_code == 400
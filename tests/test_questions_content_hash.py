@@ -0,0 +1,70 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The content_hash backfill in sql/questions_content_hash.sql against
+# question_import.content_hash(), in a real PostgreSQL database (see
+# test_sql_functions.py). Rolled back at the end.
+
+psycopg = pytest.importorskip('psycopg')
+
+DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason='TEST_DATABASE_URL is not set')
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import question_import  # noqa: E402
+
+BOOK_ID = 990002
+
+SCAFFOLD = """
+create table if not exists public.bible_books (
+    id bigint primary key,
+    name text not null
+);
+create table if not exists public.questions (
+    id bigserial primary key,
+    book_id bigint not null references public.bible_books (id),
+    question_text text not null,
+    option_a text not null,
+    option_b text not null,
+    option_c text not null,
+    option_d text not null,
+    correct_answer text not null,
+    reference text
+);
+"""
+
+
+@pytest.mark.parametrize('padding', [' ', '\t', '\r\n', ' \t\n '])
+def test_backfill_matches_the_importer(padding):
+    raw = {
+        'book_id': str(BOOK_ID),
+        'question_text': f'{padding}Siapakah yang membina bahtera?{padding}',
+        'option_a': f'{padding}Nuh',
+        'option_b': f'Musa{padding}',
+        'option_c': 'Abraham',
+        'option_d': f'{padding}Daud{padding}',
+        'correct_answer': 'A',
+        'reference': 'Kejadian 6:14',
+    }
+    with psycopg.connect(DATABASE_URL) as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(SCAFFOLD)
+                cur.execute("insert into public.bible_books (id, name) values (%s, 'Kejadian') on conflict (id) do nothing",
+                            (BOOK_ID,))
+                cur.execute("alter table public.questions add column if not exists content_hash text")
+                cur.execute("insert into public.questions (book_id, question_text, option_a, option_b, option_c, "
+                            "option_d, correct_answer, reference) values (%(book_id)s, %(question_text)s, "
+                            "%(option_a)s, %(option_b)s, %(option_c)s, %(option_d)s, %(correct_answer)s, "
+                            "%(reference)s) returning id", raw)
+                question_id = cur.fetchone()[0]
+                cur.execute((ROOT / 'sql' / 'questions_content_hash.sql').read_text())
+                cur.execute("select content_hash from public.questions where id = %s", (question_id,))
+                assert cur.fetchone()[0] == question_import.validate(raw)['content_hash']
+        finally:
+            conn.rollback()
@@ -0,0 +1,111 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import rank_index  # noqa: E402
+from rank_index import BookRanks, RankIndex  # noqa: E402
+
+
+def ranks(scores, max_score=20):
+    book = BookRanks(max_score)
+    book.load([{'user_id': user_id, 'score': score} for user_id, score in scores.items()])
+    return book
+
+
+# --- BookRanks ---
+
+def test_rank_and_percentile():
+    book = ranks({'a': 15, 'b': 10, 'c': 10, 'd': 3})
+    assert book.rank('a') == {'score': 15, 'rank': 1, 'total': 4, 'percentile': 75.0}
+    assert book.rank('b') == {'score': 10, 'rank': 2, 'total': 4, 'percentile': 25.0}
+    assert book.rank('c')['rank'] == 2
+    assert book.rank('d') == {'score': 3, 'rank': 4, 'total': 4, 'percentile': 0.0}
+    assert book.rank('nobody') is None
+
+
+def test_rank_after_updates():
+    book = ranks({'a': 15, 'b': 10, 'c': 5})
+    assert book.record('c', 18)
+    assert book.rank('c')['rank'] == 1
+    assert book.rank('a')['rank'] == 2
+    assert not book.record('c', 12)  # Not a new best
+    assert book.rank('c')['score'] == 18
+    assert book.record('d', 0)
+    assert book.rank('d') == {'score': 0, 'rank': 4, 'total': 4, 'percentile': 0.0}
+    assert book.rank('b')['percentile'] == 25.0
+
+
+def test_score_above_max_score_grows_the_tree():
+    book = ranks({'a': 5}, max_score=10)
+    book.record('b', 40)
+    assert book.rank('b')['rank'] == 1
+    assert book.rank('a') == {'score': 5, 'rank': 2, 'total': 2, 'percentile': 0.0}
+
+
+def test_ranks_match_sorting():
+    scores = {f'u{i}': (i * 7) % 21 for i in range(50)}
+    book = ranks(scores)
+    for user_id, score in scores.items():
+        assert book.rank(user_id)['rank'] == 1 + sum(other > score for other in scores.values())
+
+
+# --- RankIndex ---
+
+class Storage:
+    def __init__(self, rows):
+        self.rows = rows
+        self.pages = 0
+        self.fail = False
+
+    def leaderboard_page(self, book_id, offset, limit):
+        if self.fail:
+            raise RuntimeError('database is unavailable')
+        self.pages += 1
+        return self.rows[offset:offset + limit]
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(rank_index, 'PAGE_SIZE', 2)
+    return Storage([{'user_id': f'u{i}', 'score': 10 - i} for i in range(5)])
+
+
+def test_book_is_loaded_in_pages_once(storage):
+    index = RankIndex()
+    assert index.rank(storage, 1, 'u4')['rank'] == 5
+    assert storage.pages == 3
+    index.rank(storage, 1, 'u0')
+    assert storage.pages == 3
+
+
+def test_recorded_scores_update_the_loaded_book(storage):
+    index = RankIndex()
+    index.rank(storage, 1, 'u0')
+    index.record(1, 'u4', 20)
+    index.record(1, 'new', 7)
+    index.record(2, 'u0', 20)  # Not loaded; nothing to update
+    assert index.rank(storage, 1, 'u4')['rank'] == 1
+    assert index.rank(storage, 1, 'new') == {'score': 7, 'rank': 5, 'total': 6, 'percentile': 0.0}
+    assert index.stats() == {'books': 1, 'players': 6}
+
+
+def test_resync_replaces_the_book(storage):
+    index = RankIndex(resync_interval=60)
+    index.rank(storage, 1, 'u0')
+    storage.rows = [{'user_id': 'u0', 'score': 1}]
+    index._books[1].loaded_at = time.monotonic() - 60
+    assert index.rank(storage, 1, 'u0')['total'] == 1
+
+
+def test_failed_resync_keeps_the_current_book(storage):
+    index = RankIndex(resync_interval=60)
+    index.rank(storage, 1, 'u0')
+    storage.fail = True
+    index._books[1].loaded_at = time.monotonic() - 60
+    assert index.rank(storage, 1, 'u0')['total'] == 5
+    with pytest.raises(RuntimeError):
+        index.rank(storage, 2, 'u0')
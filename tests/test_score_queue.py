@@ -0,0 +1,137 @@
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import score_queue as score_queue_module  # noqa: E402
+from score_queue import ScoreQueue, _lock  # noqa: E402
+
+
+class Flusher:
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, entries):
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError('database is unavailable')
+        self.batches.append(list(entries))
+
+    @property
+    def entries(self):
+        return [entry for batch in self.batches for entry in batch]
+
+
+def entry(n):
+    return {'user_id': f'u{n}', 'book_id': 1, 'score': n}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def journal(path, *records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+
+
+@pytest.fixture
+def spill(tmp_path):
+    return tmp_path / 'scores.spill'
+
+
+def test_entries_are_flushed_in_batches():
+    flush = Flusher()
+    score_queue = ScoreQueue(flush, batch_size=3, flush_interval=0.05).start()
+    for n in range(7):
+        assert score_queue.submit(entry(n))
+    score_queue.stop()
+    assert flush.entries == [entry(n) for n in range(7)]
+    assert all(len(batch) <= 3 for batch in flush.batches)
+    assert score_queue.stats()['flushed'] == 7
+
+
+def test_full_queue_rejects_entries():
+    flush = Flusher()
+    flush.release.clear()
+    score_queue = ScoreQueue(flush, maxsize=2, batch_size=1, flush_interval=0.05).start()
+    score_queue.submit(entry(0))
+    wait_for(lambda: score_queue.stats()['queued'] == 0)  # Taken by the blocked flush
+    assert score_queue.submit(entry(1))
+    assert score_queue.submit(entry(2))
+    assert not score_queue.submit(entry(3))
+    flush.release.set()
+    score_queue.stop()
+    assert flush.entries == [entry(0), entry(1), entry(2)]
+    assert score_queue.stats()['rejected'] == 1
+
+
+def test_failed_flush_is_retried():
+    flush = Flusher()
+    flush.fail = True
+    score_queue = ScoreQueue(flush, flush_interval=0.01).start()
+    score_queue.submit(entry(0))
+    wait_for(lambda: score_queue.flush_errors >= 2)
+    flush.fail = False
+    wait_for(lambda: flush.entries == [entry(0)])
+    score_queue.stop()
+
+
+# --- Spill journal ---
+
+def test_flushed_journal_is_removed_on_stop(spill):
+    score_queue = ScoreQueue(Flusher(), flush_interval=0.01, spill_path=str(spill)).start()
+    score_queue.submit(entry(0))
+    score_queue.stop()
+    assert list(spill.parent.iterdir()) == []
+
+
+def test_unflushed_entries_stay_in_the_journal(spill):
+    flush = Flusher()
+    flush.fail = True
+    score_queue = ScoreQueue(flush, flush_interval=0.01, spill_path=str(spill)).start()
+    score_queue.submit(entry(0))
+    score_queue.submit(entry(1))
+    wait_for(lambda: score_queue.flush_errors >= 1)
+    score_queue.stop()
+
+    replayed = Flusher()
+    ScoreQueue(replayed, flush_interval=0.01, spill_path=str(spill)).start().stop()
+    assert replayed.entries == [entry(0), entry(1)]
+
+
+def test_journal_of_an_exited_process_is_replayed_after_its_last_ack(spill):
+    journal(spill.with_name('scores.spill.99999'),
+            {'seq': 1, 'entry': entry(1)}, {'seq': 2, 'entry': entry(2)}, {'ack': 2},
+            {'seq': 3, 'entry': entry(3)})
+    with open(spill.with_name('scores.spill.99999'), 'a') as f:
+        f.write('{"seq": 4, "ent')  # Torn write
+    journal(spill, {'seq': 1, 'entry': entry(10)})  # From an older version
+
+    flush = Flusher()
+    score_queue = ScoreQueue(flush, flush_interval=0.01, spill_path=str(spill)).start()
+    score_queue.stop()
+    assert sorted(flush.entries, key=lambda e: e['score']) == [entry(3), entry(10)]
+    assert list(spill.parent.iterdir()) == []
+
+
+@pytest.mark.skipif(score_queue_module.fcntl is None, reason='no flock on this platform')
+def test_journal_of_a_running_process_is_left_alone(spill):
+    live = spill.with_name('scores.spill.99999')
+    journal(live, {'seq': 1, 'entry': entry(1)})
+    with open(live, 'a') as f:
+        _lock(f, blocking=True)
+        flush = Flusher()
+        ScoreQueue(flush, flush_interval=0.01, spill_path=str(spill)).start().stop()
+    assert flush.entries == []
+    assert live.exists()
@@ -0,0 +1,213 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from flask import Flask, session
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from attempt_token import AttemptLedger, AttemptTokens  # noqa: E402
+from session_store import (FileSessionStore, MemorySessionStore, ServerSessionInterface,  # noqa: E402
+                           SqliteSessionStore)
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'file'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemorySessionStore()
+    if request.param == 'sqlite':
+        return SqliteSessionStore(str(tmp_path / 'sessions.db'))
+    return FileSessionStore(str(tmp_path / 'sessions'))
+
+
+# --- Stores ---
+
+def test_save_load_delete(store):
+    sid = 'a' * 43
+    assert store.load(sid) is None
+    store.save(sid, '{"n":1}', time.time() + 60)
+    store.save(sid, '{"n":2}', time.time() + 60)
+    assert store.load(sid)[0] == '{"n":2}'
+    store.delete(sid)
+    assert store.load(sid) is None
+
+
+def test_expired_session_is_not_returned_and_is_swept(store):
+    store.save('a' * 43, '{}', time.time() - 1)
+    store.save('b' * 43, '{}', time.time() + 60)
+    assert store.sweep(time.time()) == 1
+    assert store.load('a' * 43) is None
+    assert store.load('b' * 43) is not None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    SqliteSessionStore(path).save('a' * 43, '{}', time.time() + 60)
+    assert SqliteSessionStore(path).load('a' * 43) is not None
+
+
+# --- Claims ---
+
+def test_first_claim_wins(store):
+    expires_at = time.time() + 60
+    assert store.claim('attempt.a1', 'first', expires_at) == 'first'
+    assert store.claim('attempt.a1', 'second', expires_at) == 'first'
+    assert store.load('attempt.a1') == ('first', expires_at)
+
+
+def test_expired_claim_is_taken_over(store):
+    store.claim('attempt.a1', 'first', time.time() - 1)
+    assert store.claim('attempt.a1', 'second', time.time() + 60) == 'second'
+
+
+def test_deleted_claim_can_be_claimed_again(store):
+    store.claim('attempt.a1', 'first', time.time() + 60)
+    store.delete('attempt.a1')
+    assert store.claim('attempt.a1', 'second', time.time() + 60) == 'second'
+
+
+def test_concurrent_claims_have_one_winner(store):
+    expires_at = time.time() + 60
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim(n):
+        barrier.wait()
+        results.append((n, store.claim('attempt.a1', str(n), expires_at)))
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    winner = store.load('attempt.a1')[0]
+    assert [n for n, stored in results if stored == str(n)] == [int(winner)]
+    assert {stored for _, stored in results} == {winner}
+
+
+def test_sweep_removes_expired_claims(store):
+    store.claim('attempt.a1.101', 'A', time.time() - 1)
+    store.claim('attempt.a2.101', 'B', time.time() + 60)
+    assert store.sweep(time.time()) == 1
+    assert store.load('attempt.a2.101') is not None
+
+
+# --- AttemptLedger ---
+
+@pytest.fixture
+def attempt():
+    tokens = AttemptTokens('test-secret')
+    return tokens.load(tokens.issue(1, [(101, 'A'), (102, 'B')]))
+
+
+def test_ledger_locks_the_first_answer(store, attempt):
+    ledger = AttemptLedger(store)
+    assert ledger.answer(attempt, 101, 'C') == 'C'
+    assert ledger.answer(attempt, 101, 'A') == 'C'
+    assert ledger.answer(attempt, 102, 'not a choice') is None
+    assert ledger.answers(attempt) == {101: 'C', 102: None}
+
+
+def test_ledger_submits_once(store, attempt):
+    ledger = AttemptLedger(store)
+    assert not ledger.submitted(attempt)
+    assert ledger.submit(attempt)
+    assert not ledger.submit(attempt)
+    assert ledger.submitted(attempt)
+    ledger.reopen(attempt)
+    assert ledger.submit(attempt)
+
+
+# --- Flask integration ---
+
+@pytest.fixture
+def memory_store():
+    return MemorySessionStore()
+
+
+@pytest.fixture
+def client(memory_store):
+    app = Flask(__name__)
+    app.secret_key = 'test-secret'
+    app.session_interface = ServerSessionInterface(memory_store, ttl=60)
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return ''
+
+    @app.route('/get')
+    def get_value():
+        return session.get('value', '')
+
+    @app.route('/login')
+    def login():
+        value = session.get('value')
+        session.clear()
+        session['value'] = value
+        return ''
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return ''
+
+    return app.test_client()
+
+
+def session_id(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie else None
+
+
+def test_cookie_carries_only_the_session_id(client, memory_store):
+    client.get('/set/anna')
+    sid = session_id(client)
+    assert len(sid) == 43 and 'anna' not in sid
+    assert 'anna' in memory_store.load(sid)[0]
+    assert client.get('/get').text == 'anna'
+
+
+def test_unknown_or_malformed_session_id_starts_a_new_session(client):
+    for sid in ['a' * 43, '../../etc/passwd', 'attempt.a1']:
+        client.set_cookie('session', sid)
+        assert client.get('/get').text == ''
+
+
+def test_expired_session_is_empty(client, memory_store):
+    client.get('/set/anna')
+    sid = session_id(client)
+    memory_store.save(sid, memory_store.load(sid)[0], time.time() - 1)
+    assert client.get('/get').text == ''
+
+
+def test_clearing_retires_the_session_id(client, memory_store):
+    client.get('/set/anna')
+    before = session_id(client)
+    client.get('/login')
+    after = session_id(client)
+    assert after != before
+    assert memory_store.load(before) is None
+    assert client.get('/get').text == 'anna'
+
+
+def test_logout_removes_the_session(client, memory_store):
+    client.get('/set/anna')
+    sid = session_id(client)
+    client.get('/logout')
+    assert session_id(client) is None
+    assert memory_store.load(sid) is None
+
+
+def test_unchanged_session_is_rewritten_only_past_half_its_lifetime(client, memory_store):
+    client.get('/set/anna')
+    sid = session_id(client)
+    _, expires_at = memory_store.load(sid)
+    client.get('/get')
+    assert memory_store.load(sid)[1] == expires_at
+
+    memory_store.save(sid, memory_store.load(sid)[0], time.time() + 20)
+    client.get('/get')
+    assert memory_store.load(sid)[1] > time.time() + 50
@@ -0,0 +1,225 @@
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# SupabaseStorage's write paths against a local HTTP server standing in for
+# PostgREST. Handlers are set per (method, path) and see each request.
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from clients import SupabaseClients  # noqa: E402
+from storage import SupabaseStorage  # noqa: E402
+
+MISSING_FUNCTION = (404, {'code': 'PGRST202', 'message': 'Could not find the function', 'details': None, 'hint': None})
+
+
+class PostgrestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def do_PATCH(self):
+        self._respond()
+
+    def _respond(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        request = {
+            'method': self.command,
+            'path': url.path,
+            'query': parse_qs(url.query),
+            'prefer': self.headers.get('Prefer', ''),
+            'body': json.loads(body) if body else None,
+        }
+        with self.server.lock:
+            self.server.requests.append(request)
+            handler = self.server.handlers.get((self.command, url.path))
+            status, payload = handler(request) if handler else (200, [])
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PostgrestHandler)
+    server.requests = []
+    server.handlers = {}
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def storage(server):
+    clients = SupabaseClients(f'http://127.0.0.1:{server.server_address[1]}', 'anon', service_key='service')
+    yield SupabaseStorage(clients)
+    if clients._repo is not None:
+        clients.repo.close()
+
+
+def paths(server, method=None):
+    return [r['path'] for r in server.requests if method is None or r['method'] == method]
+
+
+def entry(user_id, book_id, score, username='anna'):
+    return {'user_id': user_id, 'book_id': book_id, 'username': username, 'score': score,
+            'achieved_at': '2026-01-01T00:00:00+00:00'}
+
+
+# --- Database functions ---
+
+def test_missing_bulk_function_keeps_the_single_score_function(server, storage):
+    server.handlers[('POST', '/rest/v1/rpc/record_quiz_scores')] = lambda r: MISSING_FUNCTION
+    server.handlers[('POST', '/rest/v1/rpc/record_quiz_score')] = lambda r: (200, 7)
+
+    storage.record_scores([entry('u1', 1, 5)])
+    assert storage.record_scores_rpc_available is False
+    assert storage.record_score('u1', 'anna', 1, 7) == 7
+    assert storage.record_score_rpc_available is True
+    assert paths(server).count('/rest/v1/rpc/record_quiz_score') == 1
+
+
+def test_missing_single_score_function_keeps_the_bulk_function(server, storage):
+    server.handlers[('POST', '/rest/v1/rpc/record_quiz_score')] = lambda r: MISSING_FUNCTION
+
+    storage.record_score('u1', 'anna', 1, 7)
+    assert storage.record_score_rpc_available is False
+    server.requests.clear()
+    storage.record_scores([entry('u1', 1, 5)])
+    assert paths(server) == ['/rest/v1/rpc/record_quiz_scores']
+
+
+# --- Fallback queries (no database functions) ---
+
+# The leaderboard table, filtered like PostgREST and cut to `max_rows` per response
+class Leaderboard:
+    def __init__(self, rows, max_rows):
+        self.rows = {(row['book_id'], row['user_id']): row for row in rows}
+        self.max_rows = max_rows
+
+    def select(self, request):
+        query = request['query']
+        rows = list(self.rows.values())
+        if 'book_id' in query:
+            rows = [row for row in rows if f"eq.{row['book_id']}" == query['book_id'][0]]
+        if 'user_id' in query:
+            wanted = query['user_id'][0][len('in.('):-1].split(',')
+            rows = [row for row in rows if row['user_id'] in wanted]
+        return 200, rows[:self.max_rows]
+
+    def upsert(self, request):
+        for row in request['body']:
+            self.rows[(row['book_id'], row['user_id'])] = row
+        return 201, request['body']
+
+
+def test_fallback_never_lowers_a_stored_best(server, storage, monkeypatch):
+    monkeypatch.setattr('storage.PAIR_CHUNK', 3)
+    storage.record_scores_rpc_available = False
+    users = [f'u{i:02}' for i in range(10)]
+    leaderboard = Leaderboard([{'book_id': book_id, 'user_id': user_id, 'username': user_id, 'score': 10}
+                               for book_id in (1, 2) for user_id in users], max_rows=3)
+    server.handlers[('GET', '/rest/v1/leaderboard')] = leaderboard.select
+    server.handlers[('POST', '/rest/v1/leaderboard')] = leaderboard.upsert
+
+    storage.record_scores([entry(user_id, 1, 5, user_id) for user_id in users] + [entry('new', 1, 4, 'new')])
+
+    assert {key: row['score'] for key, row in leaderboard.rows.items() if row['score'] != 10} == {(1, 'new'): 4}
+    selects = [r['query'] for r in server.requests if r['method'] == 'GET' and r['path'] == '/rest/v1/leaderboard']
+    assert all(q['book_id'] == ['eq.1'] for q in selects)
+
+
+# user_book_stats with PostgREST's conditional update and ignore-duplicates insert.
+# `concurrent` runs after each read, standing in for another worker's write.
+class UserBookStats:
+    def __init__(self, rows=()):
+        self.rows = {(row['user_id'], row['book_id']): dict(row) for row in rows}
+        self.concurrent = []
+
+    def select(self, request):
+        query = request['query']
+        wanted = query['user_id'][0][len('in.('):-1].split(',')
+        rows = [dict(row) for row in self.rows.values()
+                if f"eq.{row['book_id']}" == query['book_id'][0] and row['user_id'] in wanted]
+        if self.concurrent:
+            self.concurrent.pop(0)(self)
+        return 200, rows
+
+    def insert(self, request):
+        assert 'resolution=ignore-duplicates' in request['prefer']
+        inserted = []
+        for row in request['body']:
+            key = (row['user_id'], row['book_id'])
+            if key not in self.rows:
+                self.rows[key] = dict(row)
+                inserted.append(row)
+        return 201, inserted
+
+    def update(self, request):
+        query = request['query']
+        key = (query['user_id'][0][len('eq.'):], int(query['book_id'][0][len('eq.'):]))
+        row = self.rows.get(key)
+        if row is None or f"eq.{row['attempts']}" != query['attempts'][0]:
+            return 200, []
+        row.update(request['body'])
+        return 200, [row]
+
+    def add_attempt(self, user_id, book_id, score):
+        row = self.rows.setdefault((user_id, book_id), {
+            'user_id': user_id, 'book_id': book_id, 'best_score': 0, 'total_score': 0, 'attempts': 0,
+            'last_played_at': '2026-01-01T00:00:00+00:00'})
+        row['best_score'] = max(row['best_score'], score)
+        row['total_score'] += score
+        row['attempts'] += 1
+
+
+@pytest.fixture
+def user_book_stats(server, storage):
+    table = UserBookStats()
+    server.handlers[('GET', '/rest/v1/user_book_stats')] = table.select
+    server.handlers[('POST', '/rest/v1/user_book_stats')] = table.insert
+    server.handlers[('PATCH', '/rest/v1/user_book_stats')] = table.update
+    storage.record_scores_rpc_available = False
+    return table
+
+
+def stats_of(table, user_id, book_id):
+    row = table.rows[(user_id, book_id)]
+    return row['best_score'], row['total_score'], row['attempts']
+
+
+def test_fallback_stats_add_to_the_stored_row(user_book_stats, storage):
+    user_book_stats.add_attempt('u1', 1, 6)
+    storage.record_scores([entry('u1', 1, 4), entry('u1', 1, 9), entry('u2', 1, 3)])
+    assert stats_of(user_book_stats, 'u1', 1) == (9, 19, 3)
+    assert stats_of(user_book_stats, 'u2', 1) == (3, 3, 1)
+
+
+def test_fallback_stats_keep_a_concurrent_update(user_book_stats, storage):
+    user_book_stats.add_attempt('u1', 1, 6)
+    user_book_stats.concurrent.append(lambda table: table.add_attempt('u1', 1, 8))
+    storage.record_scores([entry('u1', 1, 4)])
+    assert stats_of(user_book_stats, 'u1', 1) == (8, 18, 3)
+
+
+def test_fallback_stats_keep_a_concurrent_insert(user_book_stats, storage):
+    user_book_stats.concurrent.append(lambda table: table.add_attempt('u1', 1, 8))
+    storage.record_scores([entry('u1', 1, 4)])
+    assert stats_of(user_book_stats, 'u1', 1) == (8, 12, 2)
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+# Per-user, per-book rollup of quiz attempts kept in the 'user_book_stats' table
+# (see sql/user_book_stats.sql). The record_quiz_score()/record_quiz_scores()
+# database functions keep it current; when they aren't installed,
+# storage.SupabaseStorage folds each batch in with aggregate() and conditional
+# updates, and the SQLite backend does the same in SQL.
+
+PAGE_SIZE = 1000
+UPSERT_BATCH = 500
+
+
+# Fold attempts into {(user_id, book_id): stats}. `entries` are dicts with
+# user_id, book_id, score and achieved_at.
+def aggregate(entries, rollup=None):
+    rollup = {} if rollup is None else rollup
+    for entry in entries:
+        key = (entry['user_id'], entry['book_id'])
+        stats = rollup.get(key)
+        if stats is None:
+            rollup[key] = {
+                'user_id': entry['user_id'],
+                'book_id': entry['book_id'],
+                'best_score': entry['score'],
+                'total_score': entry['score'],
+                'attempts': 1,
+                'last_played_at': entry['achieved_at'],
+            }
+            continue
+        stats['best_score'] = max(stats['best_score'], entry['score'])
+        stats['total_score'] += entry['score']
+        stats['attempts'] += 1
+        if entry['achieved_at'] > stats['last_played_at']:
+            stats['last_played_at'] = entry['achieved_at']
+    return rollup
+
+
+# The user's per-book summary for /my-scores. Bounded by the number of books, not
+# by the length of the user's history.
+def summary(storage, user_id):
+    rows = storage.user_book_stats(user_id)
+    for row in rows:
+        row['average_score'] = round(row['total_score'] / row['attempts'], 1) if row['attempts'] else 0
+    return rows
+
+
+# Recompute the whole rollup from 'scores', streaming the table in keyset pages so
+# memory grows with the number of (user, book) pairs, not with the history.
+def rebuild(storage, page_size=PAGE_SIZE):
+    rollup = {}
+    last_id = None
+    scanned = 0
+    while True:
+        rows = storage.scores_page(last_id, page_size)
+        aggregate(rows, rollup)
+        scanned += len(rows)
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1]['id']
+
+    values = list(rollup.values())
+    for start in range(0, len(values), UPSERT_BATCH):
+        storage.upsert_user_book_stats(values[start:start + UPSERT_BATCH])
+    return scanned, len(values)
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    import storage
+
+    load_dotenv()
+    started = datetime.now()
+    scanned, pairs = rebuild(storage.create_storage())
+    print(f"Rebuilt user_book_stats from {scanned} scores into {pairs} rows in {datetime.now() - started}.")